@@ -0,0 +1,278 @@
+"""游戏引擎热点函数的基准测试
+
+    python benchmarks/bench_engine.py --out bench.json
+    python benchmarks/bench_engine.py --sizes 7x6,50x50 --colors 3,6 --compare bench.json
+
+覆盖 find_connected_bubbles、find_all_clearable_groups、remove_bubbles、can_create_match
+（及其模式表版本）以及完整的连锁结算（auto_clear_bubbles 的引擎版本），盘面尺寸和颜色数可参数化，
+所有盘面都由固定种子生成。--compare 会与保存的基线比较，中位数变慢超过阈值即视为回归。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from bubble_engine import (NORMAL_BUBBLES, BoardEngine, GameState, ListGridBackend, adjacent_pairs,
+                           can_create_match, find_all_clearable_groups, find_connected_bubbles, remove_bubbles)
+from bubble_grid_np import RefillStream, encode_grid, find_all_clearable_groups_np, NumpyGridBackend
+
+DEFAULT_SIZES = '7x6,20x20,50x50,200x200,500x500'
+QUICK_SIZES = '7x6,50x50'
+DEFAULT_COLORS = '3,6'
+SEED = 20240101
+
+
+# 固定种子的盘面
+def make_grid(rows, cols, colors, seed=SEED):
+    """只用前 colors 种普通泡泡生成盘面"""
+    rng = random.Random(f"{seed}:{rows}x{cols}:{colors}")
+    palette = NORMAL_BUBBLES[:colors]
+    return [[rng.choice(palette) for _ in range(cols)] for _ in range(rows)]
+
+
+def _copy(grid):
+    return [row[:] for row in grid]
+
+
+# 各项基准：返回 (每次调用前的准备函数, 被计时的函数, 每次调用包含的操作数)
+def bench_find_connected(grid):
+    rows, cols = len(grid), len(grid[0])
+    rng = random.Random(SEED)
+    starts = [(rng.randrange(rows), rng.randrange(cols)) for _ in range(100)]
+
+    def run(_):
+        for row, col in starts:
+            find_connected_bubbles(grid, row, col)
+    return None, run, len(starts)
+
+
+def bench_find_all_groups(grid):
+    return None, lambda _: find_all_clearable_groups(grid), 1
+
+
+def bench_find_all_groups_np(grid):
+    codes = encode_grid(grid)
+    return None, lambda _: find_all_clearable_groups_np(codes), 1
+
+
+def bench_remove_bubbles(grid):
+    rows, cols = len(grid), len(grid[0])
+    rng = random.Random(SEED)
+    positions = [(row, col) for row in range(rows) for col in range(cols) if rng.random() < 0.1]
+
+    def setup():
+        return _copy(grid), RefillStream(SEED)
+
+    def run(prepared):
+        board, refill = prepared
+        remove_bubbles(board, positions, refill=refill)
+    return setup, run, 1
+
+
+def bench_remove_bubbles_np(grid):
+    rows, cols = len(grid), len(grid[0])
+    rng = random.Random(SEED)
+    positions = [(row, col) for row in range(rows) for col in range(cols) if rng.random() < 0.1]
+    codes = encode_grid(grid)
+    backend = NumpyGridBackend()
+
+    def setup():
+        return codes.copy(), RefillStream(SEED)
+
+    def run(prepared):
+        board, refill = prepared
+        backend.remove(board, positions, refill)
+    return setup, run, 1
+
+
+def bench_can_create_match(grid):
+    rows, cols = len(grid), len(grid[0])
+    pairs = list(adjacent_pairs(rows, cols))
+    rng = random.Random(SEED)
+    sample = [pairs[rng.randrange(len(pairs))] for _ in range(1000)] if pairs else []
+
+    def run(_):
+        for pos1, pos2 in sample:
+            can_create_match(grid, pos1, pos2)
+    return None, run, max(len(sample), 1)
+
+
+def bench_can_match_patterns(grid):
+    """与 can_create_match 相同的交换对，走列表后端的模式表查询"""
+    backend = ListGridBackend()
+    rows, cols = len(grid), len(grid[0])
+    pairs = list(adjacent_pairs(rows, cols))
+    rng = random.Random(SEED)
+    sample = [pairs[rng.randrange(len(pairs))] for _ in range(1000)] if pairs else []
+
+    def run(_):
+        for pos1, pos2 in sample:
+            backend.can_match(grid, pos1, pos2)
+    return None, run, max(len(sample), 1)
+
+
+def _bench_cascade(grid, backend):
+    rows, cols = len(grid), len(grid[0])
+
+    def setup():
+        engine = BoardEngine(rows, cols, rng=random.Random(SEED), backend=backend, track_moves=False)
+        board = _copy(grid) if backend == 'list' else encode_grid(grid)
+        engine.state = GameState(board, rows, cols)
+        return engine
+
+    return setup, lambda engine: engine.resolve_cascades(), 1
+
+
+def bench_cascade(grid):
+    return _bench_cascade(grid, 'list')
+
+
+def bench_cascade_np(grid):
+    return _bench_cascade(grid, 'numpy')
+
+
+BENCHMARKS = {
+    'find_connected_bubbles': bench_find_connected,
+    'find_all_clearable_groups': bench_find_all_groups,
+    'find_all_clearable_groups_np': bench_find_all_groups_np,
+    'remove_bubbles': bench_remove_bubbles,
+    'remove_bubbles_np': bench_remove_bubbles_np,
+    'can_create_match': bench_can_create_match,
+    'can_match_patterns': bench_can_match_patterns,
+    'cascade': bench_cascade,
+    'cascade_np': bench_cascade_np,
+}
+
+
+# 计时
+def measure(setup, run, min_time=0.2, max_repeats=50):
+    """反复执行直到累计耗时达到 min_time（至少一次），只计 run 的时间"""
+    timings = []
+    total = 0.0
+    while len(timings) < max_repeats and (not timings or total < min_time):
+        prepared = setup() if setup else None
+        started = time.perf_counter()
+        run(prepared)
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed)
+        total += elapsed
+    return timings
+
+
+def run_suite(sizes, colors, names, min_time, max_repeats):
+    results = []
+    for rows, cols in sizes:
+        for color_count in colors:
+            grid = make_grid(rows, cols, color_count)
+            for name in names:
+                setup, run, ops = BENCHMARKS[name](grid)
+                timings = measure(setup, run, min_time, max_repeats)
+                median = statistics.median(timings)
+                results.append({
+                    'name': name,
+                    'rows': rows,
+                    'cols': cols,
+                    'colors': color_count,
+                    'repeats': len(timings),
+                    'ops': ops,
+                    'min': min(timings),
+                    'median': median,
+                    'mean': statistics.fmean(timings),
+                    'per_op': median / ops,
+                })
+                print(f"{name:30s} {rows:>4d}x{cols:<4d} colors={color_count}  "
+                      f"median {median * 1e3:10.3f} ms  per op {median / ops * 1e6:10.2f} us  (n={len(timings)})")
+    return results
+
+
+def _key(entry):
+    return entry['name'], entry['rows'], entry['cols'], entry['colors']
+
+
+# 与基线比较
+def compare(results, baseline, threshold):
+    """返回回归列表：中位数比基线慢超过 threshold（比例）"""
+    base = {_key(entry): entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        old = base.get(_key(entry))
+        if old is None or old['median'] <= 0:
+            continue
+        ratio = entry['median'] / old['median']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  <-- 回归'
+            regressions.append({'key': list(_key(entry)), 'baseline': old['median'],
+                                'current': entry['median'], 'ratio': ratio})
+        name, rows, cols, colors = _key(entry)
+        print(f"{name:30s} {rows:>4d}x{cols:<4d} colors={colors}  x{ratio:6.2f}{flag}")
+    return regressions
+
+
+def _parse_sizes(text):
+    sizes = []
+    for item in text.split(','):
+        rows, cols = item.lower().split('x')
+        sizes.append((int(rows), int(cols)))
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Love Bubble 引擎基准测试")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="逗号分隔的 行x列")
+    parser.add_argument('--quick', action='store_true', help=f"只跑小盘面（{QUICK_SIZES}）")
+    parser.add_argument('--colors', default=DEFAULT_COLORS, help="逗号分隔的颜色数")
+    parser.add_argument('--only', default=None, help="只运行这些基准（逗号分隔）")
+    parser.add_argument('--min-time', type=float, default=0.2, help="每项至少累计计时的秒数")
+    parser.add_argument('--max-repeats', type=int, default=50)
+    parser.add_argument('--out', default=None, help="结果 JSON 路径")
+    parser.add_argument('--compare', default=None, help="基线 JSON 路径")
+    parser.add_argument('--threshold', type=float, default=0.2, help="判定回归的变慢比例")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的基准: {', '.join(unknown)}")
+
+    sizes = QUICK_SIZES if args.quick else args.sizes
+    results = run_suite(_parse_sizes(sizes), [int(c) for c in args.colors.split(',')],
+                        names, args.min_time, args.max_repeats)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'seed': SEED,
+        },
+        'results': results,
+    }
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("\n与基线比较:")
+        report['regressions'] = compare(results, baseline, args.threshold)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if report.get('regressions'):
+        print(f"\n发现 {len(report['regressions'])} 项回归")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""多会话并发的点击延迟压测
+
+    python benchmarks/load_test.py --concurrency 1,4,16 --duration 20 --out load.json
+    python benchmarks/load_test.py --quick --compare load.json
+
+用 Streamlit 的 AppTest 在本进程里同时驱动多个会话（共用 cache_resource，与一个服务进程的情形相同），
+每个会话按随机的思考时间点击真实的 bubble_{i}_{j} 按钮：读按钮上的表情得到盘面，大多数时候
+选一个合法交换点两下，少数时候点相邻的随机一格。每一级并发报告重跑延迟的 p50 / p95 / p99、
+每秒重跑数、出错次数和进程 RSS 的增长。--compare 与保存的结果比较，p95 变慢超过阈值即视为回归。
+
+AppTest 每次运行都会替换进程全局的 Runtime 实例，不能真的并行，所以各会话的重跑排队执行：
+延迟 = 排队 + 运行，与 GIL 下一个服务进程里脚本线程争用 CPU 的情形相近，但不包含网络和前端渲染。
+单独报告的 service_p50_ms 是不含排队的运行时间。
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 压测只能点逐格按钮，盘面组件在 AppTest 里不可交互
+os.environ["LOVE_BUBBLE_BOARD"] = "buttons"
+
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+from bubble_engine import adjacent_pairs, can_create_match
+
+APP = os.path.join(ROOT, 'enhanced_love_bubble.py')
+DEFAULT_CONCURRENCY = '1,4,16'
+QUICK_CONCURRENCY = '1,4'
+SEED = 20240101
+
+# AppTest.run 不可重入（见模块说明）
+_RUN_LOCK = threading.Lock()
+
+
+# 进程当前的常驻内存（字节）
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # 非 Linux：只能拿到峰值
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(ordered, fraction):
+    """最近秩百分位；ordered 须已排序且非空"""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+# 一个模拟玩家
+class Session:
+    def __init__(self, index, think_ms, miss_rate, timeout):
+        self.rng = random.Random(f"{SEED}:{index}")
+        self.think_ms = think_ms
+        self.miss_rate = miss_rate
+        self.timeout = timeout
+        self.app = None
+        self.latencies = []
+        self.service = []
+        self.load_ms = None
+        self.errors = 0
+
+    def start(self):
+        self.app = AppTest.from_file(APP, default_timeout=self.timeout)
+        self.load_ms = self._run(self.app) * 1000
+
+    def board(self):
+        """按钮上的表情组成的盘面；读不到（例如正在显示彩蛋）时返回 None"""
+        cells = {}
+        for button in self.app.button:
+            key = button.key or ''
+            if key.startswith('bubble_'):
+                _, row, col = key.split('_')
+                cells[int(row), int(col)] = button.label
+        if not cells:
+            return None
+        rows = max(row for row, _ in cells) + 1
+        cols = max(col for _, col in cells) + 1
+        return [[cells.get((row, col)) for col in range(cols)] for row in range(rows)]
+
+    def choose(self, grid):
+        pairs = list(adjacent_pairs(len(grid), len(grid[0])))
+        if self.rng.random() >= self.miss_rate:
+            legal = [pair for pair in pairs if can_create_match(grid, *pair)]
+            if legal:
+                return self.rng.choice(legal)
+        return self.rng.choice(pairs)
+
+    def click(self, pos):
+        self.app.button(key=f"bubble_{pos[0]}_{pos[1]}").click()
+        self.latencies.append(self._run(self.app) * 1000)
+
+    def play(self, deadline):
+        while time.perf_counter() < deadline:
+            time.sleep(self.rng.expovariate(1000 / self.think_ms) if self.think_ms > 0 else 0)
+            try:
+                grid = self.board()
+                if grid is None:
+                    # 彩蛋等界面挡住了盘面，整页重跑一次
+                    self.latencies.append(self._run(self.app) * 1000)
+                    continue
+                first, second = self.choose(grid)
+                self.click(first)
+                self.click(second)
+            except Exception:
+                self.errors += 1
+                self.start()
+
+    def _run(self, app):
+        """排队 + 运行的秒数；不含排队的运行时间记进 service"""
+        queued = time.perf_counter()
+        with _RUN_LOCK:
+            started = time.perf_counter()
+            app.run()
+            finished = time.perf_counter()
+        self.service.append((finished - started) * 1000)
+        if app.exception:
+            self.errors += 1
+        return finished - queued
+
+
+# 一级并发
+def run_level(concurrency, duration, think_ms, miss_rate, timeout):
+    gc.collect()
+    rss_before = rss_bytes()
+    sessions = [Session(index, think_ms, miss_rate, timeout) for index in range(concurrency)]
+    threads = [threading.Thread(target=session.start) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    started = time.perf_counter()
+    deadline = started + duration
+    threads = [threading.Thread(target=session.play, args=(deadline,)) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    rss_after = rss_bytes()
+
+    latencies = sorted(ms for session in sessions for ms in session.latencies)
+    service = sorted(ms for session in sessions for ms in session.service)
+    loads = sorted(session.load_ms for session in sessions if session.load_ms is not None)
+    entry = {
+        'concurrency': concurrency,
+        'reruns': len(latencies),
+        'errors': sum(session.errors for session in sessions),
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 0.50) if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) if latencies else None,
+        'mean_ms': statistics.fmean(latencies) if latencies else None,
+        'max_ms': latencies[-1] if latencies else None,
+        'service_p50_ms': percentile(service, 0.50) if service else None,
+        'first_load_ms': statistics.median(loads) if loads else None,
+        'rss_before': rss_before,
+        'rss_after': rss_after,
+        'rss_growth': rss_after - rss_before,
+        'rss_per_session': (rss_after - rss_before) / concurrency,
+    }
+    del sessions
+    return entry
+
+
+def _ms(value):
+    return '-' if value is None else f"{value:8.1f}"
+
+
+def print_level(entry):
+    print(f"并发 {entry['concurrency']:>4d}  重跑 {entry['reruns']:>6d}  {entry['throughput']:7.1f}/s  "
+          f"p50 {_ms(entry['p50_ms'])} ms  p95 {_ms(entry['p95_ms'])} ms  p99 {_ms(entry['p99_ms'])} ms  "
+          f"运行 p50 {_ms(entry['service_p50_ms'])} ms  首次加载 {_ms(entry['first_load_ms'])} ms  RSS +{entry['rss_growth'] / 2**20:6.1f} MB"
+          f"（每会话 {entry['rss_per_session'] / 2**10:7.1f} KB）  出错 {entry['errors']}")
+
+
+# 与基线比较
+def compare(levels, baseline, threshold):
+    """返回回归列表：同一并发下 p95 比基线慢超过 threshold（比例）"""
+    base = {entry['concurrency']: entry for entry in baseline['levels']}
+    regressions = []
+    for entry in levels:
+        old = base.get(entry['concurrency'])
+        if old is None or not old.get('p95_ms') or entry['p95_ms'] is None:
+            continue
+        ratio = entry['p95_ms'] / old['p95_ms']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  <-- 回归'
+            regressions.append({'concurrency': entry['concurrency'], 'baseline': old['p95_ms'],
+                                'current': entry['p95_ms'], 'ratio': ratio})
+        print(f"并发 {entry['concurrency']:>4d}  p95 x{ratio:6.2f}  "
+              f"吞吐 x{entry['throughput'] / old['throughput'] if old['throughput'] else 0:6.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Love Bubble 多会话并发压测")
+    parser.add_argument('--concurrency', default=DEFAULT_CONCURRENCY, help="逗号分隔的并发会话数")
+    parser.add_argument('--quick', action='store_true', help=f"只跑 {QUICK_CONCURRENCY}，每级 5 秒")
+    parser.add_argument('--duration', type=float, default=20.0, help="每级并发持续的秒数")
+    parser.add_argument('--think-ms', type=float, default=800.0, help="两次操作之间的平均思考时间（指数分布）")
+    parser.add_argument('--miss-rate', type=float, default=0.1, help="随机点一对相邻格子的比例")
+    parser.add_argument('--timeout', type=float, default=60.0, help="单次重跑的超时秒数")
+    parser.add_argument('--out', default=None, help="结果 JSON 路径")
+    parser.add_argument('--compare', default=None, help="基线 JSON 路径")
+    parser.add_argument('--threshold', type=float, default=0.2, help="判定回归的 p95 变慢比例")
+    args = parser.parse_args(argv)
+
+    concurrency = QUICK_CONCURRENCY if args.quick else args.concurrency
+    duration = 5.0 if args.quick else args.duration
+    # 先加载一次，导入模块和建立共享缓存的内存不算进第一级的 RSS 增长
+    Session(-1, 0, 0, args.timeout).start()
+    levels = []
+    for count in [int(item) for item in concurrency.split(',')]:
+        entry = run_level(count, duration, args.think_ms, args.miss_rate, args.timeout)
+        print_level(entry)
+        levels.append(entry)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'streamlit': streamlit.__version__,
+            'platform': platform.platform(),
+            'duration': duration,
+            'think_ms': args.think_ms,
+            'miss_rate': args.miss_rate,
+            'seed': SEED,
+        },
+        'levels': levels,
+    }
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print("\n与基线比较:")
+        report['regressions'] = compare(levels, baseline, args.threshold)
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if report.get('regressions'):
+        print(f"\n发现 {len(report['regressions'])} 项回归")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
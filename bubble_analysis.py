@@ -0,0 +1,129 @@
+"""后台局面分析
+
+每步之后把新盘面交给共享的进程池，计算合法交换数、是否无路可走和求解器建议，
+点击的处理过程只负责提交（复制 42 字节的盘面），从不等待结果：
+
+    key = pool.submit(engine.state, engine.powers, engine.min_moves)    # 同一盘面重复提交会合并成一次计算
+    analysis = pool.result(key)                                         # 还没算完时为 None，下一次重跑再取
+
+结果按盘面键缓存（最久未用的先淘汰），多个会话走到同一盘面时共用。
+求解器是纯 Python 的 CPU 密集计算，放在线程里会和处理点击的脚本线程争抢 GIL，
+所以在子进程里运行；盘面键只是几十字节的 bytes，传给子进程的开销可以忽略。
+"""
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from bubble_compact import CompactGrid
+from bubble_engine import DEFAULT_RULES, GameState, LegalMoveIndex, get_backend
+from bubble_solver import Solver, board_cells
+
+
+# 盘面键
+def analysis_key(state, powers=False, min_moves=0):
+    """(行, 列, 等级, 每格编码, 特殊泡泡效果, 最少合法交换)；后三项都会影响求解器的计分"""
+    rows, cols, cells = board_cells(state.grid)
+    return rows, cols, state.level, bytes(cells), bool(powers), min_moves
+
+
+# 单个盘面的分析
+def analyse(key, budget_ms=150, rules=None):
+    rows, cols, level, cells, powers, min_moves = key
+    grid = CompactGrid(rows, cols, cells)
+    state = GameState(grid, rows, cols)
+    state.level = level
+
+    started = time.perf_counter()
+    moves = LegalMoveIndex(get_backend('compact'), grid, rows, cols)
+    search = Solver(rules=rules, powers=powers, min_moves=min_moves).best_move(state, budget_ms)
+    return {
+        'legal_moves': len(moves),
+        'deadlocked': len(moves) == 0,
+        'best_move': search.move,
+        'expected': search.value,
+        'depth': search.depth,
+        'nodes_per_sec': search.nodes_per_sec,
+        'hit_rate': search.hit_rate,
+        'elapsed_ms': (time.perf_counter() - started) * 1000,
+    }
+
+
+# 共享的分析进程池
+class AnalysisPool:
+    """按盘面键合并请求的后台分析；submit / result 都不阻塞
+
+    子进程用 spawn 启动：服务进程里有很多线程，fork 出的子进程可能继承被锁住的锁。
+    """
+
+    def __init__(self, workers=2, budget_ms=150, max_results=10000, rules=None):
+        self.budget_ms = budget_ms
+        self.max_results = max_results
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._lock = threading.Lock()
+        self._pending = {}                  # 键 -> Future
+        self._results = OrderedDict()       # 键 -> 分析结果，最久未用的在前
+        self.submitted = 0
+        self.coalesced = 0
+        self.cached = 0
+        self.errors = 0
+        self.compute_seconds = 0.0
+
+    def submit(self, state, powers=False, min_moves=0):
+        """为 state 的盘面排队分析（已在计算或已有结果时什么也不做），返回盘面键
+
+        powers、min_moves 取自对局的引擎，求解器按同样的规则计分。
+        """
+        key = analysis_key(state, powers, min_moves)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.cached += 1
+                return key
+            if key in self._pending:
+                self.coalesced += 1
+                return key
+            self.submitted += 1
+            future = self._executor.submit(analyse, key, self.budget_ms, self.rules)
+            self._pending[key] = future
+        # 已经完成的 Future 会在当前线程立即回调，所以在锁外登记
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return key
+
+    def result(self, key):
+        """已算完的分析结果，否则为 None"""
+        with self._lock:
+            return self._results.get(key)
+
+    def stats(self):
+        """排队 / 计算中的盘面数、累计提交、合并、命中缓存、出错的次数，以及平均计算耗时（毫秒）"""
+        with self._lock:
+            finished = self.submitted - len(self._pending) - self.errors
+            return {
+                'pending': len(self._pending),
+                'cached_results': len(self._results),
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'cached': self.cached,
+                'errors': self.errors,
+                'compute_ms': self.compute_seconds * 1000 / finished if finished > 0 else 0.0,
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finish(self, key, future):
+        with self._lock:
+            del self._pending[key]
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.errors += 1
+                return
+            analysis = future.result()
+            self.compute_seconds += analysis['elapsed_ms'] / 1000
+            self._results[key] = analysis
+            if len(self._results) > self.max_results:
+                self._results.popitem(last=False)
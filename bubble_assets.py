@@ -0,0 +1,151 @@
+"""页面的 CSS / JS / 字体：构建成带内容指纹的静态文件，每个浏览器会话只注入一次
+
+源文件在 assets/ 下，修改后重新构建：
+
+    python bubble_assets.py
+
+构建结果写进 static/（Streamlit 的静态目录，需要 server.enableStaticServing），文件名带内容指纹，
+内容变了地址也跟着变，所以反向代理可以对 /app/static/ 放心地设置
+Cache-Control: public, max-age=31536000, immutable。static/manifest.json 记录源文件名到指纹文件名的对应。
+
+assets/fonts/ 下的字体同样指纹化，CSS 里的 url('fonts/...') 会改写成指纹文件名；
+字体文件缺失时去掉对应的 url()，只保留 local() 和后备字体。
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+ASSET_DIR = os.path.join(_ROOT, 'assets')
+STATIC_DIR = os.path.join(_ROOT, 'static')
+MANIFEST_NAME = 'manifest.json'
+FONT_DIR = 'fonts'
+STYLESHEET = 'love_bubble.css'
+SCRIPT = 'love_bubble.js'
+# Streamlit 静态目录对应的地址前缀
+STATIC_URL = 'app/static/'
+
+_FONT_URL = re.compile(r"""url\(['"]?fonts/([^'")]+)['"]?\)""")
+_FONT_SOURCE = re.compile(r"""\s*,\s*url\(['"]?fonts/([^'")]+)['"]?\)(\s*format\([^)]*\))?""")
+
+
+# 带内容指纹的文件名
+def hashed_name(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+# CSS 中的字体地址改成指纹文件名
+def rewrite_fonts(css, fonts):
+    """fonts 为 {源文件名: 指纹文件名}；没有对应文件的 url() 连同 format() 一起去掉"""
+    css = _FONT_SOURCE.sub(lambda m: m.group(0) if m.group(1) in fonts else '', css)
+    return _FONT_URL.sub(lambda m: f"url('{FONT_DIR}/{fonts[m.group(1)]}')", css)
+
+
+# 构建
+def build(asset_dir=ASSET_DIR, static_dir=STATIC_DIR):
+    """把 assets/ 写成 static/ 下的指纹文件并更新清单，删除上一次构建留下的旧文件；返回清单"""
+    old = load_manifest(static_dir, check=False) or {}
+    manifest = {}
+
+    fonts = {}
+    font_dir = os.path.join(asset_dir, FONT_DIR)
+    if os.path.isdir(font_dir):
+        for name in sorted(os.listdir(font_dir)):
+            data = _read(os.path.join(font_dir, name))
+            fonts[name] = hashed_name(name, data)
+            _write(os.path.join(static_dir, FONT_DIR, fonts[name]), data)
+            manifest[f"{FONT_DIR}/{name}"] = f"{FONT_DIR}/{fonts[name]}"
+
+    for name in (STYLESHEET, SCRIPT):
+        data = _read(os.path.join(asset_dir, name))
+        if name == STYLESHEET:
+            data = rewrite_fonts(data.decode('utf-8'), fonts).encode('utf-8')
+        manifest[name] = hashed_name(name, data)
+        _write(os.path.join(static_dir, manifest[name]), data)
+
+    for path in set(old.values()) - set(manifest.values()):
+        try:
+            os.remove(os.path.join(static_dir, path))
+        except FileNotFoundError:
+            pass
+    _write(os.path.join(static_dir, MANIFEST_NAME),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8') + b'\n')
+    return manifest
+
+
+# 读取清单
+def load_manifest(static_dir=STATIC_DIR, check=True):
+    """清单缺失、损坏，或 check 时有文件不存在，返回 None"""
+    try:
+        with open(os.path.join(static_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if check and not all(os.path.isfile(os.path.join(static_dir, path)) for path in manifest.values()):
+        return None
+    return manifest
+
+
+# 一次性注入的引导脚本
+def bootstrap_html(manifest, prefix=STATIC_URL):
+    """往 document.head 加上样式表和脚本（已存在则跳过），页面里只留下这几百字节"""
+    stylesheet = json.dumps(prefix + manifest[STYLESHEET])
+    script = json.dumps(prefix + manifest[SCRIPT])
+    return f"""<script>
+(function() {{
+    var head = document.head;
+    if (!document.getElementById('love-bubble-css')) {{
+        var link = document.createElement('link');
+        link.id = 'love-bubble-css';
+        link.rel = 'stylesheet';
+        link.href = {stylesheet};
+        head.appendChild(link);
+    }}
+    if (!document.getElementById('love-bubble-js')) {{
+        var script = document.createElement('script');
+        script.id = 'love-bubble-js';
+        script.src = {script};
+        head.appendChild(script);
+    }}
+}})();
+</script>"""
+
+
+# 静态服务不可用时的内联版本（每次重跑都要发送）
+def inline_html(asset_dir=ASSET_DIR):
+    css = rewrite_fonts(_read(os.path.join(asset_dir, STYLESHEET)).decode('utf-8'), {})
+    js = _read(os.path.join(asset_dir, SCRIPT)).decode('utf-8')
+    return f"<style>\n{css}</style>\n<script>\n{js}</script>\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="构建带内容指纹的静态资源")
+    parser.add_argument('--assets', default=ASSET_DIR)
+    parser.add_argument('--out', default=STATIC_DIR)
+    args = parser.parse_args(argv)
+    manifest = build(args.assets, args.out)
+    for name, path in sorted(manifest.items()):
+        size = os.path.getsize(os.path.join(args.out, path))
+        print(f"{name:30s} -> {path}  ({size} B)")
+    if not any(name.startswith(FONT_DIR + '/') for name in manifest):
+        print(f"提示：{os.path.join(args.assets, FONT_DIR)} 下没有字体文件，Quicksand 只会使用本机已安装的版本")
+
+
+if __name__ == '__main__':
+    main()
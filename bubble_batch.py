@@ -0,0 +1,256 @@
+import random
+
+import numpy as np
+
+from bubble_engine import DEFAULT_RULES, SPECIAL_BUBBLES, SPECIAL_CHANCE_INITIAL, generate_enhanced_grid
+from bubble_grid_np import (EMPTY, FIRST_SPECIAL_CODE, RefillStream, clearable_mask, compact_columns,
+                            encode_grid)
+
+# 越界填充值，不等于任何泡泡编码
+_PAD = 255
+_PAD_WIDTH = 3
+_NEIGHBORS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+# 批量合法交换
+def legal_swaps(codes):
+    """一次算出一批盘面上所有交换是否合法
+
+    返回 (horizontal, vertical)：horizontal[n, r, c] 表示 (r, c)<->(r, c+1)，
+    vertical[n, r, c] 表示 (r, c)<->(r+1, c)。结果与 can_create_match 逐对判断一致。
+    """
+    codes = np.asarray(codes)
+    if codes.ndim == 2:
+        horizontal, vertical = legal_swaps(codes[None])
+        return horizontal[0], vertical[0]
+
+    n, rows, cols = codes.shape
+    padded = np.pad(codes, ((0, 0), (_PAD_WIDTH, _PAD_WIDTH), (_PAD_WIDTH, _PAD_WIDTH)), constant_values=_PAD)
+
+    def at(dr, dc):
+        r0, c0 = _PAD_WIDTH + dr, _PAD_WIDTH + dc
+        return padded[:, r0:r0 + rows, c0:c0 + cols]
+
+    horizontal = _forms_group(at, (0, 0), (0, 1)) | _forms_group(at, (0, 1), (0, 0))
+    vertical = _forms_group(at, (0, 0), (1, 0)) | _forms_group(at, (1, 0), (0, 0))
+    return horizontal[:, :, :-1], vertical[:, :-1, :]
+
+
+def _forms_group(at, p, q):
+    """p 换到 q 的颜色后，p 处是否有 >= 3 的同色区域（p、q 是相对参考格的偏移）
+
+    3 连从 p 出发最多延伸两步：要么 p 有两个同色邻居，要么某个同色邻居还有另一个同色邻居。
+    交换后 q 处是 p 原来的颜色，其余格子不变。
+    """
+    color = at(*q)
+    q_same = at(*p) == color
+
+    def neighbors(cell, exclude):
+        return [(cell[0] + dr, cell[1] + dc) for dr, dc in _NEIGHBORS if (cell[0] + dr, cell[1] + dc) != exclude]
+
+    def any_same(cells):
+        hit = at(*cells[0]) == color
+        for cell in cells[1:]:
+            hit = hit | (at(*cell) == color)
+        return hit
+
+    others = neighbors(p, q)
+    same = [at(*cell) == color for cell in others]
+    count = q_same.astype(np.int8)
+    for s in same:
+        count = count + s
+    result = count >= 2
+    for cell, s in zip(others, same):
+        result |= s & any_same(neighbors(cell, p))
+    result |= q_same & any_same(neighbors(q, p))
+    return result
+
+
+# 一步的批量结果
+class BatchStepResult:
+    """每个盘面一项的结果数组"""
+
+    def __init__(self, n):
+        self.valid = np.zeros(n, dtype=bool)              # 交换是否被接受
+        self.score_delta = np.zeros(n, dtype=np.int64)
+        self.cleared = np.zeros(n, dtype=np.int64)
+        self.combo_rounds = np.zeros(n, dtype=np.int64)
+        self.specials = np.zeros((n, len(SPECIAL_BUBBLES)), dtype=np.int64)
+        self.level_up = np.zeros(n, dtype=bool)
+        self.done = np.zeros(n, dtype=bool)               # 无路可走或达到步数上限
+        self.reset = np.zeros(n, dtype=bool)              # 本步结束后被重置为新局
+
+
+# 批量盘面引擎
+class BatchEngine:
+    """把 N 个独立盘面当作一个 (N, rows, cols) 数组同步推进
+
+    规则与 BoardEngine 相同；每个盘面有自己的随机流：盘面 i 的开局与补充
+    和 BoardEngine(rng=random.Random(seeds[i]), auto_reshuffle=False) 完全一致。
+    """
+
+    def __init__(self, n, rows=7, cols=6, seed=0, rules=None, max_moves=None,
+                 special_chance=SPECIAL_CHANCE_INITIAL):
+        self.n = n
+        self.rows = rows
+        self.cols = cols
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.max_moves = max_moves
+        self.special_chance = special_chance
+
+        self.seeds = [seed + i for i in range(n)] if isinstance(seed, int) else list(seed)
+        self.rngs = [random.Random(s) for s in self.seeds]
+        self.refills = [None] * n
+
+        self.codes = np.zeros((n, rows, cols), dtype=np.uint8)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.level = np.ones(n, dtype=np.int64)
+        self.combo = np.zeros(n, dtype=np.int64)
+        self.max_combo = np.zeros(n, dtype=np.int64)
+        self.moves = np.zeros(n, dtype=np.int64)
+        self.specials = np.zeros((n, len(SPECIAL_BUBBLES)), dtype=np.int64)
+        self.games = np.zeros(n, dtype=np.int64)
+
+        # 预抽取的补充编码和游标
+        self._block = 4096
+        self._buffer = np.zeros((n, self._block), dtype=np.uint8)
+        self._cursor = np.zeros(n, dtype=np.int64)
+
+        self.reset(np.ones(n, dtype=bool))
+
+    def reset(self, mask):
+        """把 mask 选中的盘面重置为新局"""
+        for i in np.flatnonzero(mask):
+            rng = self.rngs[i]
+            self.refills[i] = RefillStream(rng.getrandbits(64))
+            self.codes[i] = encode_grid(generate_enhanced_grid(self.rows, self.cols, rng, self.special_chance))
+            self._buffer[i] = self.refills[i].take(self._block)
+            self._cursor[i] = 0
+        self.score[mask] = 0
+        self.level[mask] = 1
+        self.combo[mask] = 0
+        self.max_combo[mask] = 0
+        self.moves[mask] = 0
+        self.specials[mask] = 0
+        self.games[mask] += 1
+
+    def legal_moves(self):
+        """(horizontal, vertical) 合法交换掩码"""
+        return legal_swaps(self.codes)
+
+    def has_moves(self):
+        horizontal, vertical = self.legal_moves()
+        return horizontal.any(axis=(1, 2)) | vertical.any(axis=(1, 2))
+
+    def step(self, swaps, auto_reset=True):
+        """每个盘面执行一次交换并结算连锁
+
+        swaps 是 (N, 4) 的 [r1, c1, r2, c2]；r1 < 0 的行表示该盘面本步不动。
+        auto_reset 为真时，done 的盘面在返回前被重置为新局。
+        """
+        swaps = np.asarray(swaps, dtype=np.int64)
+        result = BatchStepResult(self.n)
+        boards = np.arange(self.n)
+        r1, c1, r2, c2 = swaps.T
+
+        requested = r1 >= 0
+        inside = requested & (np.minimum(r1, r2) >= 0) & (np.maximum(r1, r2) < self.rows) \
+            & (np.minimum(c1, c2) >= 0) & (np.maximum(c1, c2) < self.cols)
+        adjacent = inside & (np.abs(r1 - r2) + np.abs(c1 - c2) == 1)
+
+        # 先交换，再用整批标记判断两端是否成组；不合法的换回来
+        b, p1, q1, p2, q2 = boards[adjacent], r1[adjacent], c1[adjacent], r2[adjacent], c2[adjacent]
+        first = self.codes[b, p1, q1].copy()
+        self.codes[b, p1, q1] = self.codes[b, p2, q2]
+        self.codes[b, p2, q2] = first
+
+        mask = clearable_mask(self.codes)
+        valid = np.zeros(self.n, dtype=bool)
+        valid[b] = mask[b, p1, q1] | mask[b, p2, q2]
+        undo = ~valid[b]
+        ub, up1, uq1, up2, uq2 = b[undo], p1[undo], q1[undo], p2[undo], q2[undo]
+        first = self.codes[ub, up1, uq1].copy()
+        self.codes[ub, up1, uq1] = self.codes[ub, up2, uq2]
+        self.codes[ub, up2, uq2] = first
+
+        result.valid = valid
+        self.moves[valid] += 1
+        self._resolve(valid, mask, result)
+
+        stuck = ~self.has_moves()
+        result.done = stuck
+        if self.max_moves is not None:
+            result.done |= self.moves >= self.max_moves
+        if auto_reset and result.done.any():
+            self.reset(result.done)
+            result.reset = result.done.copy()
+        return result
+
+    def _resolve(self, active, mask, result):
+        """对 active 的盘面同步结算连锁，直到全部稳定"""
+        round_index = 0
+        while True:
+            mask = mask & active[:, None, None]
+            cleared = mask.sum(axis=(1, 2))
+            active = cleared > 0
+            if not active.any():
+                break
+
+            score = np.where(active, self.rules.round_score(cleared, round_index, self.level), 0)
+            self.score += score
+            result.score_delta += score
+            result.cleared += cleared
+            result.combo_rounds += active
+
+            for k in range(len(SPECIAL_BUBBLES)):
+                hits = ((self.codes == FIRST_SPECIAL_CODE + k) & mask).sum(axis=(1, 2))
+                self.specials[:, k] += hits
+                result.specials[:, k] += hits
+
+            self.codes[mask] = EMPTY
+            self.codes = compact_columns(self.codes)
+            self._refill()
+
+            round_index += 1
+            mask = clearable_mask(self.codes)
+
+        self.combo += result.combo_rounds
+        self.max_combo = np.maximum(self.max_combo, self.combo)
+
+        new_level = self.rules.level_for_score(self.score)
+        result.level_up = (result.cleared > 0) & (new_level > self.level)
+        self.level = np.where(result.level_up, new_level, self.level)
+
+    def _refill(self):
+        """按逐列、自上而下的顺序，从各盘面自己的补充流取编码填空位"""
+        empty = np.swapaxes(self.codes, 1, 2) == EMPTY         # (N, cols, rows)，行优先即原盘面的列优先
+        flat = empty.reshape(self.n, -1)
+        needed = flat.sum(axis=1)
+        if not needed.any():
+            return
+
+        if needed.max() > self._block:
+            # 超大盘面一轮要补的比缓冲区还多：加宽缓冲区，每个盘面都把剩余部分补到新宽度
+            # （补充流的序列与每次取多少无关，所以结果不受影响）
+            width = int(needed.max())
+            grown = np.empty((self.n, width), dtype=np.uint8)
+            for i in range(self.n):
+                rest = self._buffer[i, self._cursor[i]:]
+                grown[i] = np.concatenate((rest, self.refills[i].take(width - rest.size)))
+            self._buffer = grown
+            self._block = width
+            self._cursor[:] = 0
+
+        short = np.flatnonzero(self._cursor + needed > self._block)
+        for i in short:
+            rest = self._buffer[i, self._cursor[i]:]
+            self._buffer[i] = np.concatenate((rest, self.refills[i].take(self._block - rest.size)))
+            self._cursor[i] = 0
+
+        rank = np.cumsum(flat, axis=1) - 1
+        board, cell = np.nonzero(flat)
+        codes = self._buffer[board, self._cursor[board] + rank[board, cell]]
+        transposed = np.swapaxes(self.codes, 1, 2).copy()
+        transposed.reshape(self.n, -1)[board, cell] = codes
+        self.codes = np.ascontiguousarray(np.swapaxes(transposed, 1, 2))
+        self._cursor += needed
@@ -0,0 +1,304 @@
+"""每种颜色一个位棋盘的网格后端（盘面不超过 64 格）
+
+第 row 行第 col 列对应第 row * cols + col 位，masks[code] 是该编码所有格子组成的整数。
+上下左右的邻居用移位和列掩码求出。MIN_GROUP_SIZE 为 3 时，"至少 3 个相连"等价于
+"存在一个有 2 个以上同色邻居的格子"，所以匹配检测、交换合法性和合法交换枚举都不需要 visited 集合。
+
+    python bubble_bitboard.py --boards 2000      # 与列表后端逐项对照并比较枚举速度
+"""
+import argparse
+import random
+import time
+
+from bubble_compact import CompactGrid, CompactGridBackend, _groups_to_positions, unpack_grid
+from bubble_engine import (SPECIAL_CHANCE_INITIAL, BoardEngine, adjacent_pairs, can_create_match,
+                           find_all_clearable_groups, find_clearable_groups_near, generate_enhanced_grid)
+from bubble_grid_np import BUBBLE_CODES, CODE_OF, EMPTY
+
+# 一个 64 位整数能放下的最多格子数
+MAX_CELLS = 64
+
+_geometries = {}
+
+
+# 盘面尺寸相关的掩码
+class _Geometry:
+    def __init__(self, rows, cols):
+        size = rows * cols
+        self.cols = cols
+        self.full = (1 << size) - 1
+        first_col = sum(1 << (row * cols) for row in range(rows))
+        self.not_first_col = self.full & ~first_col
+        self.not_last_col = self.full & ~(first_col << (cols - 1))
+        self.neighbors = [self.spread(1 << index) & ~(1 << index) for index in range(size)]
+
+    def spread(self, mask):
+        """mask 加上它上下左右的邻居"""
+        cols = self.cols
+        return (mask | mask >> cols | (mask << cols) & self.full
+                | (mask >> 1) & self.not_last_col | (mask << 1) & self.not_first_col)
+
+    def core(self, mask):
+        """mask 中至少有 2 个同在 mask 里的邻居的格子"""
+        cols = self.cols
+        up = mask & (mask << cols)
+        down = mask & (mask >> cols)
+        left = mask & (mask << 1) & self.not_first_col
+        right = mask & (mask >> 1) & self.not_last_col
+        return up & (down | left | right) | down & (left | right) | left & right
+
+    def flood(self, seeds, mask):
+        """mask 内与 seeds 连通的全部格子"""
+        spread = self.spread
+        region = seeds & mask
+        while True:
+            grown = spread(region) & mask
+            if grown == region:
+                return region
+            region = grown
+
+    def grouped(self, mask):
+        """mask 中属于 3 个以上连通区域的全部格子"""
+        core = self.core(mask)
+        return self.flood(core, mask) if core else 0
+
+    def grouped_at(self, mask, index):
+        """index（须在 mask 中）所在的连通区域是否不少于 3 格"""
+        near = self.neighbors[index] & mask
+        if not near:
+            return False
+        if near & (near - 1):
+            return True
+        # 唯一的同色邻居还有另一个同色邻居时也连成了 3 格
+        near = self.neighbors[near.bit_length() - 1] & mask
+        return near & (near - 1) != 0
+
+
+def geometry(rows, cols):
+    key = (rows, cols)
+    if key not in _geometries:
+        if rows * cols > MAX_CELLS:
+            raise ValueError(f"位棋盘最多 {MAX_CELLS} 格，而盘面是 {rows}x{cols}")
+        _geometries[key] = _Geometry(rows, cols)
+    return _geometries[key]
+
+
+def _indices(mask):
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+
+def _components(geo, mask, seeds):
+    """mask 中与 seeds 相交的各个连通区域（下标列表）"""
+    components = []
+    seeds &= mask
+    while seeds:
+        region = geo.flood(seeds & -seeds, mask)
+        components.append(_indices(region))
+        seeds &= ~region
+    return components
+
+
+# 位棋盘盘面
+class BitboardGrid(CompactGrid):
+    """CompactGrid 加上每种编码一个位掩码；两者通过 __setitem__ / refresh 保持一致"""
+
+    __slots__ = ('masks',)
+
+    def __init__(self, rows, cols, cells=None):
+        geometry(rows, cols)
+        super().__init__(rows, cols, cells)
+        self.refresh()
+
+    def __setitem__(self, pos, code):
+        index = pos[0] * self.cols + pos[1]
+        bit = 1 << index
+        masks = self.masks
+        masks[self.cells[index]] &= ~bit
+        masks[code] |= bit
+        self.cells[index] = code
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.refresh()
+
+    def refresh(self):
+        """直接改写 cells 之后重建位掩码"""
+        masks = [0] * len(BUBBLE_CODES)
+        for index, code in enumerate(self.cells):
+            masks[code] |= 1 << index
+        self.masks = masks
+
+    def copy(self):
+        return BitboardGrid(self.rows, self.cols, self.cells)
+
+
+# 表情网格 -> 位棋盘
+def pack_bitboard(grid):
+    rows = len(grid)
+    cols = len(grid[0]) if rows else 0
+    return BitboardGrid(rows, cols, [CODE_OF.get(bubble, EMPTY) for row in grid for bubble in row])
+
+
+# 合法交换枚举
+def legal_moves(grid):
+    """行优先列出所有合法交换 (pos1, pos2)，结果与逐对 can_create_match 相同
+
+    对每种颜色整盘并行地判断"从某个方向换进来这种颜色后能否连成 3 格"：换进来的格子
+    要么有 2 个同色邻居，要么唯一的同色邻居还有别的同色邻居；这些格子都不会是换走的那一格。
+    """
+    geo = geometry(grid.rows, grid.cols)
+    cols, full = geo.cols, geo.full
+    not_first_col, not_last_col = geo.not_first_col, geo.not_last_col
+    horizontal = vertical = 0    # 第 a 位表示交换 (a, a + 1) / (a, a + cols) 合法
+    for mask in grid.masks[1:]:
+        fewer = mask & (mask - 1)
+        if not fewer & (fewer - 1):
+            continue    # 少于 3 个，连不成组合
+        # 上 / 下 / 左 / 右 邻居是同色
+        up = (mask << cols) & full
+        down = mask >> cols
+        left = (mask << 1) & not_first_col
+        right = (mask >> 1) & not_last_col
+        # 该方向的同色邻居还有其他同色邻居（不算回到本格的那一个）
+        up2 = up & ((up | left | right) << cols)
+        down2 = down & ((down | left | right) >> cols)
+        left2 = left & ((up | down | left) << 1)
+        right2 = right & ((up | down | right) >> 1)
+
+        empty_side = ~mask
+        from_left = (up & (down | right) | down & right | up2 | down2 | right2) & empty_side
+        from_right = (up & (down | left) | down & left | up2 | down2 | left2) & empty_side
+        from_above = (down & (left | right) | left & right | down2 | left2 | right2) & empty_side
+        from_below = (up & (left | right) | left & right | up2 | left2 | right2) & empty_side
+        horizontal |= ((from_left >> 1) & mask | from_right & (mask >> 1)) & not_last_col
+        vertical |= (from_above >> cols) & mask | from_below & (mask >> cols)
+
+        # 同色交换不改变盘面，合法当且仅当两格本来就在一个组合里
+        core = mask & (up & (down | left | right) | down & (left | right) | left & right)
+        if core:
+            grouped = geo.flood(core, mask)
+            horizontal |= grouped & (mask >> 1) & not_last_col
+            vertical |= grouped & (mask >> cols)
+
+    moves = [(a, a + 1) for a in _indices(horizontal)] + [(a, a + cols) for a in _indices(vertical)]
+    moves.sort()
+    return [(divmod(a, cols), divmod(b, cols)) for a, b in moves]
+
+
+# 扁平下标 a、b 的交换是否合法
+def _can_match_index(grid, geo, a, b):
+    x, y = grid.cells[a], grid.cells[b]
+    swapped = 0 if x == y else (1 << a) | (1 << b)
+    return ((x != EMPTY and geo.grouped_at(grid.masks[x] ^ swapped, b))
+            or (y != EMPTY and geo.grouped_at(grid.masks[y] ^ swapped, a)))
+
+
+# 位棋盘后端
+class BitboardBackend(CompactGridBackend):
+    """以 BitboardGrid 保存盘面的网格后端，只支持不超过 64 格的盘面"""
+
+    name = 'bitboard'
+
+    def new_grid(self, rows, cols, rng, special_chance=SPECIAL_CHANCE_INITIAL):
+        return pack_bitboard(generate_enhanced_grid(rows, cols, rng, special_chance))
+
+    def from_emoji(self, grid):
+        return pack_bitboard(grid)
+
+    def find_groups(self, grid):
+        geo = geometry(grid.rows, grid.cols)
+        groups = []
+        for mask in grid.masks[1:]:
+            grouped = geo.grouped(mask)
+            if grouped:
+                groups.extend(_components(geo, grouped, grouped))
+        return _groups_to_positions(groups, grid.cols)
+
+    def find_groups_near(self, grid, cells):
+        geo = geometry(grid.rows, grid.cols)
+        cols = grid.cols
+        dirty = 0
+        for row, col in cells:
+            dirty |= 1 << (row * cols + col)
+        groups = []
+        for mask in grid.masks[1:]:
+            if mask & dirty:
+                grouped = geo.grouped(mask)
+                if grouped & dirty:
+                    groups.extend(_components(geo, grouped, dirty))
+        return _groups_to_positions(groups, cols), len(cells)
+
+    def can_match(self, grid, pos1, pos2):
+        cols = grid.cols
+        return _can_match_index(grid, geometry(grid.rows, cols), pos1[0] * cols + pos1[1], pos2[0] * cols + pos2[1])
+
+    def legal_moves(self, grid):
+        return legal_moves(grid)
+
+    def remove(self, grid, positions, refill):
+        super().remove(grid, positions, refill)
+        grid.refresh()
+
+
+# 与列表后端对照
+def cross_check(boards=1000, rows=7, cols=6, seed=0):
+    """随机盘面上逐项比较匹配检测、交换合法性和合法交换枚举，返回不一致的数量"""
+    rng = random.Random(seed)
+    backend = BitboardBackend()
+    mismatches = 0
+    for _ in range(boards):
+        grid = generate_enhanced_grid(rows, cols, rng, rng.choice((0.0, SPECIAL_CHANCE_INITIAL)))
+        board = pack_bitboard(grid)
+        expected_groups = sorted(sorted(group) for group in find_all_clearable_groups(grid))
+        expected_moves = [pair for pair in adjacent_pairs(rows, cols) if can_create_match(grid, *pair)]
+        cells = {(rng.randrange(rows), rng.randrange(cols)) for _ in range(3)}
+        expected_near, _ = find_clearable_groups_near(grid, cells)
+        if (backend.find_groups(board) != expected_groups or legal_moves(board) != expected_moves
+                or backend.find_groups_near(board, cells)[0] != expected_near
+                or unpack_grid(board) != grid):
+            mismatches += 1
+    return mismatches
+
+
+def _time_per_call(func, boards, min_time=0.5):
+    calls, started = 0, time.perf_counter()
+    while time.perf_counter() - started < min_time:
+        for board in boards:
+            func(board)
+        calls += len(boards)
+    return (time.perf_counter() - started) / calls
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="位棋盘后端与列表后端的对照和枚举速度比较")
+    parser.add_argument('--boards', type=int, default=1000)
+    parser.add_argument('--rows', type=int, default=7)
+    parser.add_argument('--cols', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    mismatches = cross_check(args.boards, args.rows, args.cols, args.seed)
+    print(f"对照 {args.boards} 个 {args.rows}x{args.cols} 盘面：{mismatches} 个不一致")
+
+    # 实际对局中的盘面：开局后结算掉现成的组合
+    grids = []
+    for seed in range(args.seed, args.seed + 100):
+        engine = BoardEngine(args.rows, args.cols, rng=random.Random(seed))
+        engine.resolve_cascades()
+        grids.append(engine.emoji_grid())
+    boards = [pack_bitboard(grid) for grid in grids]
+    pairs = list(adjacent_pairs(args.rows, args.cols))
+    list_time = _time_per_call(lambda grid: [pair for pair in pairs if can_create_match(grid, *pair)], grids)
+    bitboard_time = _time_per_call(legal_moves, boards)
+    print(f"合法交换枚举：列表 {list_time * 1e6:.1f} us，位棋盘 {bitboard_time * 1e6:.1f} us"
+          f"（{list_time / bitboard_time:.1f}x）")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+import os
+
+import streamlit.components.v1 as components
+
+# 前端是不需要构建的静态页面
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend")
+_component = components.declare_component("bubble_board", path=_FRONTEND_DIR)
+
+# 单字符编码，盘面以一个字符串发给前端
+_CODE_CHARS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+# 表情 -> 单字符编码，盘面和时间线共用一个调色板
+def _encode(palette, index, bubbles):
+    """逐个编码 bubbles，新出现的表情追加到 palette"""
+    chars = []
+    for bubble in bubbles:
+        code = index.get(bubble)
+        if code is None:
+            code = index[bubble] = len(palette)
+            palette.append(bubble)
+        chars.append(_CODE_CHARS[code])
+    return "".join(chars)
+
+
+# 一次交换的连锁时间线
+def cascade_timeline(start, pos1, pos2, result, seq):
+    """start 为交换前盘面的副本（表情网格），result 为 engine.swap(..., timeline=True) 的结果；
+    seq 区分不同的交换，同一条时间线在浏览器端只播放一次"""
+    return {
+        'seq': seq,
+        'start': start,
+        'swap': (tuple(pos1), tuple(pos2)),
+        'rounds': [([cell for group in entry['positions'] for cell in group], entry['refills'])
+                   for entry in result.rounds],
+    }
+
+
+def _encode_timeline(timeline, cols, palette, index):
+    """与盘面共用调色板：{'seq', 'start': 编码字符串, 'swap': [r1, c1, r2, c2],
+    'rounds': [[消除格子的下标...], 补充泡泡的编码字符串]}"""
+    (r1, c1), (r2, c2) = timeline['swap']
+    return {
+        'seq': timeline['seq'],
+        'start': _encode(palette, index, [bubble for row in timeline['start'] for bubble in row]),
+        'swap': [r1, c1, r2, c2],
+        'rounds': [[sorted(row * cols + col for row, col in cleared), _encode(palette, index, refills)]
+                   for cleared, refills in timeline['rounds']],
+    }
+
+
+# 整块盘面组件
+def bubble_board(grid, key=None, cell_size=55, disabled=False, on_change=None, timeline=None):
+    """把整个盘面渲染成一个组件，选中高亮在浏览器端完成
+
+    只有玩家点了两个相邻泡泡时才回传一次交换：{'a': [r, c], 'b': [r, c], 'seq': ...}。
+    seq 每次交换都不同，用来区分新交换和重跑时组件返回的旧值。
+    on_change 是交换回传时的回调，新值在 st.session_state[key] 中。
+    timeline 为 cascade_timeline 的结果时，浏览器先从交换前的盘面逐轮播放交换、消除、下落和补充，
+    再显示 grid；整段动画随这一次重跑发出，不需要额外的往返。
+    """
+    rows = len(grid)
+    cols = len(grid[0]) if rows else 0
+    palette = []
+    index = {}
+    cells = _encode(palette, index, [bubble for row in grid for bubble in row])
+    encoded = _encode_timeline(timeline, cols, palette, index) if timeline else None
+    return _component(
+        rows=rows,
+        cols=cols,
+        palette=palette,
+        cells=cells,
+        timeline=encoded,
+        cell_size=cell_size,
+        disabled=disabled,
+        key=key,
+        default=None,
+        on_change=on_change,
+    )
@@ -0,0 +1,132 @@
+"""进程内共享的预生成盘面池
+
+min_moves 大于 0 的引擎每次要新盘面时，从自己的随机流抽一个盘面种子，盘面由
+bubble_engine.solvable_board(key, 盘面种子) 唯一决定，所以可以提前在后台生成：
+
+    boards = BoardPool()
+    seed = boards.fresh_seed(key)                 # 开局：第一个盘面已经生成好的种子
+    engine = seeded_engine(seed, ..., min_moves=3, boards=boards)
+    engine.shuffle()                              # 取出预先生成好的盘面，并预约下一个
+
+key 为 (行, 列, 特殊概率, 最少合法交换)。池里没有时 take 当场生成，结果相同，只是慢一些；
+所以池只影响快慢，不影响对局和重放。
+
+生成是纯 Python 的 CPU 密集计算，和 bubble_analysis 一样放在 spawn 启动的子进程里，
+不和处理点击的脚本线程争抢 GIL；子进程只传回每格一个字节的编码，池里存的也是这段 bytes。
+"""
+import multiprocessing
+import random
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bubble_compact import CompactGrid, pack_grid, unpack_grid
+from bubble_engine import solvable_board
+from bubble_replay import first_board_seed
+
+
+# 子进程里生成一个盘面，返回每格的编码
+def board_bytes(key, board_seed):
+    return bytes(pack_grid(solvable_board(key, board_seed)).cells)
+
+
+# 盘面池
+class BoardPool:
+    """子进程按需生成盘面；take / fresh_seed 都是常数时间（未命中时退回当场生成）
+
+    子进程用 spawn 启动：服务进程里有很多线程，fork 出的子进程可能继承被锁住的锁。
+    """
+
+    def __init__(self, fresh_per_key=32, max_boards=20000, workers=1):
+        self.fresh_per_key = fresh_per_key
+        self.max_boards = max_boards
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._lock = threading.Lock()
+        self._boards = OrderedDict()        # (key, 盘面种子) -> 每格编码，最早生成的在前
+        self._fresh = {}                    # key -> 第一个盘面已在池里的开局种子
+        self._pending = {}                  # 排队或生成中的 (key, 盘面种子) -> Future
+        self._seeds = random.SystemRandom()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    def take(self, key, board_seed):
+        """取出 (key, board_seed) 对应的盘面（表情网格，归调用方所有）"""
+        with self._lock:
+            cells = self._boards.pop((key, board_seed), None)
+            if cells is None:
+                self.misses += 1
+                # 还在排队或生成中的不再等，结果回来时丢弃
+                future = self._pending.pop((key, board_seed), None)
+            else:
+                self.hits += 1
+        if cells is None:
+            if future is not None:
+                future.cancel()
+            return solvable_board(key, board_seed)
+        return unpack_grid(CompactGrid(key[0], key[1], cells))
+
+    def prefetch(self, key, board_seed):
+        """预约在后台生成 (key, board_seed) 对应的盘面"""
+        self._submit([(key, board_seed)])
+
+    def fresh_seed(self, key):
+        """一个第一个盘面已经生成好的开局种子；池里暂时没有时返回新的随机种子"""
+        items = []
+        with self._lock:
+            seeds = self._fresh.setdefault(key, deque())
+            seed = seeds.popleft() if seeds else None
+            # 补足这个 key 的开局种子
+            for _ in range(self.fresh_per_key - len(seeds)):
+                new_seed = self._seeds.getrandbits(64)
+                seeds.append(new_seed)
+                items.append((key, first_board_seed(new_seed)))
+        self._submit(items)
+        if seed is None:
+            seed = self._seeds.getrandbits(64)
+        return seed
+
+    def stats(self):
+        with self._lock:
+            taken = self.hits + self.misses
+            return {
+                'boards': len(self._boards),
+                'queued': len(self._pending),
+                'fresh_seeds': sum(len(seeds) for seeds in self._fresh.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / taken if taken else 0.0,
+                'generated': self.generated,
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, items):
+        submitted = []
+        with self._lock:
+            for item in items:
+                if item not in self._boards and item not in self._pending:
+                    try:
+                        future = self._executor.submit(board_bytes, *item)
+                    except RuntimeError:
+                        # 进程池已关闭或子进程异常退出：不再预生成，take 全部当场生成
+                        break
+                    self._pending[item] = future
+                    submitted.append((item, future))
+        # 已经完成的 Future 会在当前线程立即回调，所以在锁外登记
+        for item, future in submitted:
+            future.add_done_callback(lambda done, item=item: self._finish(item, done))
+
+    def _finish(self, item, future):
+        with self._lock:
+            if self._pending.get(item) is not future:
+                # 已经被 take 当场生成取走
+                return
+            del self._pending[item]
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._boards[item] = future.result()
+            self.generated += 1
+            if len(self._boards) > self.max_boards:
+                self._boards.popitem(last=False)
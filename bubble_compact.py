@@ -0,0 +1,212 @@
+import sys
+
+from bubble_engine import MIN_GROUP_SIZE, SPECIAL_CHANCE_INITIAL, generate_enhanced_grid, local_patterns
+from bubble_grid_np import BUBBLE_CODES, CODE_OF, EMPTY
+
+
+# 紧凑盘面
+class CompactGrid:
+    """行优先的一维 bytearray，每格一个字节的泡泡编码（0 为空位，编码同 bubble_grid_np）
+
+    7x6 的盘面只占 42 字节，而表情字符串的二维列表要几 KB；pickle 时也只是一段 bytes。
+    """
+
+    __slots__ = ('rows', 'cols', 'cells')
+
+    def __init__(self, rows, cols, cells=None):
+        self.rows = rows
+        self.cols = cols
+        self.cells = bytearray(rows * cols) if cells is None else bytearray(cells)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, pos):
+        row, col = pos
+        return self.cells[row * self.cols + col]
+
+    def __setitem__(self, pos, code):
+        row, col = pos
+        self.cells[row * self.cols + col] = code
+
+    def __eq__(self, other):
+        return (isinstance(other, CompactGrid) and self.rows == other.rows
+                and self.cols == other.cols and self.cells == other.cells)
+
+    def __getstate__(self):
+        return self.rows, self.cols, bytes(self.cells)
+
+    def __setstate__(self, state):
+        self.rows, self.cols, cells = state
+        self.cells = bytearray(cells)
+
+    def copy(self):
+        return CompactGrid(self.rows, self.cols, self.cells)
+
+
+# 表情网格 -> 紧凑盘面
+def pack_grid(grid):
+    rows = len(grid)
+    cols = len(grid[0]) if rows else 0
+    return CompactGrid(rows, cols, [CODE_OF.get(bubble, EMPTY) for row in grid for bubble in row])
+
+
+# 紧凑盘面 -> 表情网格（只在渲染时调用）
+def unpack_grid(grid):
+    lookup = BUBBLE_CODES
+    cells, cols = grid.cells, grid.cols
+    return [[lookup[code] for code in cells[start:start + cols]] for start in range(0, len(cells), cols)]
+
+
+# 同色连通区域（扁平下标）
+def _component(grid, start, limit=None):
+    """从 start 出发的洪水填充；给定 limit 时找到 limit 个格子即停止"""
+    cells, cols = grid.cells, grid.cols
+    target = cells[start]
+    if target == EMPTY:
+        return []
+    size = len(cells)
+    seen = {start}
+    stack = [start]
+    while stack:
+        index = stack.pop()
+        col = index % cols
+        for neighbor, inside in ((index - cols, index >= cols), (index + cols, index + cols < size),
+                                 (index - 1, col > 0), (index + 1, col < cols - 1)):
+            if inside and neighbor not in seen and cells[neighbor] == target:
+                seen.add(neighbor)
+                if limit is not None and len(seen) >= limit:
+                    return seen
+                stack.append(neighbor)
+    return seen
+
+
+def _groups_to_positions(groups, cols):
+    return sorted([divmod(index, cols) for index in sorted(group)] for group in groups)
+
+
+# 紧凑网格后端
+class CompactGridBackend:
+    """以 CompactGrid 保存盘面的网格后端，适合大量并发会话"""
+
+    name = 'compact'
+
+    def new_grid(self, rows, cols, rng, special_chance=SPECIAL_CHANCE_INITIAL):
+        return pack_grid(generate_enhanced_grid(rows, cols, rng, special_chance))
+
+    def shape(self, grid):
+        return grid.rows, grid.cols
+
+    def bubble_at(self, grid, row, col):
+        return BUBBLE_CODES[grid[row, col]]
+
+    def to_emoji(self, grid):
+        return unpack_grid(grid)
+
+    def from_emoji(self, grid):
+        return pack_grid(grid)
+
+    def swap(self, grid, pos1, pos2):
+        grid[pos1], grid[pos2] = grid[pos2], grid[pos1]
+
+    def find_groups(self, grid):
+        visited = set()
+        groups = []
+        for index in range(len(grid.cells)):
+            if index in visited:
+                continue
+            connected = _component(grid, index)
+            visited.update(connected)
+            if len(connected) >= MIN_GROUP_SIZE:
+                groups.append(connected)
+        return _groups_to_positions(groups, grid.cols)
+
+    def find_groups_near(self, grid, cells):
+        visited = set()
+        groups = []
+        examined = 0
+        for row, col in sorted(cells):
+            index = row * grid.cols + col
+            if index in visited:
+                continue
+            connected = _component(grid, index)
+            examined += max(len(connected), 1)
+            visited.update(connected)
+            if len(connected) >= MIN_GROUP_SIZE:
+                groups.append(connected)
+        return _groups_to_positions(groups, grid.cols), examined
+
+    def can_match(self, grid, pos1, pos2):
+        patterns = local_patterns()
+        if patterns:
+            legal = patterns.legal_cells(grid.cells, grid.rows, grid.cols, pos1, pos2)
+            if legal is not None:
+                return legal
+        self.swap(grid, pos1, pos2)
+        try:
+            cols = grid.cols
+            return (len(_component(grid, pos1[0] * cols + pos1[1], MIN_GROUP_SIZE)) >= MIN_GROUP_SIZE
+                    or len(_component(grid, pos2[0] * cols + pos2[1], MIN_GROUP_SIZE)) >= MIN_GROUP_SIZE)
+        finally:
+            self.swap(grid, pos1, pos2)
+
+    def collect(self, grid, positions):
+        counts = {}
+        for row, col in positions:
+            bubble = BUBBLE_CODES[grid[row, col]]
+            counts[bubble] = counts.get(bubble, 0) + 1
+        return counts
+
+    def remove(self, grid, positions, refill):
+        cells, rows, cols = grid.cells, grid.rows, grid.cols
+        for row, col in positions:
+            cells[row * cols + col] = EMPTY
+
+        # 逐列下落，记录每列顶部的空位数
+        empty_per_col = []
+        for col in range(cols):
+            column = cells[col::cols]
+            kept = column.replace(b'\x00', b'')
+            missing = rows - len(kept)
+            if missing:
+                cells[col::cols] = bytes(missing) + kept
+            empty_per_col.append(missing)
+
+        # 与列表后端相同的补充顺序（逐列、自上而下）
+        total = sum(empty_per_col)
+        if total:
+            codes = refill.take(total).tolist()
+            start = 0
+            for col, missing in enumerate(empty_per_col):
+                if missing:
+                    cells[col:missing * cols:cols] = bytes(codes[start:start + missing])
+                    start += missing
+
+
+# 对象的深度内存占用
+def deep_sizeof(obj, seen=None):
+    """递归累加 sys.getsizeof，支持容器、__dict__ / __slots__ 对象和 NumPy 数组"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int) and not isinstance(obj, (bytes, bytearray)):
+        return max(size, nbytes)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return size
+
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    if hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if hasattr(obj, name):
+                size += deep_sizeof(getattr(obj, name), seen)
+    return size
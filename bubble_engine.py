@@ -0,0 +1,1116 @@
+import random
+
+# 泡泡种类
+NORMAL_BUBBLES = ['🔴', '🟠', '🟡', '🟢', '🔵', '🟣']
+SPECIAL_BUBBLES = ['💖', '⭐', '🌈', '💎', '🌸']
+
+# 计分规则（与原 auto_clear_bubbles 一致）
+SCORE_PER_BUBBLE = 20
+SCORE_PER_COMBO = 15
+SCORE_PER_LEVEL = 10
+POINTS_PER_LEVEL = 500
+
+# 最少连接数
+MIN_GROUP_SIZE = 3
+
+# 特殊泡泡出现概率：开局 15%，消除后补充 10%
+SPECIAL_CHANCE_INITIAL = 0.15
+SPECIAL_CHANCE_REFILL = 0.1
+
+# generate_solvable_grid 默认保证的合法交换数
+MIN_LEGAL_MOVES = 3
+
+
+# 生成网格
+def generate_enhanced_grid(rows, cols, rng=random, special_chance=SPECIAL_CHANCE_INITIAL):
+    """生成初始网格，默认 15% 概率为特殊泡泡"""
+    grid = []
+    for i in range(rows):
+        row = []
+        for j in range(cols):
+            if rng.random() < special_chance:
+                bubble = rng.choice(SPECIAL_BUBBLES)
+            else:
+                bubble = rng.choice(NORMAL_BUBBLES)
+            row.append(bubble)
+        grid.append(row)
+    return grid
+
+
+# 无现成组合、至少有 min_moves 个合法交换的网格
+def generate_solvable_grid(rows, cols, rng=random, special_chance=SPECIAL_CHANCE_INITIAL,
+                           min_moves=MIN_LEGAL_MOVES, max_attempts=100):
+    """逐格抽取（概率与 generate_enhanced_grid 相同），抽到的泡泡会和左、上已经放好的同色区域
+    连成 MIN_GROUP_SIZE 个时改抽一种不会相连的普通泡泡，所以盘面上没有现成的组合；
+    合法交换不足 min_moves 个时整盘重抽。每次尝试都是线性时间。"""
+    pairs = list(adjacent_pairs(rows, cols))
+    for _ in range(max_attempts):
+        grid = _draw_grid_without_groups(rows, cols, rng, special_chance)
+        if min_moves <= 0:
+            return grid
+        found = 0
+        for pos1, pos2 in pairs:
+            if can_create_match(grid, pos1, pos2):
+                found += 1
+                if found >= min_moves:
+                    return grid
+    raise ValueError(f"{max_attempts} 次都没能生成至少有 {min_moves} 个合法交换的 {rows}x{cols} 盘面")
+
+
+def _draw_grid_without_groups(rows, cols, rng, special_chance):
+    # 已放好的格子按同色连通区域做并查集，size 只在根上有效
+    parent = list(range(rows * cols))
+    size = [1] * (rows * cols)
+    cells = [None] * (rows * cols)
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def joined_size(index, bubble, neighbors):
+        roots = {find(n) for n in neighbors if cells[n] == bubble}
+        return 1 + sum(size[root] for root in roots), roots
+
+    for index in range(rows * cols):
+        row, col = divmod(index, cols)
+        neighbors = ([index - 1] if col else []) + ([index - cols] if row else [])
+        if rng.random() < special_chance:
+            bubble = rng.choice(SPECIAL_BUBBLES)
+        else:
+            bubble = rng.choice(NORMAL_BUBBLES)
+        total, roots = joined_size(index, bubble, neighbors)
+        if total >= MIN_GROUP_SIZE:
+            blocked = {cells[n] for n in neighbors}
+            bubble = rng.choice([b for b in NORMAL_BUBBLES if b not in blocked])
+            total, roots = 1, ()
+        cells[index] = bubble
+        for root in roots:
+            parent[root] = index
+        size[index] = total
+    return [cells[row * cols:(row + 1) * cols] for row in range(rows)]
+
+
+# 由盘面种子决定的可解盘面
+def solvable_board(key, board_seed):
+    """key 为 (行, 列, 特殊概率, 最少合法交换)"""
+    rows, cols, special_chance, min_moves = key
+    return generate_solvable_grid(rows, cols, random.Random(board_seed), special_chance, min_moves)
+
+
+# 检查两个位置是否相邻
+def are_adjacent(pos1, pos2):
+    """检查两个位置是否相邻（上下左右）"""
+    row1, col1 = pos1
+    row2, col2 = pos2
+
+    return (abs(row1 - row2) == 1 and col1 == col2) or (abs(col1 - col2) == 1 and row1 == row2)
+
+
+# 交换两个位置的泡泡
+def swap_bubbles(grid, pos1, pos2):
+    """交换两个位置的泡泡"""
+    row1, col1 = pos1
+    row2, col2 = pos2
+
+    grid[row1][col1], grid[row2][col2] = grid[row2][col2], grid[row1][col1]
+
+
+# 查找连接泡泡
+def find_connected_bubbles(grid, start_row, start_col):
+    """查找连接的相同颜色泡泡"""
+    if not grid or start_row < 0 or start_row >= len(grid) or start_col < 0 or start_col >= len(grid[0]):
+        return []
+
+    target_bubble = grid[start_row][start_col]
+    if not target_bubble:
+        return []
+
+    rows, cols = len(grid), len(grid[0])
+    visited = set()
+    connected = []
+
+    # 显式栈的深度优先搜索，访问顺序与递归版本一致（上、下、左、右），大区域不会触发递归上限
+    stack = [(start_row, start_col)]
+    while stack:
+        row, col = stack.pop()
+        if (row, col) in visited:
+            continue
+        if row < 0 or row >= rows or col < 0 or col >= cols:
+            continue
+        if grid[row][col] != target_bubble:
+            continue
+
+        visited.add((row, col))
+        connected.append((row, col))
+
+        stack.append((row, col+1))
+        stack.append((row, col-1))
+        stack.append((row+1, col))
+        stack.append((row-1, col))
+
+    return connected
+
+
+# 查找所有可消除的连接组合
+def find_all_clearable_groups(grid):
+    """查找所有可消除的连接组合"""
+    visited_global = set()
+    clearable_groups = []
+
+    for i in range(len(grid)):
+        for j in range(len(grid[0])):
+            if (i, j) not in visited_global:
+                connected = find_connected_bubbles(grid, i, j)
+                if len(connected) >= MIN_GROUP_SIZE:
+                    clearable_groups.append(connected)
+                visited_global.update(connected)
+
+    return clearable_groups
+
+
+# 只在变动区域附近查找可消除组合
+def find_clearable_groups_near(grid, cells):
+    """从变动格子出发查找可消除组合，返回 (分组, 检查过的格子数)
+
+    前提是变动之前的盘面没有可消除组合：此时任何新组合都必然包含至少一个变动格子，
+    因此结果与整盘扫描相同（组按首格行优先排序，组内按行优先）。
+    """
+    visited = set()
+    clearable_groups = []
+    examined = 0
+
+    for row, col in sorted(cells):
+        if (row, col) in visited:
+            continue
+        connected = find_connected_bubbles(grid, row, col)
+        examined += max(len(connected), 1)
+        visited.update(connected)
+        if len(connected) >= MIN_GROUP_SIZE:
+            clearable_groups.append(sorted(connected))
+
+    clearable_groups.sort()
+    return clearable_groups, examined
+
+
+# 消除后发生变化的格子
+def cells_changed_by_removal(positions):
+    """下落与补充只会改变有消除的列中、最低消除位置及其上方的格子"""
+    lowest = {}
+    for row, col in positions:
+        if row > lowest.get(col, -1):
+            lowest[col] = row
+    return {(row, col) for col, bottom in lowest.items() for row in range(bottom + 1)}
+
+
+# 移除泡泡
+def remove_bubbles(grid, positions, rng=random, special_chance=SPECIAL_CHANCE_REFILL, refill=None):
+    """移除指定位置的泡泡并让上方泡泡下落
+
+    传入 refill（RefillStream）时，空位按逐列、自上而下的顺序一次性从补充流中取出。
+    只改写有泡泡被消除的列、且只到该列最低的被消除格子（见 cells_changed_by_removal）；
+    对表情列表来说这比整盘转成 NumPy 编码再压实要快（编解码的开销远大于压实本身）。
+    """
+    rows, cols = len(grid), len(grid[0])
+    removed = {}
+    for row, col in positions:
+        if 0 <= row < rows and 0 <= col < cols:
+            removed.setdefault(col, set()).add(row)
+
+    empty = []
+    for col in sorted(removed):
+        gone = removed[col]
+        bottom = max(gone)
+        kept = [grid[row][col] for row in range(bottom + 1) if row not in gone]
+        missing = bottom + 1 - len(kept)
+        for row, bubble in enumerate(kept, missing):
+            grid[row][col] = bubble
+        empty.extend((row, col) for row in range(missing))
+
+    if refill is not None:
+        for (row, col), bubble in zip(empty, refill.take_bubbles(len(empty))):
+            grid[row][col] = bubble
+        return
+
+    for row, col in empty:
+        if rng.random() < special_chance:
+            grid[row][col] = rng.choice(SPECIAL_BUBBLES)
+        else:
+            grid[row][col] = rng.choice(NORMAL_BUBBLES)
+
+
+# 判断某格是否属于可消除区域
+def has_group_at(grid, row, col):
+    """有界搜索：找到 3 个同色格子即返回，不做完整的洪水填充"""
+    target = grid[row][col]
+    if target is None:
+        return False
+    rows, cols = len(grid), len(grid[0])
+    seen = {(row, col)}
+    stack = [(row, col)]
+    while stack:
+        r, c = stack.pop()
+        for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+            if 0 <= nr < rows and 0 <= nc < cols and (nr, nc) not in seen and grid[nr][nc] == target:
+                seen.add((nr, nc))
+                if len(seen) >= MIN_GROUP_SIZE:
+                    return True
+                stack.append((nr, nc))
+    return False
+
+
+# 检查交换后是否能产生消除
+def can_create_match(grid, pos1, pos2):
+    """检查交换后是否能产生可消除的组合"""
+    # 临时交换
+    swap_bubbles(grid, pos1, pos2)
+
+    # 检查两个位置是否能产生消除
+    can_clear = has_group_at(grid, pos1[0], pos1[1]) or has_group_at(grid, pos2[0], pos2[1])
+
+    # 交换回来
+    swap_bubbles(grid, pos1, pos2)
+
+    return can_clear
+
+
+# 所有相邻格子对
+def adjacent_pairs(rows, cols):
+    """按行优先列出所有相邻格子对（左右、上下），每对只出现一次"""
+    for row in range(rows):
+        for col in range(cols):
+            if col + 1 < cols:
+                yield (row, col), (row, col + 1)
+            if row + 1 < rows:
+                yield (row, col), (row + 1, col)
+
+
+# 合法交换索引
+class LegalMoveIndex:
+    """维护当前盘面上所有合法交换
+
+    交换 (a, b) 是否合法只取决于 a、b 曼哈顿距离 2 以内的格子（3 连只能延伸两步），
+    所以格子变动后只需重算端点落在变动格子 2 步以内的那些交换对。
+    """
+
+    REACH = MIN_GROUP_SIZE - 1
+
+    def __init__(self, backend, grid, rows, cols):
+        self.backend = backend
+        self.rows = rows
+        self.cols = cols
+        self.moves = set()
+        self.rebuild(grid)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def __contains__(self, pair):
+        return _normalize_pair(*pair) in self.moves
+
+    def rebuild(self, grid):
+        """整盘重建；后端提供 legal_moves(grid) 时直接使用"""
+        legal_moves = getattr(self.backend, 'legal_moves', None)
+        if legal_moves is not None:
+            self.moves = set(legal_moves(grid))
+            return len(self.moves)
+        self.moves = {pair for pair in adjacent_pairs(self.rows, self.cols)
+                      if self.backend.can_match(grid, *pair)}
+        return len(self.moves)
+
+    def update(self, grid, changed_cells):
+        """只重算受变动格子影响的交换对，返回重算的数量"""
+        pairs = self._pairs_near(changed_cells)
+        for pair in pairs:
+            if self.backend.can_match(grid, *pair):
+                self.moves.add(pair)
+            else:
+                self.moves.discard(pair)
+        return len(pairs)
+
+    def hint(self):
+        """返回一个合法交换（行优先最靠前的一个），没有则返回 None"""
+        return min(self.moves) if self.moves else None
+
+    def _pairs_near(self, cells):
+        rows, cols, reach = self.rows, self.cols, self.REACH
+        endpoints = set()
+        for row, col in cells:
+            for dr in range(-reach, reach + 1):
+                span = reach - abs(dr)
+                r = row + dr
+                if 0 <= r < rows:
+                    for c in range(max(col - span, 0), min(col + span, cols - 1) + 1):
+                        endpoints.add((r, c))
+
+        pairs = set()
+        for row, col in endpoints:
+            if col + 1 < cols:
+                pairs.add(((row, col), (row, col + 1)))
+            if col > 0:
+                pairs.add(((row, col - 1), (row, col)))
+            if row + 1 < rows:
+                pairs.add(((row, col), (row + 1, col)))
+            if row > 0:
+                pairs.add(((row - 1, col), (row, col)))
+        return pairs
+
+
+# 每种泡泡所在格子的索引
+class ColorIndex:
+    """每种泡泡 -> 所在格子（行优先下标）的集合
+
+    格子变动（交换、下落、补充）后只更新变动的格子，查某种泡泡的全部位置是 O(个数)。
+    bubble_at(row, col) 读当前盘面，引擎和写时复制的视图都能用。
+    """
+
+    def __init__(self, rows, cols, bubble_at):
+        self.rows = rows
+        self.cols = cols
+        self.rebuild(bubble_at)
+
+    def rebuild(self, bubble_at):
+        """整盘重建"""
+        self.cells = [None] * (self.rows * self.cols)
+        self.positions_of = {}
+        self.update(((row, col) for row in range(self.rows) for col in range(self.cols)), bubble_at)
+
+    def update(self, changed_cells, bubble_at):
+        """重新读取变动的格子，返回读取的数量"""
+        cells, positions_of, cols = self.cells, self.positions_of, self.cols
+        count = 0
+        for row, col in changed_cells:
+            index = row * cols + col
+            bubble = bubble_at(row, col)
+            old = cells[index]
+            count += 1
+            if bubble == old:
+                continue
+            if old is not None:
+                positions_of[old].discard(index)
+            if bubble is not None:
+                positions_of.setdefault(bubble, set()).add(index)
+            cells[index] = bubble
+        return count
+
+    def count(self, bubble):
+        return len(self.positions_of.get(bubble, ()))
+
+    def positions(self, bubble):
+        """bubble 所在的全部格子，行优先"""
+        return [divmod(index, self.cols) for index in sorted(self.positions_of.get(bubble, ()))]
+
+    def overlay(self):
+        """在本索引上叠加变动的视图（配合 OverlayGrid 预测交换结果），本索引保持不变"""
+        return ColorOverlay(self)
+
+
+# 写时复制的颜色索引
+class ColorOverlay:
+    """只记录与底层 ColorIndex 不同的格子；查询代价为 O(该颜色的个数 + 变动的格子数)"""
+
+    __slots__ = ('base', 'cols', 'changes', 'delta')
+
+    def __init__(self, base):
+        self.base = base
+        self.cols = base.cols
+        self.changes = {}       # 下标 -> 泡泡（与底层不同的格子）
+        self.delta = {}         # 泡泡 -> 个数的变化
+
+    def update(self, changed_cells, bubble_at):
+        """重新读取变动的格子，返回读取的数量"""
+        cells, changes, delta, cols = self.base.cells, self.changes, self.delta, self.cols
+        count = 0
+        for row, col in changed_cells:
+            index = row * cols + col
+            bubble = bubble_at(row, col)
+            old = changes.get(index, cells[index])
+            count += 1
+            if bubble == old:
+                continue
+            if old is not None:
+                delta[old] = delta.get(old, 0) - 1
+            if bubble is not None:
+                delta[bubble] = delta.get(bubble, 0) + 1
+            if bubble == cells[index]:
+                del changes[index]
+            else:
+                changes[index] = bubble
+        return count
+
+    def count(self, bubble):
+        return self.base.count(bubble) + self.delta.get(bubble, 0)
+
+    def positions(self, bubble):
+        """bubble 所在的全部格子，行优先"""
+        changes = self.changes
+        indices = {index for index in self.base.positions_of.get(bubble, ()) if index not in changes}
+        indices.update(index for index, changed in changes.items() if changed == bubble)
+        return [divmod(index, self.cols) for index in sorted(indices)]
+
+
+# 特殊泡泡的效果
+RAINBOW = '🌈'
+DIAMOND = '💎'
+STAR = '⭐'
+
+
+def power_cells(bubble, group, rows, cols, colors):
+    """被消除的一组 bubble 额外清除的格子（可能与组重叠）；其他泡泡返回空列表
+
+    🌈 清除盘面上最多的一种普通泡泡（同样多时取 NORMAL_BUBBLES 中靠前的），
+    💎 横排的组清除所在行、其余清除组中心所在列，⭐ 清除以组中心为中心的 3×3。
+    组中心是按行优先排序后居中的格子，与组内格子的顺序（各后端、整盘 / 增量扫描不同）无关。
+    colors 是当前盘面的 ColorIndex，代价与清除的格子数成正比。
+    """
+    if bubble == RAINBOW:
+        color = max(NORMAL_BUBBLES, key=colors.count)
+        return colors.positions(color)
+    center_row, center_col = sorted(group)[len(group) // 2]
+    if bubble == DIAMOND:
+        if all(row == center_row for row, _ in group):
+            return [(center_row, col) for col in range(cols)]
+        return [(row, center_col) for row in range(rows)]
+    if bubble == STAR:
+        return [(row, col)
+                for row in range(max(center_row - 1, 0), min(center_row + 2, rows))
+                for col in range(max(center_col - 1, 0), min(center_col + 2, cols))]
+    return []
+
+
+def expand_with_powers(groups, bubble_at, rows, cols, colors):
+    """各组里特殊泡泡的效果：返回 (组以外额外清除的格子, 触发的特殊泡泡)
+
+    效果按本轮消除前的盘面计算；被效果波及的特殊泡泡只计入收集，不再连锁触发。
+    """
+    cleared = {cell for group in groups for cell in group}
+    extra = []
+    triggered = []
+    # 组内和组间都按行优先，触发顺序和额外格子的顺序与扫描方式无关
+    for group in sorted(sorted(group) for group in groups):
+        bubble = bubble_at(*group[0])
+        cells = power_cells(bubble, group, rows, cols, colors)
+        if not cells:
+            continue
+        triggered.append(bubble)
+        for cell in cells:
+            if cell not in cleared:
+                cleared.add(cell)
+                extra.append(cell)
+    return extra, triggered
+
+
+def _normalize_pair(pos1, pos2):
+    return (pos1, pos2) if pos1 <= pos2 else (pos2, pos1)
+
+
+# 计算一轮消除的得分
+def round_score(cleared_count, combo_index, level):
+    """按原 auto_clear_bubbles 公式计算单轮得分"""
+    return cleared_count * SCORE_PER_BUBBLE + combo_index * SCORE_PER_COMBO + level * SCORE_PER_LEVEL
+
+
+# 根据分数计算等级
+def level_for_score(score):
+    """每 500 分升一级"""
+    return score // POINTS_PER_LEVEL + 1
+
+
+# 计分规则
+class ScoreRules:
+    """可调整的计分常数，默认值与游戏一致"""
+
+    def __init__(self, per_bubble=SCORE_PER_BUBBLE, per_combo=SCORE_PER_COMBO,
+                 per_level=SCORE_PER_LEVEL, points_per_level=POINTS_PER_LEVEL):
+        self.per_bubble = per_bubble
+        self.per_combo = per_combo
+        self.per_level = per_level
+        self.points_per_level = points_per_level
+
+    def round_score(self, cleared_count, combo_index, level):
+        return cleared_count * self.per_bubble + combo_index * self.per_combo + level * self.per_level
+
+    def level_for_score(self, score):
+        return score // self.points_per_level + 1
+
+    def to_dict(self):
+        return {
+            'per_bubble': self.per_bubble,
+            'per_combo': self.per_combo,
+            'per_level': self.per_level,
+            'points_per_level': self.points_per_level,
+        }
+
+
+DEFAULT_RULES = ScoreRules()
+
+
+_patterns = None
+
+
+# 交换合法性的局部模式表（bubble_patterns），不可用时为 False
+def local_patterns():
+    global _patterns
+    if _patterns is None:
+        from bubble_patterns import pattern_table
+        _patterns = pattern_table() or False
+    return _patterns
+
+
+# 列表网格后端
+class ListGridBackend:
+    """以表情字符串的二维列表保存盘面（默认后端）"""
+
+    name = 'list'
+
+    def new_grid(self, rows, cols, rng, special_chance=SPECIAL_CHANCE_INITIAL):
+        return generate_enhanced_grid(rows, cols, rng, special_chance)
+
+    def shape(self, grid):
+        return len(grid), len(grid[0]) if grid else 0
+
+    def bubble_at(self, grid, row, col):
+        return grid[row][col]
+
+    def to_emoji(self, grid):
+        return grid
+
+    def from_emoji(self, grid):
+        return grid
+
+    def swap(self, grid, pos1, pos2):
+        swap_bubbles(grid, pos1, pos2)
+
+    def find_groups(self, grid):
+        return find_all_clearable_groups(grid)
+
+    def find_groups_near(self, grid, cells):
+        return find_clearable_groups_near(grid, cells)
+
+    def can_match(self, grid, pos1, pos2):
+        patterns = local_patterns()
+        legal = patterns.legal(grid, pos1, pos2) if patterns else None
+        return can_create_match(grid, pos1, pos2) if legal is None else legal
+
+    def collect(self, grid, positions):
+        counts = {}
+        for row, col in positions:
+            bubble = grid[row][col]
+            counts[bubble] = counts.get(bubble, 0) + 1
+        return counts
+
+    def remove(self, grid, positions, refill):
+        remove_bubbles(grid, positions, refill=refill)
+
+
+# 按名称取得网格后端
+def get_backend(backend=None):
+    """None / 'list' 为默认列表后端，'numpy' 为编码数组后端，'compact' 为每格一字节的紧凑后端，
+    'bitboard' 为每种颜色一个位掩码的后端（不超过 64 格），也可直接传入后端实例"""
+    if backend is None or backend == 'list':
+        return ListGridBackend()
+    if backend == 'numpy':
+        from bubble_grid_np import NumpyGridBackend
+        return NumpyGridBackend()
+    if backend == 'compact':
+        from bubble_compact import CompactGridBackend
+        return CompactGridBackend()
+    if backend == 'bitboard':
+        from bubble_bitboard import BitboardBackend
+        return BitboardBackend()
+    if isinstance(backend, str):
+        raise ValueError(f"未知的网格后端: {backend}")
+    return backend
+
+
+# 写时复制的盘面视图
+class OverlayGrid:
+    """在只读的表情网格上叠加修改，底层网格始终不变（用于预测交换结果）
+
+    base 是 backend.to_emoji 的结果，多个视图可以共用同一个 base。
+    """
+
+    __slots__ = ('base', 'rows', 'cols', 'changes')
+
+    def __init__(self, base, rows, cols):
+        self.base = base
+        self.rows = rows
+        self.cols = cols
+        self.changes = {}
+
+    def get(self, row, col):
+        bubble = self.changes.get((row, col), self)
+        if bubble is self:
+            return self.base[row][col]
+        return bubble
+
+    def set(self, row, col, bubble):
+        self.changes[(row, col)] = bubble
+
+    def swap(self, pos1, pos2):
+        first = self.get(*pos1)
+        self.set(*pos1, self.get(*pos2))
+        self.set(*pos2, first)
+
+    def component(self, row, col, limit=None):
+        """同色 4 连通区域；给定 limit 时找到 limit 个格子即停止"""
+        target = self.get(row, col)
+        if target is None:
+            return []
+        rows, cols = self.rows, self.cols
+        base, changes = self.base, self.changes
+        seen = {(row, col)}
+        stack = [(row, col)]
+        while stack:
+            r, c = stack.pop()
+            for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if 0 <= nr < rows and 0 <= nc < cols and (nr, nc) not in seen:
+                    bubble = changes.get((nr, nc), self)
+                    if bubble is self:
+                        bubble = base[nr][nc]
+                    if bubble == target:
+                        seen.add((nr, nc))
+                        if limit is not None and len(seen) >= limit:
+                            return seen
+                        stack.append((nr, nc))
+        return seen
+
+    def groups_near(self, cells):
+        """从 cells 出发的可消除分组（组按首格行优先排序，组内按行优先），以及检查过的格子数"""
+        visited = set()
+        groups = []
+        examined = 0
+        for row, col in sorted(cells):
+            if (row, col) in visited:
+                continue
+            connected = self.component(row, col)
+            examined += max(len(connected), 1)
+            visited.update(connected)
+            if len(connected) >= MIN_GROUP_SIZE:
+                groups.append(sorted(connected))
+        groups.sort()
+        return groups, examined
+
+    def remove(self, positions, refill_bubbles):
+        """消除、下落，并从 refill_bubbles 依次取出补充泡泡；返回变动的格子"""
+        removed = {}
+        for row, col in positions:
+            removed.setdefault(col, set()).add(row)
+        for col in sorted(removed):
+            gone = removed[col]
+            bottom = max(gone)
+            kept = [self.get(row, col) for row in range(bottom + 1) if row not in gone]
+            missing = bottom + 1 - len(kept)
+            column = [next(refill_bubbles) for _ in range(missing)] + kept
+            for row, bubble in enumerate(column):
+                self.set(row, col, bubble)
+        return cells_changed_by_removal(positions)
+
+
+# 游戏状态（不依赖 Streamlit）
+class GameState:
+    """一局游戏的全部规则相关状态"""
+
+    __slots__ = ('grid', 'rows', 'cols', 'score', 'level', 'combo', 'max_combo', 'moves',
+                 'special_bubbles_collected')
+
+    def __init__(self, grid, rows=None, cols=None):
+        self.grid = grid
+        self.rows = rows if rows is not None else len(grid)
+        self.cols = cols if cols is not None else (len(grid[0]) if len(grid) else 0)
+        self.score = 0
+        self.level = 1
+        self.combo = 0
+        self.max_combo = 0
+        self.moves = 0
+        self.special_bubbles_collected = {bubble: 0 for bubble in SPECIAL_BUBBLES}
+
+
+# 单步结果
+class CascadeResult:
+    """一次交换（或一次自动消除）产生的完整结果"""
+
+    def __init__(self, status):
+        self.status = status          # 'success' / 'invalid_match' / 'not_adjacent'
+        self.cleared = 0              # 总消除数量
+        self.combo_rounds = 0         # 连击轮数
+        self.score_gained = 0         # 本次得分
+        self.rounds = []              # 每轮: {'groups', 'cleared', 'score', 'examined'}，计时时另有 'seconds'
+        self.examined = 0             # 本次连锁中实际检查过的格子总数
+        self.specials = {}            # 本次收集的特殊泡泡
+        self.level_up = False
+        self.level = None
+        self.reshuffled = False       # 结算后无路可走，已自动重新排列
+        self.powers = []              # 触发了效果的特殊泡泡（每组一次）
+
+    @property
+    def ok(self):
+        return self.status == 'success'
+
+    def to_dict(self):
+        return {
+            'status': self.status,
+            'cleared': self.cleared,
+            'combo_rounds': self.combo_rounds,
+            'score_gained': self.score_gained,
+            'rounds': self.rounds,
+            'examined': self.examined,
+            'specials': dict(self.specials),
+            'level_up': self.level_up,
+            'level': self.level,
+            'reshuffled': self.reshuffled,
+            'powers': list(self.powers),
+        }
+
+
+# 连锁每轮的计时函数（bubble_metrics.profile_rounds 设置）；为 None 时不计时
+round_clock = None
+
+
+# 纯 Python 游戏引擎
+class BoardEngine:
+    """交换、连锁消除、计分的显式单步接口"""
+
+    # 自动重新排列的最多尝试次数
+    MAX_RESHUFFLES = 100
+
+    def __init__(self, rows=7, cols=6, state=None, rng=None, backend=None, incremental=True,
+                 refill=None, special_chance=SPECIAL_CHANCE_INITIAL, track_moves=True, auto_reshuffle=True,
+                 rules=None, log=None, min_moves=0, boards=None, powers=False):
+        self.rng = rng if rng is not None else random.Random()
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.backend = get_backend(backend)
+        self.incremental = incremental
+        self.special_chance = special_chance
+        # 大于 0 时新盘面（开局、重新排列）没有现成组合且至少有这么多合法交换，见 _new_grid
+        self.min_moves = min_moves
+        # 可选的盘面池（bubble_boards.BoardPool），只影响取盘面的快慢，不影响结果
+        self.boards = boards
+        # 特殊泡泡的效果（🌈 ⭐ 💎），见 power_cells
+        self.powers = powers
+        if refill is None:
+            from bubble_grid_np import RefillStream
+            refill = RefillStream(self.rng.getrandbits(64))
+        self.refill = refill
+        if state is None:
+            state = GameState(self._new_grid(rows, cols), rows, cols)
+        self.state = state
+        # 自上次稳定以来变动过的格子；None 表示盘面来源未知，需要整盘扫描
+        self._dirty = None
+        # 本次交换（含连锁）中变动过的全部格子，用于增量更新合法交换索引
+        self._changed = set()
+        # 开启效果时维护每种泡泡的位置，🌈 据此直接取出一种颜色的全部格子
+        self.colors = ColorIndex(state.rows, state.cols, self.bubble_at) if powers else None
+        self.auto_reshuffle = auto_reshuffle
+        # 对局记录（bubble_replay.MoveLog），记下每次成功的交换和手动重新排列
+        self.log = log
+        self.legal_moves = None
+        if track_moves:
+            self.legal_moves = LegalMoveIndex(self.backend, state.grid, state.rows, state.cols)
+            if auto_reshuffle:
+                self._reshuffle_if_stuck()
+
+    def __getstate__(self):
+        # 盘面池是进程内共享的，不随引擎序列化
+        state = self.__dict__.copy()
+        state['boards'] = None
+        return state
+
+    @property
+    def grid(self):
+        return self.state.grid
+
+    def bubble_at(self, row, col):
+        return self.backend.bubble_at(self.state.grid, row, col)
+
+    def emoji_grid(self):
+        """供界面渲染的表情网格"""
+        return self.backend.to_emoji(self.state.grid)
+
+    def can_swap(self, pos1, pos2):
+        """相邻且交换后能产生消除"""
+        if not are_adjacent(pos1, pos2):
+            return False
+        if self.legal_moves is not None:
+            return (pos1, pos2) in self.legal_moves
+        return self.backend.can_match(self.state.grid, pos1, pos2)
+
+    def has_moves(self):
+        """当前盘面是否还有合法交换"""
+        if self.legal_moves is not None:
+            return len(self.legal_moves) > 0
+        return self.hint() is not None
+
+    def hint(self):
+        """返回一个合法交换 (pos1, pos2)，没有则返回 None"""
+        if self.legal_moves is not None:
+            return self.legal_moves.hint()
+        for pair in adjacent_pairs(self.state.rows, self.state.cols):
+            if self.backend.can_match(self.state.grid, *pair):
+                return pair
+        return None
+
+    def swap(self, pos1, pos2, timeline=False):
+        """执行一次交换并结算全部连锁；timeline 见 resolve_cascades"""
+        if not are_adjacent(pos1, pos2):
+            return CascadeResult('not_adjacent')
+        if not self.can_swap(pos1, pos2):
+            return CascadeResult('invalid_match')
+
+        self.backend.swap(self.state.grid, pos1, pos2)
+        self.state.moves += 1
+        self._mark_dirty((pos1, pos2))
+        if self.colors is not None:
+            self.colors.update((pos1, pos2), self.bubble_at)
+
+        result = self.resolve_cascades(timeline)
+        result.status = 'success'
+        if self.log is not None:
+            self.log.record_swap(self, pos1, pos2)
+        return result
+
+    def preview(self, pos1, pos2, base=None):
+        """预测一次交换的完整结果而不改动引擎（盘面、随机流、补充流都不变）
+
+        在写时复制的视图上交换并结算全部连锁，补充泡泡用 refill.peek 得到，因此结果与
+        随后真正执行 swap 完全一致。rounds 中每轮另有 'positions'（各组的格子，特殊泡泡的
+        效果额外清除的格子作为最后一组）和 'specials'。不预测结算后的自动重新排列（reshuffled 总为 False）。
+        base 可传入预先解码的 emoji_grid()，批量预测时避免重复解码。
+        """
+        if not are_adjacent(pos1, pos2):
+            return CascadeResult('not_adjacent')
+
+        state = self.state
+        view = OverlayGrid(self.emoji_grid() if base is None else base, state.rows, state.cols)
+        view.swap(pos1, pos2)
+        if (len(view.component(*pos1, limit=MIN_GROUP_SIZE)) < MIN_GROUP_SIZE
+                and len(view.component(*pos2, limit=MIN_GROUP_SIZE)) < MIN_GROUP_SIZE):
+            return CascadeResult('invalid_match')
+
+        result = CascadeResult('success')
+        refill_bubbles = self._peek_refills()
+        if self.incremental and self._dirty is not None:
+            dirty = self._dirty | {pos1, pos2}
+        else:
+            dirty = {(row, col) for row in range(state.rows) for col in range(state.cols)}
+
+        # 开启效果时在引擎的颜色索引上叠加视图，只跟踪交换和每轮变动的格子
+        colors = None
+        if self.colors is not None:
+            colors = self.colors.overlay()
+            colors.update((pos1, pos2), view.get)
+
+        combo_count = 0
+        while True:
+            groups, examined = view.groups_near(dirty)
+            result.examined += examined
+            if not groups:
+                break
+
+            positions = [cell for group in groups for cell in group]
+            if colors is not None:
+                extra, triggered = expand_with_powers(groups, view.get, state.rows, state.cols, colors)
+                positions.extend(extra)
+                result.powers.extend(triggered)
+                if extra:
+                    groups = groups + [extra]
+            cleared_count = len(positions)
+            score = self.rules.round_score(cleared_count, combo_count, state.level)
+            specials = {}
+            for row, col in positions:
+                bubble = view.get(row, col)
+                if bubble in state.special_bubbles_collected:
+                    specials[bubble] = specials.get(bubble, 0) + 1
+                    result.specials[bubble] = result.specials.get(bubble, 0) + 1
+
+            result.score_gained += score
+            result.cleared += cleared_count
+            result.rounds.append({
+                'groups': len(groups),
+                'cleared': cleared_count,
+                'score': score,
+                'examined': examined,
+                'positions': groups,
+                'specials': specials,
+            })
+            combo_count += 1
+            dirty = view.remove(positions, refill_bubbles)
+            if colors is not None:
+                colors.update(dirty, view.get)
+
+        result.combo_rounds = combo_count
+        new_level = self.rules.level_for_score(state.score + result.score_gained)
+        result.level_up = result.cleared > 0 and new_level > state.level
+        result.level = new_level if result.level_up else state.level
+        return result
+
+    def preview_all(self):
+        """预测每个合法交换的结果：{(pos1, pos2): CascadeResult}"""
+        if self.legal_moves is not None:
+            pairs = sorted(self.legal_moves.moves)
+        else:
+            pairs = [pair for pair in adjacent_pairs(self.state.rows, self.state.cols)
+                     if self.backend.can_match(self.state.grid, *pair)]
+        base = self.emoji_grid()
+        return {pair: self.preview(*pair, base=base) for pair in pairs}
+
+    def _peek_refills(self):
+        """按取用顺序逐个给出之后的补充泡泡，不消耗补充流"""
+        from bubble_grid_np import BUBBLE_CODES
+
+        offset = 0
+        chunk = self.state.rows * self.state.cols
+        while True:
+            for code in self.refill.peek(chunk, offset).tolist():
+                yield BUBBLE_CODES[code]
+            offset += chunk
+
+    def resolve_cascades(self, timeline=False):
+        """自动消除所有可消除的泡泡组合，直到盘面稳定
+
+        timeline 为真时 rounds 中每轮另有 'positions'（各组的格子）和 'refills'（补充的泡泡，
+        逐列自上而下：每列顶部、该列消除了几个就补几个），界面据此在浏览器端逐轮播放。
+        开启特殊泡泡效果时，效果额外清除的格子与组一起消除、计分，并作为 'positions' 的最后一组。
+        """
+        state = self.state
+        result = CascadeResult('success')
+        combo_count = 0
+        clock = round_clock
+
+        while True:
+            if clock is not None:
+                round_started = clock()
+            clearable_groups, examined = self._scan()
+            result.examined += examined
+
+            if not clearable_groups:
+                break
+
+            all_positions = []
+            for group in clearable_groups:
+                all_positions.extend(group)
+            if self.colors is not None:
+                extra, triggered = expand_with_powers(clearable_groups, self.bubble_at,
+                                                      state.rows, state.cols, self.colors)
+                all_positions.extend(extra)
+                result.powers.extend(triggered)
+                if extra:
+                    clearable_groups = clearable_groups + [extra]
+
+            cleared_count = len(all_positions)
+            score = self.rules.round_score(cleared_count, combo_count, state.level)
+
+            state.score += score
+            result.score_gained += score
+            result.cleared += cleared_count
+            result.rounds.append({
+                'groups': len(clearable_groups),
+                'cleared': cleared_count,
+                'score': score,
+                'examined': examined,
+            })
+            if timeline:
+                result.rounds[-1]['positions'] = clearable_groups
+            combo_count += 1
+
+            # 统计特殊泡泡
+            for bubble_type, count in self.backend.collect(state.grid, all_positions).items():
+                if bubble_type in state.special_bubbles_collected:
+                    state.special_bubbles_collected[bubble_type] += count
+                    result.specials[bubble_type] = result.specials.get(bubble_type, 0) + count
+
+            self.backend.remove(state.grid, all_positions, self.refill)
+            if timeline:
+                removed = {}
+                for _, col in all_positions:
+                    removed[col] = removed.get(col, 0) + 1
+                result.rounds[-1]['refills'] = [self.backend.bubble_at(state.grid, row, col)
+                                                for col in sorted(removed) for row in range(removed[col])]
+            self._dirty = cells_changed_by_removal(all_positions)
+            self._changed.update(self._dirty)
+            if self.colors is not None:
+                # 下落和补充只改动被消除格子以上的部分
+                self.colors.update(self._dirty, self.bubble_at)
+            if clock is not None:
+                result.rounds[-1]['seconds'] = clock() - round_started
+
+        # 盘面已稳定
+        self._dirty = set()
+
+        # 增量更新合法交换索引，无路可走时自动重新排列
+        if self.legal_moves is not None:
+            self.legal_moves.update(state.grid, self._changed)
+            if self.auto_reshuffle:
+                result.reshuffled = self._reshuffle_if_stuck()
+        self._changed = set()
+
+        # 更新连击
+        state.combo += combo_count
+        if state.combo > state.max_combo:
+            state.max_combo = state.combo
+        result.combo_rounds = combo_count
+
+        # 升级检查
+        if result.cleared > 0:
+            new_level = self.rules.level_for_score(state.score)
+            if new_level > state.level:
+                state.level = new_level
+                result.level_up = True
+        result.level = state.level
+
+        return result
+
+    def shuffle(self):
+        """重新生成同尺寸的盘面"""
+        self.state.grid = self._new_grid(self.state.rows, self.state.cols)
+        self._dirty = None
+        if self.legal_moves is not None:
+            self.legal_moves.rebuild(self.state.grid)
+            if self.auto_reshuffle:
+                self._reshuffle_if_stuck()
+        if self.colors is not None:
+            self.colors.rebuild(self.bubble_at)
+        if self.log is not None:
+            self.log.record_shuffle(self)
+
+    def _reshuffle_if_stuck(self):
+        """没有合法交换时重新排列，返回是否排列过"""
+        reshuffled = False
+        for _ in range(self.MAX_RESHUFFLES):
+            if len(self.legal_moves):
+                break
+            self.state.grid = self._new_grid(self.state.rows, self.state.cols)
+            self._dirty = None
+            self.legal_moves.rebuild(self.state.grid)
+            reshuffled = True
+        if reshuffled and self.colors is not None:
+            self.colors.rebuild(self.bubble_at)
+        return reshuffled
+
+    def _new_grid(self, rows, cols):
+        """min_moves 为 0 时沿用 generate_enhanced_grid；否则从引擎随机流抽一个盘面种子，
+        盘面由 solvable_board 决定（有盘面池时直接取预先生成好的），重放时结果相同"""
+        if not self.min_moves:
+            return self.backend.new_grid(rows, cols, self.rng, self.special_chance)
+        key = (rows, cols, self.special_chance, self.min_moves)
+        board_seed = self.rng.getrandbits(64)
+        if self.boards is None:
+            return self.backend.from_emoji(solvable_board(key, board_seed))
+        grid = self.boards.take(key, board_seed)
+        # 下一个盘面种子已经确定，让盘面池提前生成
+        state = self.rng.getstate()
+        self.boards.prefetch(key, self.rng.getrandbits(64))
+        self.rng.setstate(state)
+        return self.backend.from_emoji(grid)
+
+    def _mark_dirty(self, cells):
+        self._changed.update(cells)
+        if self._dirty is not None:
+            self._dirty.update(cells)
+
+    def _scan(self):
+        """返回 (可消除分组, 检查过的格子数)，能增量时只看变动区域"""
+        if self.incremental and self._dirty is not None:
+            return self.backend.find_groups_near(self.state.grid, self._dirty)
+        return self.backend.find_groups(self.state.grid), self.state.rows * self.state.cols
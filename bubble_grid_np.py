@@ -0,0 +1,328 @@
+import numpy as np
+
+from bubble_engine import (NORMAL_BUBBLES, SPECIAL_BUBBLES, MIN_GROUP_SIZE, SPECIAL_CHANCE_INITIAL,
+                           SPECIAL_CHANCE_REFILL, generate_enhanced_grid)
+
+# 泡泡编码：0 表示空位，1..6 为普通泡泡，7..11 为特殊泡泡
+BUBBLE_CODES = [None] + NORMAL_BUBBLES + SPECIAL_BUBBLES
+CODE_OF = {bubble: code for code, bubble in enumerate(BUBBLE_CODES) if bubble is not None}
+EMPTY = 0
+FIRST_SPECIAL_CODE = 1 + len(NORMAL_BUBBLES)
+
+
+# 表情网格 -> 编码数组
+def encode_grid(grid):
+    """把表情网格编码成 uint8 数组"""
+    return np.array([[CODE_OF.get(bubble, EMPTY) for bubble in row] for row in grid], dtype=np.uint8)
+
+
+# 编码数组 -> 表情网格
+def decode_grid(codes):
+    """把编码数组还原成表情网格"""
+    lookup = BUBBLE_CODES
+    return [[lookup[code] for code in row] for row in codes.tolist()]
+
+
+# 整盘下落
+def compact_columns(codes):
+    """所有列一次性压实：空位上浮、非空泡泡保持原顺序落到底部（支持 (N, rows, cols) 批量）"""
+    order = np.argsort(codes != EMPTY, axis=-2, kind='stable')
+    return np.take_along_axis(codes, order, axis=-2)
+
+
+# 按块预抽取的补充流
+class RefillStream:
+    """用可设种子的生成器按固定大小的块预先抽取补充泡泡编码
+
+    每块固定 block_size 个，因此同一种子产出的序列与每次取用多少无关，可用于复现。
+    """
+
+    def __init__(self, seed=None, special_chance=SPECIAL_CHANCE_REFILL, block_size=4096):
+        self.generator = np.random.default_rng(seed)
+        self.special_chance = special_chance
+        self.block_size = block_size
+        self._block = np.empty(0, dtype=np.uint8)
+        self._pos = 0
+        # 抽取当前块之前的生成器状态，pickle 时只保存它和游标
+        self._block_state = None
+        # peek 提前抽出、还没轮到的块：[(抽取前的生成器状态, 块)]
+        self._ahead = []
+
+    def __getstate__(self):
+        if self._block_state is not None:
+            generator = self._block_state
+        elif self._ahead:
+            generator = self._ahead[0][0]
+        else:
+            generator = self.generator.bit_generator.state
+        return {
+            'special_chance': self.special_chance,
+            'block_size': self.block_size,
+            'generator': generator,
+            'drawn': self._block_state is not None,
+            'pos': self._pos,
+        }
+
+    def __setstate__(self, state):
+        self.special_chance = state['special_chance']
+        self.block_size = state['block_size']
+        self.generator = np.random.default_rng()
+        self.generator.bit_generator.state = state['generator']
+        self._block = np.empty(0, dtype=np.uint8)
+        self._block_state = None
+        self._ahead = []
+        if state['drawn']:
+            # 按相同状态重新抽出当前块，之后的序列与未 pickle 时完全一致
+            self._block_state, self._block = self._draw_block()
+        self._pos = state['pos']
+
+    def _draw_block(self):
+        """返回 (抽取前的生成器状态, 块)"""
+        before = self.generator.bit_generator.state
+        size = self.block_size
+        special = self.generator.random(size) < self.special_chance
+        normal_codes = self.generator.integers(1, FIRST_SPECIAL_CODE, size, dtype=np.uint8)
+        special_codes = self.generator.integers(FIRST_SPECIAL_CODE, len(BUBBLE_CODES), size, dtype=np.uint8)
+        return before, np.where(special, special_codes, normal_codes)
+
+    def _next_block(self):
+        self._block_state, self._block = self._ahead.pop(0) if self._ahead else self._draw_block()
+        self._pos = 0
+
+    def take(self, count):
+        """取出 count 个泡泡编码"""
+        available = self._block.size - self._pos
+        if count <= available:
+            codes = self._block[self._pos:self._pos + count]
+            self._pos += count
+            return codes
+
+        parts = [self._block[self._pos:]]
+        needed = count - available
+        while needed > 0:
+            self._next_block()
+            self._pos = min(needed, self._block.size)
+            parts.append(self._block[:self._pos])
+            needed -= self._pos
+        return np.concatenate(parts)
+
+    def peek(self, count, offset=0):
+        """不消耗地查看之后第 offset 个起的 count 个编码，与之后 take 得到的完全相同"""
+        start = self._pos + offset
+        end = start + count
+        if end <= self._block.size:
+            return self._block[start:end]
+        while self._block.size + self.block_size * len(self._ahead) < end:
+            self._ahead.append(self._draw_block())
+        blocks = [self._block] + [block for _, block in self._ahead]
+        return np.concatenate(blocks)[start:end]
+
+    def take_bubbles(self, count):
+        """取出 count 个表情泡泡"""
+        lookup = BUBBLE_CODES
+        return [lookup[code] for code in self.take(count).tolist()]
+
+
+# 相邻同色边
+def _same_color_edges(codes):
+    """返回所有相邻且同色（非空）格子对的扁平下标；最后两维是行列，前面的维度各自独立"""
+    index = np.arange(codes.size).reshape(codes.shape)
+
+    horizontal = (codes[..., :, :-1] == codes[..., :, 1:]) & (codes[..., :, :-1] != EMPTY)
+    vertical = (codes[..., :-1, :] == codes[..., 1:, :]) & (codes[..., :-1, :] != EMPTY)
+
+    u = np.concatenate((index[..., :, :-1][horizontal], index[..., :-1, :][vertical]))
+    v = np.concatenate((index[..., :, 1:][horizontal], index[..., 1:, :][vertical]))
+    return u, v
+
+
+# 连通分量标记
+def label_components(codes):
+    """对同色 4 连通区域做向量化并查集，返回每格的根（即分量内最小扁平下标）
+
+    codes 可以是 (rows, cols)，也可以是 (N, rows, cols) 的一批盘面，盘面之间互不相连。
+    """
+    parent = np.arange(codes.size)
+    u, v = _same_color_edges(codes)
+
+    while True:
+        pu = parent[u]
+        pv = parent[v]
+        pending = pu != pv
+        if not pending.any():
+            break
+        u, v, pu, pv = u[pending], v[pending], pu[pending], pv[pending]
+
+        # 把较大的根挂到较小的根上，保证不会成环
+        np.minimum.at(parent, np.maximum(pu, pv), np.minimum(pu, pv))
+
+        # 指针跳跃直到每个节点都直接指向根
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+    return parent.reshape(codes.shape)
+
+
+# 可消除区域掩码
+def clearable_mask(codes, labels=None):
+    """返回属于大小 >= 3 的同色区域的格子掩码"""
+    if labels is None:
+        labels = label_components(codes)
+    flat = labels.ravel()
+    sizes = np.bincount(flat, minlength=flat.size)
+    return ((sizes[flat] >= MIN_GROUP_SIZE) & (codes.ravel() != EMPTY)).reshape(codes.shape)
+
+
+# 查找所有可消除的连接组合
+def find_all_clearable_groups_np(codes):
+    """与 find_all_clearable_groups 返回相同的分组（组按首格行优先排序，组内按行优先）"""
+    labels = label_components(codes)
+    mask = clearable_mask(codes, labels)
+    cells = np.flatnonzero(mask)
+    if cells.size == 0:
+        return []
+
+    roots = labels.ravel()[cells]
+    order = np.lexsort((cells, roots))
+    cells, roots = cells[order], roots[order]
+    splits = np.flatnonzero(np.diff(roots)) + 1
+
+    cols = codes.shape[1]
+    groups = []
+    for chunk in np.split(cells, splits):
+        groups.append([(int(cell) // cols, int(cell) % cols) for cell in chunk])
+    return groups
+
+
+# 只在变动区域附近查找可消除组合
+def find_clearable_groups_near_np(codes, cells):
+    """在包住变动格子的窗口内标记连通分量，返回 (分组, 检查过的格子数)
+
+    窗口先取变动格子外扩一格的包围盒；若与变动格子相连的分量碰到窗口内侧边界，
+    就把窗口在该方向加倍后重算，保证分量大小与整盘扫描一致。
+    """
+    if not cells:
+        return [], 0
+    rows, cols = codes.shape
+    dirty = np.array(sorted(cells))
+    r0 = max(int(dirty[:, 0].min()) - 1, 0)
+    r1 = min(int(dirty[:, 0].max()) + 2, rows)
+    c0 = max(int(dirty[:, 1].min()) - 1, 0)
+    c1 = min(int(dirty[:, 1].max()) + 2, cols)
+
+    while True:
+        window = codes[r0:r1, c0:c1]
+        labels = label_components(window)
+        roots = np.unique(labels[dirty[:, 0] - r0, dirty[:, 1] - c0])
+        touched = np.isin(labels, roots) & (window != EMPTY)
+
+        height, width = r1 - r0, c1 - c0
+        grown = False
+        if r0 > 0 and touched[0].any():
+            r0, grown = max(r0 - height, 0), True
+        if r1 < rows and touched[-1].any():
+            r1, grown = min(r1 + height, rows), True
+        if c0 > 0 and touched[:, 0].any():
+            c0, grown = max(c0 - width, 0), True
+        if c1 < cols and touched[:, -1].any():
+            c1, grown = min(c1 + width, cols), True
+        if not grown:
+            break
+
+    mask = touched & clearable_mask(window, labels)
+    local = np.flatnonzero(mask)
+    examined = int(window.size)
+    if local.size == 0:
+        return [], examined
+
+    roots = labels.ravel()[local]
+    order = np.lexsort((local, roots))
+    local, roots = local[order], roots[order]
+    splits = np.flatnonzero(np.diff(roots)) + 1
+
+    width = c1 - c0
+    groups = []
+    for chunk in np.split(local, splits):
+        groups.append([(int(cell) // width + r0, int(cell) % width + c0) for cell in chunk])
+    return groups, examined
+
+
+# NumPy 网格后端
+class NumpyGridBackend:
+    """以 uint8 编码数组保存盘面的网格后端"""
+
+    name = 'numpy'
+
+    def new_grid(self, rows, cols, rng, special_chance=SPECIAL_CHANCE_INITIAL):
+        return encode_grid(generate_enhanced_grid(rows, cols, rng, special_chance))
+
+    def shape(self, grid):
+        return grid.shape
+
+    def bubble_at(self, grid, row, col):
+        return BUBBLE_CODES[grid[row, col]]
+
+    def to_emoji(self, grid):
+        return decode_grid(grid)
+
+    def from_emoji(self, grid):
+        return encode_grid(grid)
+
+    def swap(self, grid, pos1, pos2):
+        grid[pos1], grid[pos2] = grid[pos2], grid[pos1]
+
+    def find_groups(self, grid):
+        return find_all_clearable_groups_np(grid)
+
+    def find_groups_near(self, grid, cells):
+        return find_clearable_groups_near_np(grid, cells)
+
+    def can_match(self, grid, pos1, pos2):
+        self.swap(grid, pos1, pos2)
+        try:
+            return _has_group_at(grid, *pos1) or _has_group_at(grid, *pos2)
+        finally:
+            self.swap(grid, pos1, pos2)
+
+    def collect(self, grid, positions):
+        counts = {}
+        for row, col in positions:
+            bubble = BUBBLE_CODES[grid[row, col]]
+            counts[bubble] = counts.get(bubble, 0) + 1
+        return counts
+
+    def remove(self, grid, positions, refill):
+        if positions:
+            cells = np.array(positions)
+            grid[cells[:, 0], cells[:, 1]] = EMPTY
+
+        grid[...] = compact_columns(grid)
+
+        # 与列表后端相同的补充顺序（逐列、自上而下）
+        empty = grid.T == EMPTY
+        count = int(empty.sum())
+        if count:
+            grid.T[empty] = refill.take(count)
+
+
+# 局部判断某格是否属于可消除区域
+def _has_group_at(codes, row, col):
+    """从 (row, col) 出发的有界搜索，找到 3 个同色格子即停止"""
+    target = codes[row, col]
+    if target == EMPTY:
+        return False
+    rows, cols = codes.shape
+    seen = {(row, col)}
+    stack = [(row, col)]
+    while stack:
+        r, c = stack.pop()
+        for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+            if 0 <= nr < rows and 0 <= nc < cols and (nr, nc) not in seen and codes[nr, nc] == target:
+                seen.add((nr, nc))
+                if len(seen) >= MIN_GROUP_SIZE:
+                    return True
+                stack.append((nr, nc))
+    return False
@@ -0,0 +1,189 @@
+import os
+import shutil
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from bubble_store import restore_engine, snapshot_engine
+
+# 快照文件后缀
+SNAPSHOT_SUFFIX = '.lbs'
+
+
+# 令牌会直接用作文件名，只允许字母、数字、- 和 _
+def valid_token(token):
+    return bool(token) and len(token) <= 64 and all(c.isascii() and (c.isalnum() or c in '-_') for c in token)
+
+
+# 本进程的快照子目录名：主机名-进程号
+def process_directory_name(pid=None):
+    return f"{socket.gethostname()}-{os.getpid() if pid is None else pid}"
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# 清理本机已退出进程留下的快照子目录
+def prune_dead_directories(directory):
+    """返回删除的子目录数；其他主机的子目录（共享卷）无法判断存活，不动"""
+    prefix = socket.gethostname() + '-'
+    removed = 0
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        pid = name[len(prefix):]
+        if not name.startswith(prefix) or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        if not _process_alive(int(pid)):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+# 会话休眠缓存
+class SessionCache:
+    """进程内的对局缓存：最近活跃的引擎留在内存，闲置的写成快照文件后从内存移除
+
+    两种淘汰：闲置超过 idle_seconds（TTL），或活跃数超过 max_live（按最近使用淘汰）。
+    淘汰在每次 get / put 时顺带进行，不需要后台线程。休眠的对局在下一次 get 时
+    从快照恢复；快照文件超过 keep_seconds 没有被取回就删除。
+
+    快照写在 directory 下本进程自己的子目录里，只恢复本进程写的快照：多个进程共用
+    一个目录时互不干扰，换了进程的玩家从外部状态存储（bubble_store）恢复。
+    """
+
+    def __init__(self, directory, max_live=1000, idle_seconds=600, keep_seconds=7 * 24 * 3600,
+                 clock=time.monotonic):
+        self.directory = os.path.join(directory, process_directory_name())
+        self.max_live = max_live
+        self.idle_seconds = idle_seconds
+        self.keep_seconds = keep_seconds
+        self.clock = clock
+        prune_dead_directories(directory)
+        # 进程号复用时目录里可能有上一个进程的快照，它们不属于本进程
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._live = OrderedDict()          # 令牌 -> (引擎, 最近使用时间)，最久未用的在前
+        self._hibernated = OrderedDict()    # 令牌 -> 休眠时间，最早休眠的在前
+        self._lock = threading.Lock()
+        self.hibernations = 0
+        self.rehydrations = 0
+        self.rehydrate_seconds = 0.0
+
+    def get(self, token):
+        """返回令牌对应的引擎，必要时从快照恢复；都没有时返回 None"""
+        with self._lock:
+            now = self.clock()
+            entry = self._live.get(token)
+            if entry is not None:
+                self._live[token] = (entry[0], now)
+                self._live.move_to_end(token)
+                self._sweep(now)
+                return entry[0]
+            if token not in self._hibernated:
+                return None
+
+            started = time.perf_counter()
+            path = self._path(token)
+            del self._hibernated[token]
+            try:
+                with open(path, 'rb') as f:
+                    engine = restore_engine(f.read())
+            except FileNotFoundError:
+                # 快照被外部删掉了（清理临时目录等），当作没有休眠过
+                return None
+            self._remove_snapshot(token)
+            self._live[token] = (engine, now)
+            self.rehydrations += 1
+            self.rehydrate_seconds += time.perf_counter() - started
+            self._sweep(now)
+            return engine
+
+    def put(self, token, engine):
+        """登记（或刷新）活跃的引擎；内存中的对局总是比快照新，旧快照随之作废"""
+        if not valid_token(token):
+            raise ValueError(f"无效的会话令牌: {token!r}")
+        with self._lock:
+            now = self.clock()
+            self._live[token] = (engine, now)
+            self._live.move_to_end(token)
+            if self._hibernated.pop(token, None) is not None:
+                self._remove_snapshot(token)
+            self._sweep(now)
+
+    def discard(self, token):
+        with self._lock:
+            self._live.pop(token, None)
+            if self._hibernated.pop(token, None) is not None:
+                self._remove_snapshot(token)
+
+    def sweep(self):
+        """立即执行一次淘汰，返回本次休眠的对局数"""
+        with self._lock:
+            return self._sweep(self.clock())
+
+    def stats(self):
+        """活跃、休眠中、累计休眠、累计恢复的会话数，以及平均恢复耗时（毫秒）"""
+        with self._lock:
+            return {
+                'live': len(self._live),
+                'hibernated': len(self._hibernated),
+                'hibernations': self.hibernations,
+                'rehydrated': self.rehydrations,
+                'rehydrate_ms': self.rehydrate_seconds * 1000 / self.rehydrations if self.rehydrations else 0.0,
+            }
+
+    def close(self):
+        """进程退出时删除本进程的快照目录（休眠中的对局只能从外部状态存储恢复）"""
+        with self._lock:
+            self._hibernated.clear()
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _sweep(self, now):
+        hibernated = 0
+        while self._live:
+            token, (engine, last_used) = next(iter(self._live.items()))
+            if len(self._live) <= self.max_live and now - last_used < self.idle_seconds:
+                break
+            self._hibernate(token, engine, now)
+            hibernated += 1
+
+        while self._hibernated:
+            token, since = next(iter(self._hibernated.items()))
+            if now - since < self.keep_seconds:
+                break
+            del self._hibernated[token]
+            self._remove_snapshot(token)
+        return hibernated
+
+    def _hibernate(self, token, engine, now):
+        path = self._path(token)
+        temp = path + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(snapshot_engine(engine))
+        os.replace(temp, path)
+        del self._live[token]
+        self._hibernated[token] = now
+        self.hibernations += 1
+
+    def _remove_snapshot(self, token):
+        try:
+            os.remove(self._path(token))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, token):
+        if not valid_token(token):
+            raise ValueError(f"无效的会话令牌: {token!r}")
+        return os.path.join(self.directory, token + SNAPSHOT_SUFFIX)
@@ -0,0 +1,297 @@
+"""游戏循环的耗时与计数指标
+
+每次重跑的各个阶段（初始化、页面资源、各片段、点击处理、交换结算、保存）记成直方图，
+每次交换的连锁（轮数、每轮找到的组合数、消除的格子数、检查过的格子数、每轮耗时）记成计数和直方图。
+按 URL 打开，可以同时开多个导出方式，逗号分隔：
+
+    prometheus://0.0.0.0:9464?ports=16            # 后台 HTTP 服务，/metrics 为 Prometheus 文本格式
+    file:///var/log/love_bubble/metrics.jsonl?interval=10&max_bytes=10485760&backups=3
+                                                  # 每 interval 秒追加一行 JSON 快照，超过 max_bytes 轮转
+
+同一台机器上跑多个 Streamlit 进程时，端口被占用就依次试后面的 ports 个端口（默认 16 个，
+抓取配置里列出 9464-9479 即可）；全部占用时退回到临时目录下按进程号命名的轮转文件，不让进程起不来。
+URL 为空时不创建任何对象，调用方只做一次 None 判断，关闭时没有额外开销。
+"""
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import bubble_engine
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'love_bubble'
+# 端口被占用时往后试的端口数
+PORT_ATTEMPTS = 16
+# 阶段耗时的直方图分桶（秒）
+PHASE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# 连锁单轮耗时的分桶（秒）
+ROUND_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+# 每次交换连锁轮数的分桶
+DEPTH_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15)
+
+HELP = {
+    'phase_seconds': ('histogram', "一次重跑中各阶段的耗时"),
+    'reruns_total': ('counter', "整页重跑次数"),
+    'swaps_total': ('counter', "结算过的成功交换次数"),
+    'cascade_rounds': ('histogram', "每次交换的连锁轮数"),
+    'cascade_round_seconds': ('histogram', "连锁单轮（找组合 + 消除补充）的耗时"),
+    'cascade_rounds_total': ('counter', "连锁轮数"),
+    'cascade_groups_total': ('counter', "连锁中找到的组合数"),
+    'cascade_cleared_total': ('counter', "连锁中消除的格子数"),
+    'cascade_examined_total': ('counter', "连锁中检查过的格子数"),
+    'reshuffles_total': ('counter', "结算后无路可走的自动重新排列次数"),
+}
+
+
+# 固定分桶的直方图
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)    # 不累加，最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(上界, 累计次数)]，最后一项上界为 '+Inf'"""
+        total = 0
+        points = []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            points.append((bound, total))
+        return points
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = ((name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+# 进程内的指标
+class Metrics:
+    """线程安全的计数器和直方图，按 (名称, 标签) 区分"""
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self.started = time.time()
+        self.exporters = []
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=PHASE_BUCKETS, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def record_phase(self, phase, seconds):
+        self.observe('phase_seconds', seconds, phase=phase)
+
+    def record_cascade(self, result):
+        """记下一次结算（CascadeResult）的连锁明细"""
+        rounds = result.rounds
+        self.inc('swaps_total')
+        self.inc('cascade_rounds_total', len(rounds))
+        self.inc('cascade_groups_total', sum(entry['groups'] for entry in rounds))
+        self.inc('cascade_cleared_total', result.cleared)
+        self.inc('cascade_examined_total', result.examined)
+        if result.reshuffled:
+            self.inc('reshuffles_total')
+        self.observe('cascade_rounds', len(rounds), DEPTH_BUCKETS)
+        for entry in rounds:
+            if 'seconds' in entry:
+                self.observe('cascade_round_seconds', entry['seconds'], ROUND_BUCKETS)
+
+    def snapshot(self):
+        """{'counters': {名称: [[标签, 值], ...]}, 'histograms': {名称: [[标签, 次数, 总和, 累计分桶], ...]}}"""
+        with self._lock:
+            counters = {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append([dict(labels), value])
+            histograms = {}
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                histograms.setdefault(name, []).append(
+                    [dict(labels), histogram.count, histogram.sum, histogram.cumulative()])
+        return {'uptime': time.time() - self.started, 'counters': counters, 'histograms': histograms}
+
+    def prometheus_text(self):
+        """Prometheus 文本格式（0.0.4）"""
+        snapshot = self.snapshot()
+        lines = []
+        for name in sorted(set(snapshot['counters']) | set(snapshot['histograms'])):
+            full = f"{self.prefix}_{name}"
+            kind, text = HELP.get(name, ('histogram' if name in snapshot['histograms'] else 'counter', name))
+            lines.append(f"# HELP {full} {text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, value in snapshot['counters'].get(name, []):
+                lines.append(f"{full}{_format_labels(list(labels.items()))} {value}")
+            for labels, count, total, buckets in snapshot['histograms'].get(name, []):
+                for bound, cumulative in buckets:
+                    lines.append(f"{full}_bucket{_format_labels(list(labels.items()) + [('le', bound)])} {cumulative}")
+                lines.append(f"{full}_sum{_format_labels(list(labels.items()))} {total}")
+                lines.append(f"{full}_count{_format_labels(list(labels.items()))} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def targets(self):
+        """实际生效的导出位置（端口被占用时可能和 URL 不同）"""
+        return [exporter.target for exporter in self.exporters]
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters = []
+
+
+# Prometheus 抓取端点
+class PrometheusExporter:
+    """后台线程里的 HTTP 服务，GET /metrics 返回 metrics.prometheus_text()"""
+
+    def __init__(self, metrics, host='0.0.0.0', port=9464):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.target = f"prometheus://{host}:{self.port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="bubble-metrics-http", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# 轮转的本地文件
+class RollingFileExporter:
+    """每 interval 秒追加一行 JSON 快照；文件超过 max_bytes 时改名为 .1（依次后移，保留 backups 个）"""
+
+    def __init__(self, metrics, path, interval=10.0, max_bytes=10 * 1024 * 1024, backups=3):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.target = f"file://{os.path.abspath(path)}"
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bubble-metrics-file", daemon=True)
+        self._thread.start()
+
+    def write(self):
+        line = json.dumps({'time': time.time(), **self.metrics.snapshot()}, ensure_ascii=False) + '\n'
+        try:
+            if os.path.getsize(self.path) + len(line) > self.max_bytes:
+                self._rotate()
+        except FileNotFoundError:
+            pass
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                # 磁盘满等情况，下一轮再试
+                pass
+
+
+# 连锁单轮计时
+def profile_rounds(enabled=True):
+    """打开后引擎结算的每轮记录里多一项 'seconds'；关闭时引擎只多一次 None 判断"""
+    bubble_engine.round_clock = time.perf_counter if enabled else None
+
+
+# 依次试端口，全部被占用时退回到本进程的轮转文件
+def _open_prometheus(metrics, host, port, attempts):
+    for offset in range(max(attempts, 1)):
+        try:
+            return PrometheusExporter(metrics, host, port + offset)
+        except OSError as exc:
+            last = exc
+    path = os.path.join(tempfile.gettempdir(), f"{PREFIX}_metrics-{os.getpid()}.jsonl")
+    logger.warning("端口 %d-%d 都不可用（%s），指标改写到 %s", port, port + max(attempts, 1) - 1, last, path)
+    return RollingFileExporter(metrics, path)
+
+
+# 按 URL 打开
+def open_metrics(url):
+    """逗号分隔的 prometheus://主机:端口?ports= 和 / 或 file:///路径?interval=&max_bytes=&backups=；为空时返回 None"""
+    if not url:
+        return None
+    metrics = Metrics()
+    try:
+        for item in url.split(','):
+            parts = urlsplit(item.strip())
+            options = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+            if parts.scheme == 'prometheus':
+                metrics.exporters.append(_open_prometheus(
+                    metrics, parts.hostname or '0.0.0.0', parts.port or 9464,
+                    int(options.get('ports', PORT_ATTEMPTS))))
+            elif parts.scheme == 'file' and parts.path:
+                metrics.exporters.append(RollingFileExporter(
+                    metrics, parts.path, float(options.get('interval', 10)),
+                    int(options.get('max_bytes', 10 * 1024 * 1024)), int(options.get('backups', 3))))
+            else:
+                raise ValueError(f"不支持的指标导出: {item}")
+    except Exception:
+        metrics.close()
+        raise
+    profile_rounds()
+    return metrics
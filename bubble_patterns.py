@@ -0,0 +1,205 @@
+"""交换合法性的局部模式表
+
+把 x 从格子 p 换到相邻的 q 之后，q 能否连成 MIN_GROUP_SIZE 个，只取决于 q 周围
+曼哈顿距离 MIN_GROUP_SIZE - 1 以内的格子是不是 x（p 本身换进来的是另一种颜色，
+视为不同）。把这些格子的"同色 / 不同色"编成一个整数，合法性就成了查表。
+3 连时邻域是 10 格，表只有 1024 字节；四个方向旋转后共用同一张表。
+
+表由本模块离线生成，运行时用 mmap 只读映射：
+
+    python bubble_patterns.py --out bubble_patterns.lbp
+
+盘面边界外的格子按"不同色"编码，结果仍然精确。两格同色、含空位、不相邻，
+或表文件缺失 / 与 MIN_GROUP_SIZE 不符时查不了表，后端退回洪水填充。
+"""
+import argparse
+import mmap
+import os
+import struct
+
+from bubble_engine import MIN_GROUP_SIZE
+
+# 随代码一起提交的表文件
+PATTERN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bubble_patterns.lbp')
+
+_MAGIC = b'LBPT'
+_FORMAT_VERSION = 1
+# 魔数, 格式版本, 最少连接数, 邻域格数
+_HEADER = struct.Struct('<4sBBH')
+
+# 把换出格在左边 (0, -1) 的相对位置旋转到换出格在 (dr, dc) 方向
+_ROTATIONS = {
+    (0, -1): lambda r, c: (r, c),
+    (-1, 0): lambda r, c: (c, -r),
+    (0, 1): lambda r, c: (-r, -c),
+    (1, 0): lambda r, c: (-c, r),
+}
+
+
+# 换入格周围需要编码的相对位置（换出格在左边）
+def neighborhood(group_size=MIN_GROUP_SIZE):
+    """不经过换出格、group_size - 1 步以内能走到的格子，按行优先排列"""
+    reached = {(0, 0)}
+    frontier = [(0, 0)]
+    for _ in range(group_size - 1):
+        frontier = [cell for r, c in frontier for cell in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1))
+                    if cell != (0, -1) and cell not in reached]
+        reached.update(frontier)
+    reached.discard((0, 0))
+    return sorted(reached)
+
+
+# 生成模式表
+def generate(group_size=MIN_GROUP_SIZE):
+    """第 pattern 字节为 1 表示：邻域中 pattern 各位对应的格子与换入的颜色相同时能连成组合"""
+    offsets = neighborhood(group_size)
+    table = bytearray(1 << len(offsets))
+    for pattern in range(len(table)):
+        same = {offset for bit, offset in enumerate(offsets) if pattern >> bit & 1}
+        seen = {(0, 0)}
+        stack = [(0, 0)]
+        while stack and len(seen) < group_size:
+            r, c = stack.pop()
+            for cell in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if cell in same and cell not in seen:
+                    seen.add(cell)
+                    stack.append(cell)
+        table[pattern] = len(seen) >= group_size
+    return table
+
+
+def write_table(path=PATTERN_FILE, group_size=MIN_GROUP_SIZE):
+    table = generate(group_size)
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, group_size, len(neighborhood(group_size))))
+        f.write(table)
+    os.replace(temp, path)
+    return len(table)
+
+
+# 内存映射的模式表
+class PatternTable:
+    """只读映射表文件；每种盘面尺寸缓存一次每个有向交换对要读取的格子"""
+
+    def __init__(self, path=PATTERN_FILE):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, group_size, size = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            raise ValueError(f"无法识别的模式表: {magic!r} v{version}")
+        if len(self._map) != _HEADER.size + (1 << size):
+            raise ValueError(f"模式表长度不符: {path}")
+        self.group_size = group_size
+        self.offsets = neighborhood(group_size)
+        self._table = memoryview(self._map)[_HEADER.size:]
+        self._layouts = {}
+
+    def close(self):
+        self._table.release()
+        self._map.close()
+
+    def legal(self, grid, pos1, pos2):
+        """二维网格（grid[row][col]）上交换 pos1、pos2 是否合法；查不了表时返回 None"""
+        x, y = grid[pos1[0]][pos1[1]], grid[pos2[0]][pos2[1]]
+        if x == y or x is None or y is None:
+            return None
+        layout = self._layouts.get((len(grid), len(grid[0]), pos1, pos2))
+        if layout is None:
+            layout = self._layout(len(grid), len(grid[0]), pos1, pos2)
+            if layout is None:
+                return None
+        table = self._table
+        for (near, far), bubble in zip(layout, (x, y)):
+            # 换入格的直接邻居里没有同色时，不用再看外圈
+            pattern = 0
+            for row, col, _, bit in near:
+                if grid[row][col] == bubble:
+                    pattern |= bit
+            if not pattern:
+                continue
+            for row, col, _, bit in far:
+                if grid[row][col] == bubble:
+                    pattern |= bit
+            if table[pattern]:
+                return True
+        return False
+
+    def legal_cells(self, cells, rows, cols, pos1, pos2):
+        """行优先的一维编码（bytearray，0 为空位）上的同一判断"""
+        x, y = cells[pos1[0] * cols + pos1[1]], cells[pos2[0] * cols + pos2[1]]
+        if x == y or not x or not y:
+            return None
+        layout = self._layouts.get((rows, cols, pos1, pos2))
+        if layout is None:
+            layout = self._layout(rows, cols, pos1, pos2)
+            if layout is None:
+                return None
+        table = self._table
+        for (near, far), code in zip(layout, (x, y)):
+            pattern = 0
+            for _, _, index, bit in near:
+                if cells[index] == code:
+                    pattern |= bit
+            if not pattern:
+                continue
+            for _, _, index, bit in far:
+                if cells[index] == code:
+                    pattern |= bit
+            if table[pattern]:
+                return True
+        return False
+
+    def _layout(self, rows, cols, pos1, pos2):
+        """有向交换对 pos1 -> pos2 要读取的格子；两格不相邻时返回 None"""
+        if abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1]) != 1:
+            return None
+        layout = (self._cells_around(rows, cols, pos1, pos2), self._cells_around(rows, cols, pos2, pos1))
+        self._layouts[(rows, cols, pos1, pos2)] = layout
+        return layout
+
+    def _cells_around(self, rows, cols, source, target):
+        """从 source 换进 target 时要比较的格子 (行, 列, 一维下标, 位)，分成直接邻居和外圈两组，
+        盘面外的格子省略"""
+        rotate = _ROTATIONS[(source[0] - target[0], source[1] - target[1])]
+        near, far = [], []
+        for bit, offset in enumerate(self.offsets):
+            dr, dc = rotate(*offset)
+            row, col = target[0] + dr, target[1] + dc
+            if 0 <= row < rows and 0 <= col < cols:
+                (near if abs(dr) + abs(dc) == 1 else far).append((row, col, row * cols + col, 1 << bit))
+        return tuple(near), tuple(far)
+
+
+_table = None
+_loaded = False
+
+
+# 进程内共享的模式表
+def pattern_table():
+    """首次调用时映射 PATTERN_FILE；文件缺失或与 MIN_GROUP_SIZE 不符时返回 None"""
+    global _table, _loaded
+    if not _loaded:
+        _loaded = True
+        try:
+            table = PatternTable()
+        except (OSError, ValueError):
+            table = None
+        if table is not None and table.group_size != MIN_GROUP_SIZE:
+            table.close()
+            table = None
+        _table = table
+    return _table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成交换合法性的局部模式表")
+    parser.add_argument('--out', default=PATTERN_FILE)
+    parser.add_argument('--group-size', type=int, default=MIN_GROUP_SIZE)
+    args = parser.parse_args(argv)
+    count = write_table(args.out, args.group_size)
+    print(f"{count} 个模式（邻域 {len(neighborhood(args.group_size))} 格）已写入 {args.out}")
+
+
+if __name__ == '__main__':
+    main()
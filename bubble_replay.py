@@ -0,0 +1,226 @@
+"""对局记录与确定性重放
+
+每局用自己的种子开局，成功的交换和手动重新排列按顺序记进 MoveLog（每步 2 字节），
+给定种子和记录就能重建任意一步的盘面：
+
+    engine = seeded_engine(seed, log=MoveLog(seed))
+    ...
+    replayed = replay(engine.log)            # 与 engine 完全一致
+    earlier = replay(engine.log, upto=10)    # 第 10 步之后的状态
+
+每 snapshot_every 步保存一个引擎快照，重放从最近的快照开始，只需重放之后的几步。
+keep_snapshots 限制保留的快照数，更早的快照和它之前的步数会被压缩掉。
+
+    python bubble_replay.py game.lbr --upto 10
+"""
+import argparse
+import random
+import struct
+import sys
+from array import array
+
+from bubble_engine import SPECIAL_CHANCE_INITIAL, BoardEngine
+
+# 事件编码：交换为 (格子下标 << 1) | 方向（0 向右，1 向下），0xFFFF 为手动重新排列
+SHUFFLE_EVENT = 0xFFFF
+_MAX_CELLS = SHUFFLE_EVENT >> 1
+
+_MAGIC = b'LBML'
+_FORMAT_VERSION = 3
+# 魔数, 格式版本, 种子, 行, 列, 补充块大小, 特殊概率, 快照间隔, 保留快照数, 起始步, 步数, 快照数, 最少合法交换,
+# 特殊泡泡效果
+_HEADER = struct.Struct('<4sBQHHIdIIIIIHB')
+# 第 2 版没有特殊泡泡效果（即关闭）
+_HEADER_V2 = struct.Struct('<4sBQHHIdIIIIIH')
+# 第 1 版没有最少合法交换（即 0，旧的盘面生成方式）
+_HEADER_V1 = struct.Struct('<4sBQHHIdIIIII')
+_SNAPSHOT_HEADER = struct.Struct('<II')
+
+
+# 按种子开局
+def seeded_engine(seed, rows=7, cols=6, block_size=4096, special_chance=SPECIAL_CHANCE_INITIAL,
+                  backend=None, rules=None, log=None, min_moves=0, boards=None, powers=False):
+    """开局盘面、补充流、自动重新排列全部由 seed 决定"""
+    from bubble_grid_np import RefillStream
+
+    rng = random.Random(seed)
+    refill = RefillStream(rng.getrandbits(64), block_size=block_size)
+    return BoardEngine(rows, cols, rng=rng, backend=backend, refill=refill, special_chance=special_chance,
+                       rules=rules, log=log, min_moves=min_moves, boards=boards, powers=powers)
+
+
+# 按种子开局时第一个盘面的种子（min_moves 大于 0 时），供盘面池提前生成
+def first_board_seed(seed):
+    rng = random.Random(seed)
+    rng.getrandbits(64)     # 补充流的种子
+    return rng.getrandbits(64)
+
+
+# 对局记录
+class MoveLog:
+    """种子 + 开局参数 + 紧凑的事件序列 + 周期性快照"""
+
+    def __init__(self, seed, rows=7, cols=6, block_size=4096, special_chance=SPECIAL_CHANCE_INITIAL,
+                 snapshot_every=100, keep_snapshots=0, min_moves=0, powers=False):
+        if rows * cols > _MAX_CELLS:
+            raise ValueError(f"盘面太大，无法记录: {rows}x{cols}")
+        self.seed = seed
+        self.rows = rows
+        self.cols = cols
+        self.block_size = block_size
+        self.special_chance = special_chance
+        self.min_moves = min_moves
+        self.powers = powers
+        self.snapshot_every = snapshot_every
+        self.keep_snapshots = keep_snapshots     # 0 表示全部保留
+        self.base = 0                            # events[0] 是整局的第几步（压缩后大于 0）
+        self.events = array('H')
+        self.snapshots = {}                      # 步数 -> 该步之后的引擎快照
+
+    @property
+    def total(self):
+        """整局的事件数"""
+        return self.base + len(self.events)
+
+    def new_engine(self, backend=None, rules=None):
+        """按记录的参数开一局（不带记录）"""
+        return seeded_engine(self.seed, self.rows, self.cols, self.block_size, self.special_chance,
+                             backend=backend, rules=rules, min_moves=self.min_moves, powers=self.powers)
+
+    def record_swap(self, engine, pos1, pos2):
+        (row1, col1), (row2, col2) = sorted((pos1, pos2))
+        self._append(engine, ((row1 * self.cols + col1) << 1) | (row2 != row1))
+
+    def record_shuffle(self, engine):
+        self._append(engine, SHUFFLE_EVENT)
+
+    def _append(self, engine, event):
+        self.events.append(event)
+        if self.snapshot_every and self.total % self.snapshot_every == 0:
+            from bubble_store import snapshot_engine
+            self.snapshots[self.total] = snapshot_engine(engine, include_log=False)
+            if self.keep_snapshots and len(self.snapshots) > self.keep_snapshots:
+                self.compact(self.keep_snapshots)
+
+    def compact(self, keep=1):
+        """只保留最近 keep 个快照，丢弃最早保留的快照之前的事件"""
+        kept = sorted(self.snapshots)[-keep:] if keep else []
+        if not kept:
+            return
+        start = kept[0]
+        del self.events[:start - self.base]
+        self.base = start
+        self.snapshots = {index: self.snapshots[index] for index in kept}
+
+    def iter_events(self, start, end):
+        """第 start 到 end 步之间的事件：('swap', pos1, pos2) 或 ('shuffle',)"""
+        if start < self.base:
+            raise ValueError(f"第 {start} 步之前的记录已被压缩")
+        cols = self.cols
+        for event in self.events[start - self.base:end - self.base]:
+            if event == SHUFFLE_EVENT:
+                yield ('shuffle',)
+            else:
+                row, col = divmod(event >> 1, cols)
+                yield ('swap', (row, col), (row + 1, col) if event & 1 else (row, col + 1))
+
+    def to_bytes(self):
+        header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, self.seed, self.rows, self.cols, self.block_size,
+                              self.special_chance, self.snapshot_every, self.keep_snapshots,
+                              self.base, len(self.events), len(self.snapshots), self.min_moves, self.powers)
+        events = array('H', self.events)
+        if sys.byteorder == 'big':
+            events.byteswap()
+        parts = [header, events.tobytes()]
+        for index in sorted(self.snapshots):
+            data = self.snapshots[index]
+            parts.append(_SNAPSHOT_HEADER.pack(index, len(data)))
+            parts.append(data)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        log, _ = cls.unpack_from(data, 0)
+        return log
+
+    @classmethod
+    def unpack_from(cls, data, offset):
+        """从 data[offset:] 解析记录，返回 (记录, 结束位置)"""
+        (magic, version, seed, rows, cols, block_size, special_chance, snapshot_every, keep_snapshots,
+         base, count, snapshot_count) = _HEADER_V1.unpack_from(data, offset)
+        if magic != _MAGIC or version not in (1, 2, _FORMAT_VERSION):
+            raise ValueError(f"无法识别的对局记录: {magic!r} v{version}")
+        min_moves = 0
+        powers = False
+        if version == 1:
+            offset += _HEADER_V1.size
+        elif version == 2:
+            min_moves = _HEADER_V2.unpack_from(data, offset)[-1]
+            offset += _HEADER_V2.size
+        else:
+            min_moves, powers = _HEADER.unpack_from(data, offset)[-2:]
+            offset += _HEADER.size
+        log = cls(seed, rows, cols, block_size, special_chance, snapshot_every, keep_snapshots, min_moves,
+                  bool(powers))
+        log.base = base
+        log.events.frombytes(bytes(data[offset:offset + 2 * count]))
+        if sys.byteorder == 'big':
+            log.events.byteswap()
+        offset += 2 * count
+        for _ in range(snapshot_count):
+            index, size = _SNAPSHOT_HEADER.unpack_from(data, offset)
+            offset += _SNAPSHOT_HEADER.size
+            log.snapshots[index] = bytes(data[offset:offset + size])
+            offset += size
+        return log, offset
+
+
+# 重放
+def replay(log, upto=None, backend=None, rules=None):
+    """重建第 upto 步（默认最后一步）之后的引擎，从不晚于 upto 的最近快照开始重放
+
+    从种子开局时使用 backend；从快照恢复时沿用快照里的后端。
+    """
+    from bubble_store import restore_engine
+
+    end = log.total if upto is None else upto
+    if not log.base <= end <= log.total:
+        raise ValueError(f"只能重放第 {log.base} 到 {log.total} 步，而不是第 {end} 步")
+
+    start = max((index for index in log.snapshots if index <= end), default=None)
+    if start is None:
+        if log.base:
+            raise ValueError(f"第 {log.base} 步之前的记录已被压缩")
+        start = 0
+        engine = log.new_engine(backend, rules)
+    else:
+        engine = restore_engine(log.snapshots[start], rules)
+
+    for move, event in enumerate(log.iter_events(start, end), start + 1):
+        if event[0] == 'shuffle':
+            engine.shuffle()
+            continue
+        result = engine.swap(event[1], event[2])
+        if not result.ok:
+            raise ValueError(f"第 {move} 步的交换 {event[1]}<->{event[2]} 在重放时不合法（{result.status}）")
+    return engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="重放 Love Bubble 对局记录")
+    parser.add_argument('path', help="MoveLog.to_bytes() 写出的文件")
+    parser.add_argument('--upto', type=int, default=None, help="重放到第几步，默认最后一步")
+    args = parser.parse_args(argv)
+
+    with open(args.path, 'rb') as f:
+        log = MoveLog.from_bytes(f.read())
+    engine = replay(log, args.upto)
+    state = engine.state
+    print(f"种子 {log.seed}，第 {log.base}-{log.total} 步可重放，{len(log.snapshots)} 个快照")
+    print(f"分数 {state.score}  等级 {state.level}  交换 {state.moves}  最高连击 {state.max_combo}")
+    for row in engine.emoji_grid():
+        print(' '.join(row))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""Love Bubble 蒙特卡洛模拟器
+
+用多进程批量对局，统计每步得分、连锁深度、特殊泡泡产出和升级所需步数的分布，
+用于调整 auto_clear_bubbles 的计分常数和升级曲线。
+
+    python bubble_sim.py --games 100000 --policy greedy --workers 8 --out sim.parquet
+    python bubble_sim.py --games 10000 --min-moves 3 --powers     # 与界面默认的规则相同
+"""
+import argparse
+import importlib
+import importlib.util
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from bubble_engine import BoardEngine, ScoreRules
+
+# 输出表的列
+DISTRIBUTION_COLUMNS = ['metric', 'key', 'value', 'count']
+
+
+# 随机策略
+def random_policy(engine, rng):
+    """从合法交换中均匀随机选一个"""
+    moves = sorted(engine.legal_moves.moves)
+    return rng.choice(moves) if moves else None
+
+
+# 提示策略
+def hint_policy(engine, rng):
+    """总是采用引擎给出的提示"""
+    return engine.hint()
+
+
+# 贪心策略
+def greedy_policy(engine, rng):
+    """选择第一轮直接消除最多泡泡的交换"""
+    grid = engine.grid
+    backend = engine.backend
+    best, best_cleared = None, -1
+    for pair in sorted(engine.legal_moves.moves):
+        backend.swap(grid, *pair)
+        groups, _ = backend.find_groups_near(grid, set(pair))
+        backend.swap(grid, *pair)
+        cleared = sum(len(group) for group in groups)
+        if cleared > best_cleared:
+            best, best_cleared = pair, cleared
+    return best
+
+
+# 前瞻策略的搜索深度（深度 2 每步约 20 ms）
+LOOKAHEAD_DEPTH = 2
+
+
+# 前瞻策略
+def lookahead_policy(engine, rng):
+    """bubble_solver 的 expectimax 搜索，固定搜到 LOOKAHEAD_DEPTH 层
+
+    不设时间预算：按时间截止的搜索结果取决于 CPU 快慢和负载，同一个种子就不再得到同样的对局。
+    """
+    from bubble_solver import best_move
+    return best_move(engine.state, float('inf'), max_depth=LOOKAHEAD_DEPTH, rules=engine.rules,
+                     seed=rng.getrandbits(32), powers=engine.powers, min_moves=engine.min_moves).move
+
+
+POLICIES = {
+    'random': random_policy,
+    'greedy': greedy_policy,
+    'hint': hint_policy,
+    'lookahead': lookahead_policy,
+}
+
+
+# 解析策略名
+def resolve_policy(name):
+    """内置策略名，或 'module:function' 形式的自定义策略"""
+    if name in POLICIES:
+        return POLICIES[name]
+    if ':' in name:
+        module_name, func_name = name.split(':', 1)
+        return getattr(importlib.import_module(module_name), func_name)
+    raise ValueError(f"未知的策略: {name}")
+
+
+# (指标, 键) -> Counter
+class _CounterTable(dict):
+    def __missing__(self, key):
+        value = self[key] = Counter()
+        return value
+
+
+# 单局模拟
+def play_game(seed, policy, config, stats):
+    """用给定种子完整地打一局，把每步的数据累加进 stats"""
+    seeder = random.Random(seed)
+    engine = BoardEngine(
+        config['rows'], config['cols'],
+        rng=random.Random(seeder.getrandbits(64)),
+        backend=config['backend'],
+        rules=ScoreRules(**config['rules']),
+        min_moves=config.get('min_moves', 0),
+        powers=config.get('powers', False),
+    )
+    policy_rng = random.Random(seeder.getrandbits(64))
+    score_bin = config['score_bin']
+
+    for move in range(1, config['moves'] + 1):
+        pair = policy(engine, policy_rng)
+        if pair is None:
+            stats['game_end', 'stuck'][move] += 1
+            break
+        previous_level = engine.state.level
+        result = engine.swap(*pair)
+        if not result.ok:
+            stats['invalid_move', config['policy']][result.status] += 1
+            continue
+
+        stats['score_per_move', ''][result.score_gained // score_bin * score_bin] += 1
+        stats['cascade_depth', ''][result.combo_rounds] += 1
+        stats['specials_per_move', ''][sum(result.specials.values())] += 1
+        for bubble, count in result.specials.items():
+            stats['specials_by_type', bubble][count] += 1
+        for bubble, count in Counter(result.powers).items():
+            stats['powers_by_type', bubble][count] += 1
+        if result.reshuffled:
+            stats['reshuffle', ''][move] += 1
+        if result.level_up:
+            # 一步跨过多级时，中间的每一级也是在这一步达到的
+            for level in range(previous_level + 1, result.level + 1):
+                stats['time_to_level', str(level)][move] += 1
+
+    stats['final_score', ''][engine.state.score // score_bin * score_bin] += 1
+    stats['final_level', ''][engine.state.level] += 1
+
+
+# 一批对局（在子进程中运行）
+def run_chunk(chunk_id, first_seed, count, config):
+    """模拟 count 局（种子连续），返回这一批的分布表"""
+    policy = resolve_policy(config['policy'])
+    stats = _CounterTable()
+    for seed in range(first_seed, first_seed + count):
+        play_game(seed, policy, config, stats)
+
+    rows = []
+    for (metric, key), counter in stats.items():
+        for value, n in counter.items():
+            rows.append((metric, key, value, n))
+    frame = pd.DataFrame(rows, columns=DISTRIBUTION_COLUMNS)
+    frame['value'] = frame['value'].astype(str)
+    frame.insert(0, 'chunk', chunk_id)
+    return frame
+
+
+# 流式写出
+class _DistributionWriter:
+    """按批追加写出 CSV 或 Parquet"""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        self._writer = None
+        self._header = True
+
+    def write(self, frame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+# 合并各批结果
+def merge_distributions(frame):
+    """把逐批的分布合并成总分布"""
+    merged = frame.groupby(['metric', 'key', 'value'], as_index=False)['count'].sum()
+    numeric = pd.to_numeric(merged['value'], errors='coerce')
+    merged = merged.assign(_order=numeric).sort_values(['metric', 'key', '_order', 'value'])
+    return merged.drop(columns='_order').reset_index(drop=True)
+
+
+# 运行整个模拟
+def simulate(games, config, workers=None, chunk_size=1000, seed=0, out=None):
+    """多进程模拟 games 局，返回合并后的分布；给定 out 时逐批写出原始分布"""
+    workers = workers or os.cpu_count() or 1
+    chunks = [(chunk_id, seed + start, min(chunk_size, games - start))
+              for chunk_id, start in enumerate(range(0, games, chunk_size))]
+
+    writer = _DistributionWriter(out) if out else None
+    frames = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_chunk, chunk_id, first_seed, count, config)
+                       for chunk_id, first_seed, count in chunks]
+            # 按提交顺序取结果，原始分布的行序只取决于种子，与各进程完成的先后无关
+            for future in futures:
+                frame = future.result()
+                frames.append(frame)
+                if writer:
+                    writer.write(frame)
+    finally:
+        if writer:
+            writer.close()
+
+    if not frames:
+        return pd.DataFrame(columns=DISTRIBUTION_COLUMNS)
+    return merge_distributions(pd.concat(frames, ignore_index=True))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Love Bubble 蒙特卡洛模拟")
+    parser.add_argument('--games', type=int, default=10000, help="对局数")
+    parser.add_argument('--moves', type=int, default=50, help="每局步数")
+    parser.add_argument('--policy', default='random', help="random / greedy / hint / lookahead / module:function")
+    parser.add_argument('--rows', type=int, default=7)
+    parser.add_argument('--cols', type=int, default=6)
+    parser.add_argument('--backend', default='list', choices=['list', 'numpy', 'compact', 'bitboard'])
+    parser.add_argument('--min-moves', type=int, default=0,
+                        help="新盘面没有现成组合且至少有这么多合法交换（界面默认 3）；0 为逐格独立抽取")
+    parser.add_argument('--powers', action='store_true', help="开启特殊泡泡的效果（界面默认开启）")
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认 CPU 核数")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="每个任务包含的对局数")
+    parser.add_argument('--seed', type=int, default=0, help="第一局的种子，之后依次 +1")
+    parser.add_argument('--score-bin', type=int, default=10, help="分数分布的分桶宽度")
+    parser.add_argument('--per-bubble', type=int, default=None)
+    parser.add_argument('--per-combo', type=int, default=None)
+    parser.add_argument('--per-level', type=int, default=None)
+    parser.add_argument('--points-per-level', type=int, default=None)
+    parser.add_argument('--out', default=None, help="逐批写出的原始分布（.csv 或 .parquet，后者需要 pyarrow）")
+    parser.add_argument('--summary', default=None, help="合并后的分布（.csv 或 .parquet）")
+    args = parser.parse_args(argv)
+
+    # .parquet 需要 pyarrow（不在 requirements.txt 里），在启动子进程之前检查
+    if any(path and path.endswith('.parquet') for path in (args.out, args.summary)):
+        if importlib.util.find_spec('pyarrow') is None:
+            parser.error("写 .parquet 需要 pyarrow（pip install pyarrow），或改用 .csv 输出")
+
+    rules = ScoreRules().to_dict()
+    for name in rules:
+        value = getattr(args, name)
+        if value is not None:
+            rules[name] = value
+
+    config = {
+        'rows': args.rows,
+        'cols': args.cols,
+        'moves': args.moves,
+        'policy': args.policy,
+        'backend': args.backend,
+        'min_moves': args.min_moves,
+        'powers': args.powers,
+        'score_bin': args.score_bin,
+        'rules': rules,
+    }
+    resolve_policy(args.policy)
+
+    started = time.perf_counter()
+    merged = simulate(args.games, config, args.workers, args.chunk_size, args.seed, args.out)
+    elapsed = time.perf_counter() - started
+
+    if args.summary:
+        if args.summary.endswith('.parquet'):
+            merged.to_parquet(args.summary, index=False)
+        else:
+            merged.to_csv(args.summary, index=False)
+
+    print(f"{args.games} 局 / {elapsed:.2f}s ({args.games / elapsed:.0f} 局/秒)")
+    for metric in ('score_per_move', 'cascade_depth', 'specials_per_move', 'final_level'):
+        part = merged[merged['metric'] == metric]
+        if not part.empty:
+            values = pd.to_numeric(part['value'])
+            mean = (values * part['count']).sum() / part['count'].sum()
+            print(f"  {metric}: 均值 {mean:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+"""前瞻搜索的自动游玩 / 提示求解器
+
+交换是玩家节点（取最大），消除后的随机补充是机会节点（抽样求期望），得分按
+auto_clear_bubbles 的公式逐轮累计。规则与引擎一致：powers 为真时 🌈/💎/⭐ 的效果同
+power_cells，min_moves 大于 0 时无路可走的局面按重新排列出的新盘面抽样估值。局面键是盘面的 Zobrist 哈希加上等级和各列补充序列的
+读取位置，搜索过的局面存进有界的置换表（最久未用的先淘汰，每次搜索开始时清空）。
+在时间预算内逐层加深，返回最深一层完整搜索的结果。
+
+    result = best_move(engine.state, budget_ms=100)
+    result.move, result.depth, result.nodes_per_sec, result.hit_rate
+
+    python bubble_solver.py --moves 30 --budget 100     # 自动打一局并打印搜索统计
+"""
+import argparse
+import random
+import time
+from collections import OrderedDict
+
+from bubble_engine import (DEFAULT_RULES, DIAMOND, MIN_GROUP_SIZE, NORMAL_BUBBLES, RAINBOW, SPECIAL_BUBBLES,
+                           SPECIAL_CHANCE_INITIAL, SPECIAL_CHANCE_REFILL, STAR, solvable_board)
+
+# 编码与 bubble_grid_np 相同：0 为空位，1..6 普通泡泡，7..11 特殊泡泡
+_CODE_COUNT = 1 + len(NORMAL_BUBBLES) + len(SPECIAL_BUBBLES)
+_FIRST_SPECIAL = 1 + len(NORMAL_BUBBLES)
+_RAINBOW = _FIRST_SPECIAL + SPECIAL_BUBBLES.index(RAINBOW)
+_DIAMOND = _FIRST_SPECIAL + SPECIAL_BUBBLES.index(DIAMOND)
+_STAR = _FIRST_SPECIAL + SPECIAL_BUBBLES.index(STAR)
+
+
+class _Timeout(Exception):
+    pass
+
+
+# 盘面 -> 每格一字节的编码
+def board_cells(grid):
+    """接受表情列表、CompactGrid 或 NumPy 编码数组，返回 (行, 列, bytearray)"""
+    if hasattr(grid, 'cells'):
+        return grid.rows, grid.cols, bytearray(grid.cells)
+    if hasattr(grid, 'tobytes'):
+        rows, cols = grid.shape
+        return rows, cols, bytearray(grid.tobytes())
+    from bubble_grid_np import CODE_OF
+    rows, cols = len(grid), len(grid[0])
+    return rows, cols, bytearray(CODE_OF.get(bubble, 0) for row in grid for bubble in row)
+
+
+# 有界置换表
+class TranspositionTable:
+    """局面键 -> (剩余深度, 期望得分, 最佳交换)，超过 max_entries 时淘汰最久未用的条目"""
+
+    def __init__(self, max_entries=200000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.probes = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def probe(self, key, depth):
+        """返回 (命中的值或 None, 记录的最佳交换或 None)；记录的深度不小于 depth 才算命中"""
+        self.probes += 1
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, None
+        self._entries.move_to_end(key)
+        if entry[0] >= depth:
+            self.hits += 1
+            return entry[1], entry[2]
+        return None, entry[2]
+
+    def store(self, key, depth, value, move):
+        entries = self._entries
+        old = entries.get(key)
+        if old is not None and old[0] > depth:
+            return
+        entries[key] = (depth, value, move)
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+
+# 搜索结果
+class SearchResult:
+    """best_move 的结果与统计"""
+
+    def __init__(self):
+        self.move = None              # (pos1, pos2)，无路可走时为 None
+        self.value = 0.0              # 按搜索深度累计的期望得分
+        self.depth = 0                # 完整搜索的层数
+        self.values = {}              # 根节点每个交换的期望得分（最深一层）
+        self.nodes = 0                # 模拟过的局面数
+        self.elapsed = 0.0
+        self.probes = 0
+        self.hits = 0
+        self.timed_out = False
+
+    @property
+    def nodes_per_sec(self):
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def to_dict(self):
+        return {
+            'move': self.move,
+            'value': self.value,
+            'depth': self.depth,
+            'nodes': self.nodes,
+            'elapsed_ms': self.elapsed * 1000,
+            'nodes_per_sec': self.nodes_per_sec,
+            'hit_rate': self.hit_rate,
+            'timed_out': self.timed_out,
+        }
+
+
+# 期望最大化求解器
+class Solver:
+    """逐层加深的 expectimax；samples 是每个机会节点抽样的补充序列数
+
+    powers、min_moves 与 BoardEngine 的同名参数相同，要和被分析的对局一致。
+    """
+
+    def __init__(self, max_depth=4, samples=3, table_size=200000, rules=None,
+                 special_chance=SPECIAL_CHANCE_REFILL, seed=0, powers=False, min_moves=0):
+        self.max_depth = max_depth
+        self.samples = samples
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.special_chance = special_chance
+        self.powers = powers
+        self.min_moves = min_moves
+        self.table = TranspositionTable(table_size)
+        self.rng = random.Random(seed)
+        self._shape = None
+
+    def best_move(self, state, budget_ms=100):
+        """在 budget_ms 毫秒内搜索 state（GameState）的最佳交换"""
+        started = time.perf_counter()
+        self._deadline = started + budget_ms / 1000
+        self._nodes = 0
+        probes, hits = self.table.probes, self.table.hits
+        # 每次搜索重新抽样补充序列，上一次搜索的期望值不再适用
+        self.table.clear()
+        rows, cols, cells = board_cells(state.grid)
+        self._prepare(rows, cols)
+        # 每个样本是一组按列的补充序列，同一次搜索里所有机会节点共用（公共随机数），
+        # 于是落在不同列、先后顺序不同的两步交换会走到同一个局面，在置换表里命中
+        self._streams = [[[] for _ in range(cols)] for _ in range(self.samples)]
+
+        result = SearchResult()
+        moves = self._legal_moves(cells)
+        if moves:
+            result.move = moves[0]
+            order = list(moves)
+            for depth in range(1, self.max_depth + 1):
+                try:
+                    values = {}
+                    for move in order:
+                        # 根节点的盘面可能带着现成的组合（刚重新排列过），第一次结算整盘扫描
+                        values[move] = self._chance(cells, move, depth, state.level, [0] * cols, root=True)
+                except _Timeout:
+                    result.timed_out = True
+                    break
+                best = max(order, key=lambda move: values[move])
+                result.move, result.value, result.depth, result.values = best, values[best], depth, values
+                order = sorted(order, key=lambda move: -values[move])
+
+        result.elapsed = time.perf_counter() - started
+        result.nodes = self._nodes
+        result.probes = self.table.probes - probes
+        result.hits = self.table.hits - hits
+        return result
+
+    def _prepare(self, rows, cols):
+        if self._shape == (rows, cols):
+            return
+        self._shape = (rows, cols)
+        size = rows * cols
+        zobrist_rng = random.Random(rows * 1000 + cols)
+        self._zobrist = [zobrist_rng.getrandbits(64) for _ in range(size * _CODE_COUNT)]
+        self._neighbors = []
+        for index in range(size):
+            row, col = divmod(index, cols)
+            self._neighbors.append(tuple(
+                r * cols + c for r, c in ((row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1))
+                if 0 <= r < rows and 0 <= c < cols))
+        self._pairs = []
+        for index in range(size):
+            row, col = divmod(index, cols)
+            if col + 1 < cols:
+                self._pairs.append((index, index + 1))
+            if row + 1 < rows:
+                self._pairs.append((index, index + cols))
+
+    def _hash(self, cells):
+        zobrist = self._zobrist
+        key = 0
+        for index, code in enumerate(cells):
+            key ^= zobrist[index * _CODE_COUNT + code]
+        return key
+
+    def _component(self, cells, start, limit=None):
+        target = cells[start]
+        if target == 0:
+            return ()
+        neighbors = self._neighbors
+        seen = {start}
+        stack = [start]
+        while stack:
+            for neighbor in neighbors[stack.pop()]:
+                if neighbor not in seen and cells[neighbor] == target:
+                    seen.add(neighbor)
+                    if limit is not None and len(seen) >= limit:
+                        return seen
+                    stack.append(neighbor)
+        return seen
+
+    def _legal_moves(self, cells):
+        """[(pos1, pos2)]，按行优先排序"""
+        cols = self._shape[1]
+        moves = []
+        for a, b in self._pairs:
+            if cells[a] == cells[b]:
+                continue
+            cells[a], cells[b] = cells[b], cells[a]
+            legal = (len(self._component(cells, a, MIN_GROUP_SIZE)) >= MIN_GROUP_SIZE
+                     or len(self._component(cells, b, MIN_GROUP_SIZE)) >= MIN_GROUP_SIZE)
+            cells[a], cells[b] = cells[b], cells[a]
+            if legal:
+                moves.append((divmod(a, cols), divmod(b, cols)))
+        return moves
+
+    def _draw(self):
+        rng = self.rng
+        if rng.random() < self.special_chance:
+            return rng.randrange(_FIRST_SPECIAL, _CODE_COUNT)
+        return rng.randrange(1, _FIRST_SPECIAL)
+
+    def _power_cells(self, cells, group):
+        """与 bubble_engine.power_cells 相同的效果，group 为扁平下标"""
+        code = cells[group[0]]
+        rows, cols = self._shape
+        if code == _RAINBOW:
+            # 同样多时取编码小的，即 NORMAL_BUBBLES 中靠前的
+            color = max(range(1, _FIRST_SPECIAL), key=cells.count)
+            return [index for index, value in enumerate(cells) if value == color]
+        if code != _DIAMOND and code != _STAR:
+            return ()
+        center_row, center_col = divmod(sorted(group)[len(group) // 2], cols)
+        if code == _DIAMOND:
+            if all(index // cols == center_row for index in group):
+                return range(center_row * cols, (center_row + 1) * cols)
+            return range(center_col, rows * cols, cols)
+        return [row * cols + col
+                for row in range(max(center_row - 1, 0), min(center_row + 2, rows))
+                for col in range(max(center_col - 1, 0), min(center_col + 2, cols))]
+
+    def _resolve(self, cells, dirty, level, stream, drawn):
+        """就地结算连锁，第 col 列的补充依次取自 stream[col][drawn[col]:]，返回得分"""
+        cols = self._shape[1]
+        score = 0
+        combo = 0
+        while True:
+            visited = set()
+            removed = []
+            groups = []
+            for index in sorted(dirty):
+                if index in visited:
+                    continue
+                connected = self._component(cells, index)
+                visited.update(connected)
+                if len(connected) >= MIN_GROUP_SIZE:
+                    removed.extend(connected)
+                    groups.append(list(connected))
+            if not removed:
+                return score
+            if self.powers:
+                # 效果按本轮消除前的盘面计算，被波及的特殊泡泡不再连锁触发
+                cleared = set(removed)
+                for group in groups:
+                    for index in self._power_cells(cells, group):
+                        if index not in cleared:
+                            cleared.add(index)
+                            removed.append(index)
+
+            score += self.rules.round_score(len(removed), combo, level)
+            combo += 1
+
+            lowest = {}
+            for index in removed:
+                row, col = divmod(index, cols)
+                if row > lowest.get(col, -1):
+                    lowest[col] = row
+            gone = set(removed)
+            dirty = []
+            for col in sorted(lowest):
+                bottom = lowest[col]
+                column = range(col, (bottom + 1) * cols, cols)
+                kept = [cells[index] for index in column if index not in gone]
+                start = drawn[col]
+                drawn[col] = end = start + bottom + 1 - len(kept)
+                codes = stream[col]
+                while len(codes) < end:
+                    codes.append(self._draw())
+                for index, code in zip(column, codes[start:end] + kept):
+                    cells[index] = code
+                dirty.extend(column)
+
+    def _chance(self, cells, move, depth, level, drawn, root=False):
+        """交换 move 后对补充抽样，返回 本步得分 + 之后 depth - 1 层的期望得分"""
+        rows, cols = self._shape
+        (r1, c1), (r2, c2) = move
+        a, b = r1 * cols + c1, r2 * cols + c2
+        dirty = range(rows * cols) if root else (a, b)
+        total = 0.0
+        for stream in self._streams:
+            if time.perf_counter() > self._deadline:
+                raise _Timeout()
+            child = bytearray(cells)
+            child[a], child[b] = child[b], child[a]
+            child_drawn = list(drawn)
+            total += self._resolve(child, dirty, level, stream, child_drawn)
+            self._nodes += 1
+            if depth > 1:
+                total += self._max(child, depth - 1, level, child_drawn)
+        return total / len(self._streams)
+
+    def _max(self, cells, depth, level, drawn):
+        # 同样的格子，补充序列读到的位置或计分的等级不同，之后的期望得分也不同；
+        # 两步落在不同列的交换先后互换时 drawn 相同，仍然能在表里命中
+        key = (self._hash(cells), level, tuple(drawn))
+        value, hinted = self.table.probe(key, depth)
+        if value is not None:
+            return value
+        moves = self._legal_moves(cells)
+        if not moves:
+            # 无路可走时游戏会自动重新排列：min_moves 为 0 时按 0 分处理，否则对新盘面抽样
+            value = self._reshuffle(depth, level, drawn) if self.min_moves else 0.0
+            self.table.store(key, depth, value, None)
+            return value
+        if hinted in moves:
+            moves.remove(hinted)
+            moves.insert(0, hinted)
+        best_value, best_move = -1.0, None
+        for move in moves:
+            value = self._chance(cells, move, depth, level, drawn)
+            if value > best_value:
+                best_value, best_move = value, move
+        self.table.store(key, depth, best_value, best_move)
+        return best_value
+
+    def _reshuffle(self, depth, level, drawn):
+        """重新排列出的盘面由引擎随机流里的种子决定，这里抽 samples 个求平均；新盘面至少有 min_moves 个合法交换"""
+        rows, cols = self._shape
+        key = (rows, cols, SPECIAL_CHANCE_INITIAL, self.min_moves)
+        total = 0.0
+        for _ in range(self.samples):
+            _, _, cells = board_cells(solvable_board(key, self.rng.getrandbits(64)))
+            total += self._max(cells, depth, level, drawn)
+        return total / self.samples
+
+
+# 便捷入口
+def best_move(state, budget_ms=100, **options):
+    """用一个新的求解器搜索 state 的最佳交换，options 传给 Solver"""
+    return Solver(**options).best_move(state, budget_ms)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用前瞻搜索自动打一局 Love Bubble，打印每步的搜索统计")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--moves', type=int, default=30)
+    parser.add_argument('--budget', type=float, default=100, help="每步的搜索预算（毫秒）")
+    parser.add_argument('--depth', type=int, default=4, help="最大搜索层数")
+    parser.add_argument('--samples', type=int, default=3, help="每个机会节点的补充序列数")
+    parser.add_argument('--table-size', type=int, default=200000)
+    parser.add_argument('--min-moves', type=int, default=0,
+                        help="新盘面没有现成组合且至少有这么多合法交换（界面默认 3）；0 为逐格独立抽取")
+    parser.add_argument('--powers', action='store_true', help="开启特殊泡泡的效果（界面默认开启）")
+    args = parser.parse_args(argv)
+
+    from bubble_replay import seeded_engine
+
+    engine = seeded_engine(args.seed, backend='compact', min_moves=args.min_moves, powers=args.powers)
+    solver = Solver(args.depth, args.samples, args.table_size, seed=args.seed,
+                    powers=args.powers, min_moves=args.min_moves)
+    nodes = elapsed = probes = hits = 0
+    for move in range(1, args.moves + 1):
+        result = solver.best_move(engine.state, args.budget)
+        if result.move is None:
+            engine.shuffle()
+            continue
+        cascade = engine.swap(*result.move)
+        nodes, elapsed = nodes + result.nodes, elapsed + result.elapsed
+        probes, hits = probes + result.probes, hits + result.hits
+        print(f"{move:3d} {result.move}  深度 {result.depth}  预计 {result.value:7.1f}  实得 {cascade.score_gained:5d}"
+              f"  {result.nodes_per_sec:8.0f} 节点/秒  命中率 {result.hit_rate:.1%}")
+    print(f"分数 {engine.state.score}  平均 {nodes / elapsed if elapsed else 0:.0f} 节点/秒"
+          f"  置换表命中率 {hits / probes if probes else 0:.1%}  条目 {len(solver.table)}  淘汰 {solver.table.evictions}")
+
+
+if __name__ == '__main__':
+    main()
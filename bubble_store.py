@@ -0,0 +1,435 @@
+"""按玩家令牌保存对局的外部状态存储
+
+多个 Streamlit 进程共享同一个存储，玩家重连到别的进程时可以从快照恢复对局。
+
+    store = open_store("sqlite:///love_bubble_sessions.db")
+    version = store.save(token, snapshot_engine(engine), expected_version=0)
+    version, data = store.load(token)
+    engine = restore_engine(data)
+
+存储只需实现 load / save / save_many / delete / close，换成网络 KV（Redis 等）时
+用 GET 和带版本检查的 SET（WATCH/MULTI 或 Lua 脚本）实现同样的语义即可。
+"""
+import logging
+import random
+import sqlite3
+import struct
+import threading
+import time
+
+from bubble_engine import SPECIAL_BUBBLES, BoardEngine, GameState, get_backend
+
+logger = logging.getLogger(__name__)
+
+# 快照格式
+_MAGIC = b'LB'
+_FORMAT_VERSION = 4
+_BACKENDS = ['list', 'numpy', 'compact', 'bitboard']
+# 魔数, 格式版本, 后端, 行, 列, 分数, 等级, 连击, 最高连击, 交换次数, 特殊泡泡 x5
+_HEADER = struct.Struct('<2sBBHHQIIII' + 'I' * len(SPECIAL_BUBBLES))
+# Mersenne Twister 状态：版本, 624 个字 + 下标, 是否有 gauss_next, gauss_next
+_MT_STATE = struct.Struct('<B625I?d')
+# 补充流：特殊概率, 块大小, 游标, 是否已抽块, PCG64 state/inc（各 128 位）, has_uint32, uinteger
+_REFILL_STATE = struct.Struct('<dII?16s16s?I')
+
+
+# 版本冲突
+class VersionConflict(Exception):
+    """保存时存储中的版本与期望版本不一致（另一个进程或标签页已经写过）"""
+
+    def __init__(self, token, expected, actual):
+        super().__init__(f"玩家 {token} 的状态版本冲突: 期望 {expected}，实际 {actual}")
+        self.token = token
+        self.expected = expected
+        self.actual = actual
+
+
+# 引擎 -> 二进制快照
+def snapshot_engine(engine, include_log=True):
+    """把对局压成一段 bytes：状态头 + 每格一字节的盘面 + 两个随机流的状态 + 对局记录（如果有）"""
+    from bubble_grid_np import CODE_OF, EMPTY
+
+    state = engine.state
+    backend = engine.backend.name
+    cells = bytes(CODE_OF.get(bubble, EMPTY) for row in engine.emoji_grid() for bubble in row)
+    header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, _BACKENDS.index(backend), state.rows, state.cols,
+                          state.score, state.level, state.combo, state.max_combo, state.moves,
+                          *(state.special_bubbles_collected[bubble] for bubble in SPECIAL_BUBBLES))
+
+    version, words, gauss = engine.rng.getstate()
+    rng_state = _MT_STATE.pack(version, *words, gauss is not None, gauss or 0.0)
+
+    refill = engine.refill.__getstate__()
+    pcg = refill['generator']
+    refill_state = _REFILL_STATE.pack(refill['special_chance'], refill['block_size'], refill['pos'],
+                                      refill['drawn'], pcg['state']['state'].to_bytes(16, 'little'),
+                                      pcg['state']['inc'].to_bytes(16, 'little'),
+                                      bool(pcg['has_uint32']), pcg['uinteger'])
+    data = (header + cells + rng_state + refill_state
+            + struct.pack('<dHB', engine.special_chance, engine.min_moves, engine.powers))
+    if include_log and engine.log is not None:
+        data += engine.log.to_bytes()
+    return data
+
+
+# 二进制快照 -> 引擎
+def restore_engine(data, rules=None):
+    """从 snapshot_engine 的结果重建引擎，之后的随机序列与保存时完全一致"""
+    from bubble_grid_np import BUBBLE_CODES, RefillStream
+
+    fields = _HEADER.unpack_from(data, 0)
+    magic, format_version, backend_index, rows, cols = fields[:5]
+    if magic != _MAGIC or format_version not in (1, 2, 3, _FORMAT_VERSION):
+        raise ValueError(f"无法识别的快照格式: {magic!r} v{format_version}")
+    score, level, combo, max_combo, moves = fields[5:10]
+    specials = fields[10:]
+
+    offset = _HEADER.size
+    cells = data[offset:offset + rows * cols]
+    offset += rows * cols
+
+    mt = _MT_STATE.unpack_from(data, offset)
+    offset += _MT_STATE.size
+    rng = random.Random()
+    rng.setstate((mt[0], tuple(mt[1:626]), mt[627] if mt[626] else None))
+
+    special_chance, block_size, pos, drawn, pcg_state, pcg_inc, has_uint32, uinteger = \
+        _REFILL_STATE.unpack_from(data, offset)
+    offset += _REFILL_STATE.size
+    refill = RefillStream.__new__(RefillStream)
+    refill.__setstate__({
+        'special_chance': special_chance,
+        'block_size': block_size,
+        'pos': pos,
+        'drawn': drawn,
+        'generator': {
+            'bit_generator': 'PCG64',
+            'state': {'state': int.from_bytes(pcg_state, 'little'), 'inc': int.from_bytes(pcg_inc, 'little')},
+            'has_uint32': int(has_uint32),
+            'uinteger': uinteger,
+        },
+    })
+    engine_special_chance, = struct.unpack_from('<d', data, offset)
+    offset += 8
+    # 第 3 版起记录新盘面的最少合法交换数
+    min_moves = 0
+    if format_version >= 3:
+        min_moves, = struct.unpack_from('<H', data, offset)
+        offset += 2
+    # 第 4 版起记录是否开启特殊泡泡效果
+    powers = False
+    if format_version >= 4:
+        powers = bool(data[offset])
+        offset += 1
+
+    # 第 2 版起快照末尾可以带对局记录
+    log = None
+    if len(data) > offset:
+        from bubble_replay import MoveLog
+        log, offset = MoveLog.unpack_from(data, offset)
+
+    backend = get_backend(_BACKENDS[backend_index])
+    emoji = [[BUBBLE_CODES[code] for code in cells[row * cols:(row + 1) * cols]] for row in range(rows)]
+    state = GameState(_grid_for_backend(backend, emoji), rows, cols)
+    state.score = score
+    state.level = level
+    state.combo = combo
+    state.max_combo = max_combo
+    state.moves = moves
+    state.special_bubbles_collected = dict(zip(SPECIAL_BUBBLES, specials))
+
+    # 重新排列后的盘面可能带着现成的可消除组合，所以恢复后的第一次结算仍做整盘扫描
+    return BoardEngine(rows, cols, state=state, rng=rng, backend=backend, refill=refill,
+                       special_chance=engine_special_chance, rules=rules, log=log, min_moves=min_moves,
+                       powers=powers)
+
+
+def _grid_for_backend(backend, emoji):
+    if backend.name == 'numpy':
+        from bubble_grid_np import encode_grid
+        return encode_grid(emoji)
+    if backend.name == 'compact':
+        from bubble_compact import pack_grid
+        return pack_grid(emoji)
+    if backend.name == 'bitboard':
+        from bubble_bitboard import pack_bitboard
+        return pack_bitboard(emoji)
+    return emoji
+
+
+# 进程内存储
+class MemoryStateStore:
+    """字典实现的存储，只在单进程内共享；也是网络 KV 实现的参照"""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def load(self, token):
+        """返回 (版本, 快照)，不存在时返回 None"""
+        with self._lock:
+            return self._rows.get(token)
+
+    def save(self, token, data, expected_version, new_version=None):
+        """期望版本一致时写入并返回新版本（默认期望版本 + 1），否则抛出 VersionConflict
+
+        新玩家的期望版本为 0。
+        """
+        return _single_outcome(self.save_many([(token, data, expected_version, new_version)])[token])
+
+    def save_many(self, items):
+        """批量写入 [(令牌, 快照, 期望版本, 新版本或 None)]，返回 {令牌: 新版本 或 VersionConflict}"""
+        results = {}
+        with self._lock:
+            for token, data, expected, version in items:
+                version = expected + 1 if version is None else version
+                actual = self._rows.get(token, (0, None))[0]
+                if actual != expected:
+                    results[token] = VersionConflict(token, expected, actual)
+                    continue
+                self._rows[token] = (version, bytes(data))
+                results[token] = version
+        return results
+
+    def delete(self, token):
+        with self._lock:
+            self._rows.pop(token, None)
+
+    def close(self):
+        pass
+
+
+# SQLite 存储
+class SQLiteStateStore:
+    """WAL 模式的 SQLite 存储，同一台机器上的多个进程可以共享一个数据库文件"""
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在检查点时 fsync，进程崩溃不会丢数据
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " token TEXT PRIMARY KEY,"
+            " version INTEGER NOT NULL,"
+            " data BLOB NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+
+    def load(self, token):
+        with self._lock:
+            row = self._conn.execute("SELECT version, data FROM sessions WHERE token = ?", (token,)).fetchone()
+        return None if row is None else (row[0], bytes(row[1]))
+
+    def save(self, token, data, expected_version, new_version=None):
+        return _single_outcome(self.save_many([(token, data, expected_version, new_version)])[token])
+
+    def save_many(self, items):
+        """一个事务写入一批快照（一次提交），返回 {令牌: 新版本 或 VersionConflict}"""
+        results = {}
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for token, data, expected, version in items:
+                    version = expected + 1 if version is None else version
+                    if expected == 0:
+                        cursor = conn.execute(
+                            "INSERT OR IGNORE INTO sessions (token, version, data, updated) VALUES (?, ?, ?, ?)",
+                            (token, version, bytes(data), now))
+                    else:
+                        cursor = conn.execute(
+                            "UPDATE sessions SET version = ?, data = ?, updated = ? WHERE token = ? AND version = ?",
+                            (version, bytes(data), now, token, expected))
+                    if cursor.rowcount == 1:
+                        results[token] = version
+                    else:
+                        row = conn.execute("SELECT version FROM sessions WHERE token = ?", (token,)).fetchone()
+                        results[token] = VersionConflict(token, expected, row[0] if row else 0)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return results
+
+    def delete(self, token):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _single_outcome(outcome):
+    """单条写入时把冲突作为异常抛出"""
+    if isinstance(outcome, VersionConflict):
+        raise outcome
+    return outcome
+
+
+# 延迟批量写入
+class WriteBehindStore:
+    """包装任意存储：save 立即返回，由后台线程定期把各令牌最新的快照批量写入
+
+    点击路径不再等待磁盘提交。同一令牌在两次刷新之间的多次保存折叠成一次写入
+    （期望版本取这一批中第一次保存的期望版本）。后台写入时发现的版本冲突记录在
+    conflicts 中，该令牌下一次 save 时抛出，调用方据此重新加载。
+
+    数据库错误（被锁住等）视为暂时的，整批放回下一轮再试；其他异常时逐条重写，
+    仍然写不进去的那条记入日志后丢弃（dropped 计数），并同样以版本冲突告知该令牌的调用方。
+    """
+
+    def __init__(self, store, interval=0.5):
+        self.store = store
+        self.interval = interval
+        self.conflicts = {}
+        self._pending = {}          # 令牌 -> (快照, 存储中的期望版本, 新版本)
+        self._inflight = {}         # 正在写入底层存储的一批
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="bubble-store-writer", daemon=True)
+        self._thread.start()
+
+    def load(self, token):
+        with self._lock:
+            entry = self._pending.get(token) or self._inflight.get(token)
+        if entry is not None:
+            data, _, version = entry
+            return version, data
+        return self.store.load(token)
+
+    def save(self, token, data, expected_version, new_version=None):
+        """登记写入并立即返回新版本"""
+        version = expected_version + 1 if new_version is None else new_version
+        with self._lock:
+            conflict = self.conflicts.pop(token, None)
+            if conflict is not None:
+                raise conflict
+            pending = self._pending.get(token)
+            if pending is not None:
+                if pending[2] != expected_version:
+                    raise VersionConflict(token, expected_version, pending[2])
+                base = pending[1]
+            else:
+                base = expected_version
+            self._pending[token] = (bytes(data), base, version)
+        return version
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """把积压的写入一次性交给底层存储，返回写入条数"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = dict(batch)
+            if not batch:
+                return 0
+            try:
+                results = self.store.save_many([(token, data, base, version)
+                                                for token, (data, base, version) in batch.items()])
+            except Exception:
+                self._requeue(batch)
+                raise
+            with self._lock:
+                self._inflight = {}
+                self._record_conflicts(results)
+            return len(batch)
+
+    def flush_each(self):
+        """逐条写入积压的快照，返回丢弃的条数；数据库错误的那条放回，其他异常的那条丢弃"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = dict(batch)
+            dropped = 0
+            for token, (data, base, version) in batch.items():
+                try:
+                    results = self.store.save_many([(token, data, base, version)])
+                except sqlite3.Error:
+                    self._requeue({token: (data, base, version)})
+                    continue
+                except Exception:
+                    logger.exception("无法写入玩家 %s 的快照（版本 %s），已丢弃", token, version)
+                    dropped += 1
+                    with self._lock:
+                        self._inflight.pop(token, None)
+                        self.dropped += 1
+                        # 存储里仍是 base 版本，调用方下一次保存时重新加载
+                        self.conflicts[token] = VersionConflict(token, version, base)
+                        self._pending.pop(token, None)
+                    continue
+                with self._lock:
+                    self._inflight.pop(token, None)
+                    self._record_conflicts(results)
+            return dropped
+
+    def _record_conflicts(self, results):
+        for token, outcome in results.items():
+            if isinstance(outcome, VersionConflict):
+                self.conflicts[token] = outcome
+                self._pending.pop(token, None)
+
+    def _requeue(self, batch):
+        """写入失败：放回积压队列；期间又有新保存的，新保存改为基于这一批的期望版本"""
+        with self._lock:
+            for token in batch:
+                self._inflight.pop(token, None)
+            for token, (data, base, version) in batch.items():
+                newer = self._pending.get(token)
+                if newer is None:
+                    self._pending[token] = (data, base, version)
+                else:
+                    self._pending[token] = (newer[0], base, newer[2])
+
+    def delete(self, token):
+        with self._lock:
+            self._pending.pop(token, None)
+            self.conflicts.pop(token, None)
+        self.store.delete(token)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        self.store.close()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # 数据库暂时被锁住等情况，积压的写入已放回，下一轮再试
+                pass
+            except Exception:
+                # 其他错误（某条快照无法写入等）不能让写入线程退出，逐条重写找出并丢弃写不进去的
+                logger.exception("批量写入失败，改为逐条写入")
+                try:
+                    self.flush_each()
+                except Exception:
+                    logger.exception("逐条写入失败")
+
+
+# 按 URL 打开存储
+def open_store(url, write_behind=True, interval=0.5):
+    """'sqlite:///path/to/file.db' 或 'memory://'；write_behind 为真时包一层延迟批量写入"""
+    if url.startswith('sqlite:///'):
+        store = SQLiteStateStore(url[len('sqlite:///'):])
+    elif url == 'memory://':
+        store = MemoryStateStore()
+    else:
+        raise ValueError(f"不支持的状态存储: {url}")
+    if write_behind:
+        store = WriteBehindStore(store, interval)
+    return store
@@ -1,8 +1,27 @@
 import streamlit as st
+import atexit
+import contextlib
 import random
 import time
 from datetime import datetime
 import json
+import os
+import functools
+import inspect
+import pickle
+import tempfile
+import uuid
+
+from bubble_analysis import AnalysisPool
+from bubble_assets import FONT_DIR, bootstrap_html, inline_html, load_manifest
+from bubble_board import bubble_board, cascade_timeline
+from bubble_boards import BoardPool
+from bubble_compact import deep_sizeof
+from bubble_engine import SPECIAL_CHANCE_INITIAL
+from bubble_replay import MoveLog, seeded_engine
+from bubble_hibernate import SessionCache, valid_token
+from bubble_metrics import open_metrics
+from bubble_store import VersionConflict, open_store, restore_engine, snapshot_engine
 
 # 页面配置
 st.set_page_config(
@@ -11,505 +30,219 @@ st.set_page_config(
     layout="wide"
 )
 
-# 增强版CSS - 优化锚点定位和视角保持
-st.markdown("""
-<style>
-    @import url('https://fonts.googleapis.com/css2?family=Quicksand:wght@300;400;600&display=swap');
-    
-    * {
-        font-family: 'Quicksand', sans-serif;
-    }
-    
-    /* 添加平滑滚动 */
-    html {
-        scroll-behavior: smooth;
-    }
-    
-    .main-header {
-        text-align: center;
-        background: linear-gradient(45deg, #ff9a9e, #fecfef, #ffa5d8);
-        padding: 25px;
-        border-radius: 20px;
-        margin-bottom: 20px;
-        box-shadow: 0 8px 32px rgba(255, 154, 158, 0.3);
-        animation: headerPulse 3s ease-in-out infinite;
-    }
-    
-    @keyframes headerPulse {
-        0%, 100% { transform: scale(1); }
-        50% { transform: scale(1.02); }
-    }
-    
-    .score-board {
-        background: linear-gradient(135deg, #667eea, #764ba2);
-        color: white;
-        padding: 20px;
-        border-radius: 15px;
-        text-align: center;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 15px rgba(118, 75, 162, 0.3);
-    }
-    
-    .score-board:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 8px 25px rgba(118, 75, 162, 0.4);
-    }
-    
-    /* 游戏区域锚点定位 */
-    .game-area {
-        scroll-margin-top: 20px;
-        position: relative;
-    }
-    
-    .bubble-grid {
-        background: linear-gradient(45deg, #f093fb, #f5576c);
-        padding: 20px;
-        border-radius: 20px;
-        margin: 20px 0;
-        box-shadow: 0 10px 30px rgba(240, 147, 251, 0.3);
-        position: relative;
-    }
-    
-    .stButton > button {
-        font-size: 28px !important;
-        border: 3px solid #fff !important;
-        border-radius: 50% !important;
-        width: 55px !important;
-        height: 55px !important;
-        margin: 3px !important;
-        transition: all 0.2s ease !important;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.1) !important;
-    }
-    
-    .stButton > button:hover {
-        transform: scale(1.1) !important;
-        box-shadow: 0 6px 20px rgba(0,0,0,0.2) !important;
-    }
-    
-    /* 选中状态样式 */
-    .selected-bubble {
-        border: 4px solid #FFD700 !important;
-        background-color: rgba(255, 215, 0, 0.3) !important;
-        transform: scale(1.1) !important;
-        box-shadow: 0 0 20px rgba(255, 215, 0, 0.6) !important;
-        animation: selectedPulse 1s ease-in-out infinite !important;
-    }
-    
-    @keyframes selectedPulse {
-        0%, 100% { 
-            box-shadow: 0 0 20px rgba(255, 215, 0, 0.6);
-        }
-        50% { 
-            box-shadow: 0 0 30px rgba(255, 215, 0, 0.9);
-        }
-    }
-    
-    .easter-egg {
-        background: linear-gradient(45deg, #ffeaa7, #fab1a0);
-        padding: 25px;
-        border-radius: 20px;
-        text-align: center;
-        animation: eggBounce 1s ease-in-out infinite;
-        box-shadow: 0 10px 30px rgba(251, 177, 160, 0.4);
-        border: 3px solid #fff;
-        margin: 20px 0;
-    }
-    
-    /* 特殊的第一次消除彩蛋样式 */
-    .first-clear-egg {
-        background: linear-gradient(45deg, #ff9a9e, #fecfef, #ffa5d8, #ff6b9d) !important;
-        padding: 30px !important;
-        border-radius: 25px !important;
-        text-align: center !important;
-        animation: firstClearPulse 2s ease-in-out infinite !important;
-        box-shadow: 0 15px 40px rgba(255, 154, 158, 0.6) !important;
-        border: 4px solid #fff !important;
-        margin: 25px 0 !important;
-        transform: scale(1.05) !important;
-    }
-    
-    @keyframes firstClearPulse {
-        0%, 100% { 
-            transform: scale(1.05);
-            box-shadow: 0 15px 40px rgba(255, 154, 158, 0.6);
-        }
-        50% { 
-            transform: scale(1.08);
-            box-shadow: 0 20px 50px rgba(255, 154, 158, 0.8);
-        }
-    }
-    
-    @keyframes eggBounce {
-        0%, 100% { transform: translateY(0); }
-        50% { transform: translateY(-10px); }
-    }
-    
-    .combo-indicator {
-        position: fixed;
-        top: 50%;
-        left: 50%;
-        transform: translate(-50%, -50%);
-        font-size: 48px;
-        color: #ff6b6b;
-        animation: comboZoom 1s ease-out;
-        z-index: 1000;
-        pointer-events: none;
-    }
-    
-    @keyframes comboZoom {
-        0% { 
-            transform: translate(-50%, -50%) scale(0);
-            opacity: 0;
-        }
-        50% { 
-            transform: translate(-50%, -50%) scale(1.2);
-            opacity: 1;
-        }
-        100% { 
-            transform: translate(-50%, -50%) scale(1);
-            opacity: 0;
-        }
-    }
-    
-    .swap-instruction {
-        background: linear-gradient(45deg, #74b9ff, #0984e3);
-        color: white;
-        padding: 15px;
-        border-radius: 10px;
-        text-align: center;
-        margin: 10px 0;
-        animation: instructionGlow 2s ease-in-out infinite;
-    }
-    
-    @keyframes instructionGlow {
-        0%, 100% { box-shadow: 0 4px 15px rgba(116, 185, 255, 0.3); }
-        50% { box-shadow: 0 6px 25px rgba(116, 185, 255, 0.6); }
-    }
-    
-    .level-up {
-        background: linear-gradient(45deg, #ffd89b, #19547b);
-        color: white;
-        padding: 20px;
-        border-radius: 15px;
-        text-align: center;
-        animation: levelPulse 0.6s ease-in-out;
-        margin: 10px 0;
-    }
-    
-    @keyframes levelPulse {
-        0% { transform: scale(0.8); }
-        50% { transform: scale(1.1); }
-        100% { transform: scale(1); }
-    }
-    
-    .floating-hearts {
-        position: fixed;
-        top: 0;
-        left: 0;
-        width: 100%;
-        height: 100%;
-        pointer-events: none;
-        z-index: 1000;
-    }
-    
-    .heart {
-        position: absolute;
-        font-size: 20px;
-        animation: floatUp 3s ease-out forwards;
-    }
-    
-    @keyframes floatUp {
-        0% {
-            opacity: 1;
-            transform: translateY(100vh) rotate(0deg);
-        }
-        100% {
-            opacity: 0;
-            transform: translateY(-100px) rotate(360deg);
-        }
-    }
-    
-    /* 成功反馈动画 */
-    .success-feedback {
-        position: fixed;
-        top: 20%;
-        left: 50%;
-        transform: translateX(-50%);
-        background: linear-gradient(45deg, #00b894, #00cec9);
-        color: white;
-        padding: 15px 30px;
-        border-radius: 20px;
-        font-size: 18px;
-        font-weight: bold;
-        z-index: 1001;
-        animation: successPop 2s ease-out forwards;
-        box-shadow: 0 10px 30px rgba(0, 184, 148, 0.4);
-    }
-    
-    @keyframes successPop {
-        0% {
-            opacity: 0;
-            transform: translateX(-50%) scale(0.5);
-        }
-        20% {
-            opacity: 1;
-            transform: translateX(-50%) scale(1.1);
-        }
-        80% {
-            opacity: 1;
-            transform: translateX(-50%) scale(1);
-        }
-        100% {
-            opacity: 0;
-            transform: translateX(-50%) scale(0.8);
-        }
-    }
-</style>
-
-<script>
-// 自动滚动到游戏区域的JavaScript函数
-function scrollToGameArea() {
-    setTimeout(function() {
-        const gameArea = document.getElementById('game-area');
-        if (gameArea) {
-            gameArea.scrollIntoView({ behavior: 'smooth', block: 'center' });
-        }
-    }, 100);
-}
+# 盘面尺寸
+BOARD_ROWS = 7
+BOARD_COLS = 6
 
-// 监听页面加载完成事件
-window.addEventListener('load', function() {
-    // 检查URL参数，如果有scroll=game，则滚动到游戏区域
-    const urlParams = new URLSearchParams(window.location.search);
-    if (urlParams.get('scroll') === 'game' || sessionStorage.getItem('scrollToGame') === 'true') {
-        scrollToGameArea();
-        sessionStorage.removeItem('scrollToGame');
-    }
-});
-
-// 成功反馈函数
-function showSuccessFeedback(message) {
-    const feedback = document.createElement('div');
-    feedback.className = 'success-feedback';
-    feedback.innerHTML = message;
-    document.body.appendChild(feedback);
-    
-    setTimeout(function() {
-        if (feedback.parentNode) {
-            feedback.parentNode.removeChild(feedback);
-        }
-    }, 2000);
-}
-</script>
-""", unsafe_allow_html=True)
+# 盘面渲染方式：component 为单个自定义组件，buttons 为逐格 st.button（兼容 / 测试用）
+BOARD_RENDERER = os.environ.get("LOVE_BUBBLE_BOARD", "component")
+
+# 会话里的盘面用每格一字节的紧凑后端，表情只在渲染时映射
+BOARD_BACKEND = "compact"
+# 会话补充流的块大小（默认 4096 对单个小盘面太大）
+SESSION_REFILL_BLOCK = 256
+# 对局记录每隔多少步存一个快照（只保留最近一个，重放只需最近几十步）
+LOG_SNAPSHOT_EVERY = 50
+
+# 新盘面（开局、重新排列）至少有几个合法交换且没有现成组合；0 为旧的逐格独立抽取
+BOARD_MIN_MOVES = int(os.environ.get("LOVE_BUBBLE_MIN_MOVES", "3"))
+# 特殊泡泡的效果：🌈 清除一种颜色、💎 清除一行或一列、⭐ 清除 3×3；设为 0 时只计数
+BOARD_POWERS = os.environ.get("LOVE_BUBBLE_POWERS", "1") != "0"
+
+# 进程内共享的盘面池：开局和重新排列直接取后台预先生成好的盘面
+@st.cache_resource
+def get_board_pool():
+    pool = BoardPool()
+    atexit.register(pool.close)
+    return pool
+
+# 新建一局的引擎：每局有自己的种子，交换记入对局记录，可以按种子 + 记录重放
+def new_engine(seed=None):
+    boards = get_board_pool() if BOARD_MIN_MOVES else None
+    if seed is None:
+        if boards is not None:
+            seed = boards.fresh_seed((BOARD_ROWS, BOARD_COLS, SPECIAL_CHANCE_INITIAL, BOARD_MIN_MOVES))
+        else:
+            seed = random.SystemRandom().getrandbits(64)
+    log = MoveLog(seed, BOARD_ROWS, BOARD_COLS, SESSION_REFILL_BLOCK,
+                  snapshot_every=LOG_SNAPSHOT_EVERY, keep_snapshots=1, min_moves=BOARD_MIN_MOVES,
+                  powers=BOARD_POWERS)
+    return seeded_engine(seed, BOARD_ROWS, BOARD_COLS, SESSION_REFILL_BLOCK, backend=BOARD_BACKEND, log=log,
+                         min_moves=BOARD_MIN_MOVES, boards=boards, powers=BOARD_POWERS)
+
+# 由本局种子和当前步数决定的随机数（情话等点缀），不占用引擎自己的随机流
+def game_rng(purpose):
+    engine = current_engine()
+    if engine.log is None:
+        # 升级前保存的对局没有种子
+        return random
+    return random.Random(f"{engine.log.seed}:{engine.state.moves}:{purpose}")
+
+# 外部状态存储，例如 sqlite:///love_bubble_sessions.db；留空时对局只保存在本进程的 session_state
+STATE_STORE_URL = os.environ.get("LOVE_BUBBLE_STORE", "")
+
+# 进程内共享的状态存储（写入由后台线程批量提交）
+@st.cache_resource
+def get_state_store():
+    if not STATE_STORE_URL:
+        return None
+    store = open_store(STATE_STORE_URL)
+    atexit.register(store.close)
+    return store
+
+# 闲置对局的休眠目录（每个进程在其中使用自己的子目录）、闲置秒数和内存中最多保留的活跃对局数
+HIBERNATE_DIR = os.environ.get("LOVE_BUBBLE_HIBERNATE_DIR", os.path.join(tempfile.gettempdir(), "love_bubble_sessions"))
+IDLE_SECONDS = float(os.environ.get("LOVE_BUBBLE_IDLE_SECONDS", "600"))
+MAX_LIVE_SESSIONS = int(os.environ.get("LOVE_BUBBLE_MAX_LIVE", "1000"))
+
+# 进程内的对局缓存：闲置的对局写成快照移出内存，下次交互时恢复
+@st.cache_resource
+def get_session_cache():
+    cache = SessionCache(HIBERNATE_DIR, max_live=MAX_LIVE_SESSIONS, idle_seconds=IDLE_SECONDS)
+    atexit.register(cache.close)
+    return cache
+
+# 后台分析的进程数和每个盘面的搜索预算（毫秒）
+ANALYSIS_WORKERS = int(os.environ.get("LOVE_BUBBLE_ANALYSIS_WORKERS", "2"))
+ANALYSIS_BUDGET_MS = float(os.environ.get("LOVE_BUBBLE_ANALYSIS_BUDGET_MS", "150"))
+
+# 进程内共享的分析进程池：每步之后异步分析新盘面，结果在之后的重跑中取用
+@st.cache_resource
+def get_analysis_pool():
+    pool = AnalysisPool(workers=ANALYSIS_WORKERS, budget_ms=ANALYSIS_BUDGET_MS)
+    atexit.register(pool.close)
+    return pool
+
+# 当前盘面的分析结果；还没算完时为 None（只提交，不等待）
+def board_analysis(engine):
+    pool = get_analysis_pool()
+    return pool.result(pool.submit(engine.state, engine.powers, engine.min_moves))
+
+# st.html 能否执行脚本（较新的 Streamlit 才有 unsafe_allow_javascript）
+HTML_JAVASCRIPT = hasattr(st, "html") and "unsafe_allow_javascript" in inspect.signature(st.html).parameters
+
+# 指纹化静态资源的清单；没开静态服务、没构建或 st.html 不能执行脚本时为 None
+@st.cache_resource
+def get_asset_manifest():
+    if not (HTML_JAVASCRIPT and st.get_option("server.enableStaticServing")):
+        return None
+    return load_manifest()
+
+# 内联版本的 CSS / JS（退回旧做法时每次重跑发送）
+@st.cache_resource
+def get_inline_assets():
+    return inline_html()
+
+# 页面样式和脚本：每个浏览器会话只注入一次引导脚本，由它加载可长期缓存的静态文件
+def inject_assets():
+    manifest = get_asset_manifest()
+    if manifest is None:
+        markup = get_inline_assets()
+        st.markdown(markup, unsafe_allow_html=True)
+        st.session_state.asset_bytes = {'mode': "inline", 'first': len(markup.encode()), 'rerun': len(markup.encode())}
+        return
+    if st.session_state.get('assets_injected'):
+        return
+    markup = bootstrap_html(manifest)
+    st.html(markup, unsafe_allow_javascript=True)
+    st.session_state.assets_injected = True
+    st.session_state.asset_bytes = {'mode': "static", 'first': len(markup.encode()), 'rerun': 0}
+
+# 指标导出，例如 prometheus://0.0.0.0:9464 或 file:///tmp/love_bubble_metrics.jsonl（见 bubble_metrics.py）；留空时不记录
+METRICS_URL = os.environ.get("LOVE_BUBBLE_METRICS", "")
+
+# 进程内共享的指标（各会话的重跑都记在一起）
+@st.cache_resource
+def get_metrics():
+    metrics = open_metrics(METRICS_URL)
+    atexit.register(metrics.close)
+    return metrics
+
+# 玩家令牌放在 URL 里，重连到别的进程时据此找回对局
+def player_token():
+    token = st.query_params.get("player")
+    if not valid_token(token):
+        token = uuid.uuid4().hex
+        st.query_params["player"] = token
+    return token
+
+# 从存储加载对局，没有则新开一局；返回 (引擎, 存储版本)
+def load_engine(store, token):
+    stored = store.load(token) if store is not None else None
+    if stored is None:
+        return new_engine(), 0
+    version, data = stored
+    return restore_engine(data), version
+
+# 本会话的引擎
+def current_engine():
+    """从对局缓存取出引擎；休眠的对局在这里透明恢复，缓存里没有时从存储加载或新开一局"""
+    cache = get_session_cache()
+    token = st.session_state.player_token
+    engine = cache.get(token)
+    if engine is None:
+        engine, st.session_state.store_version = load_engine(get_state_store(), token)
+        cache.put(token, engine)
+    if engine.min_moves and engine.boards is None:
+        # 从快照恢复的引擎不带盘面池
+        engine.boards = get_board_pool()
+    return engine
+
+# 对局有变化之后调用：登记为活跃对局，并写入外部存储（如果配置了）
+def save_game(engine):
+    with timed_phase("save"):
+        _save_game(engine)
+
+def _save_game(engine):
+    token = st.session_state.player_token
+    cache = get_session_cache()
+    cache.put(token, engine)
+    # 新盘面立即开始后台分析，下一次重跑时多半已经算完
+    get_analysis_pool().submit(engine.state, engine.powers, engine.min_moves)
+    store = get_state_store()
+    if store is None:
+        return
+    try:
+        st.session_state.store_version = store.save(token, snapshot_engine(engine), st.session_state.store_version)
+    except VersionConflict:
+        # 别的进程或标签页已经推进了这局，以存储中的进度为准
+        engine, st.session_state.store_version = load_engine(store, token)
+        cache.put(token, engine)
+        st.session_state.selected_bubble = None
+        st.session_state.board_message = ("warning", "⚠️ 这局游戏在别处有更新，已同步到最新进度")
 
 # 初始化交换式游戏状态
 def init_enhanced_game():
+    # 规则状态全部交给引擎，这里只保留界面相关的状态
+    if 'player_token' not in st.session_state:
+        st.session_state.player_token = player_token()
+    if 'store_version' not in st.session_state:
+        # 同一进程里可能已有这个令牌的活跃对局，版本以存储为准
+        store = get_state_store()
+        stored = store.load(st.session_state.player_token) if store is not None else None
+        st.session_state.store_version = stored[0] if stored else 0
+
     defaults = {
-        'game_grid': generate_enhanced_grid(7, 6),
-        'score': 0,
-        'level': 1,
-        'combo': 0,
-        'max_combo': 0,
-        'moves': 0,
         'selected_bubble': None,
-        'swap_mode': True,
-        'special_bubbles_collected': {'💖': 0, '⭐': 0, '🌈': 0, '💎': 0, '🌸': 0},
-        'easter_eggs_unlocked': [],
         'show_easter_egg': None,
-        'last_action': None,
-        'game_time': 0,
-        'daily_played': False,
-        'achievements': [],
         'floating_hearts': False,
         'show_combo_effect': False,
         'level_up_animation': False,
-        'auto_clear_happening': False,
         'first_clear_done': False,
         'need_refresh': False,
         'last_success_message': None,  # 新增：存储成功消息
-        'should_scroll_to_game': False  # 新增：是否需要滚动到游戏区域
+        'should_scroll_to_game': False,  # 新增：是否需要滚动到游戏区域
+        'last_swap_seq': None,  # 盘面组件最近处理过的交换
+        'board_message': None  # 盘面上方显示的点击结果 (类型, 文本)
     }
     
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
 
-# 生成网格（保持不变）
-def generate_enhanced_grid(rows, cols):
-    ENHANCED_BUBBLES = {
-        'normal': ['🔴', '🟠', '🟡', '🟢', '🔵', '🟣'],
-        'special': ['💖', '⭐', '🌈', '💎', '🌸']
-    }
-    
-    grid = []
-    for i in range(rows):
-        row = []
-        for j in range(cols):
-            if random.random() < 0.15:
-                bubble = random.choice(ENHANCED_BUBBLES['special'])
-            else:
-                bubble = random.choice(ENHANCED_BUBBLES['normal'])
-            row.append(bubble)
-        grid.append(row)
-    return grid
-
-# 检查两个位置是否相邻
-def are_adjacent(pos1, pos2):
-    """检查两个位置是否相邻（上下左右）"""
-    row1, col1 = pos1
-    row2, col2 = pos2
-    
-    return (abs(row1 - row2) == 1 and col1 == col2) or (abs(col1 - col2) == 1 and row1 == row2)
-
-# 交换两个位置的泡泡
-def swap_bubbles(grid, pos1, pos2):
-    """交换两个位置的泡泡"""
-    row1, col1 = pos1
-    row2, col2 = pos2
-    
-    grid[row1][col1], grid[row2][col2] = grid[row2][col2], grid[row1][col1]
-
-# 查找连接泡泡（保持不变）
-def find_connected_bubbles(grid, start_row, start_col):
-    """查找连接的相同颜色泡泡"""
-    if not grid or start_row < 0 or start_row >= len(grid) or start_col < 0 or start_col >= len(grid[0]):
-        return []
-    
-    target_bubble = grid[start_row][start_col]
-    if not target_bubble:
-        return []
-    
-    visited = set()
-    connected = []
-    
-    def dfs(row, col):
-        if (row, col) in visited:
-            return
-        if row < 0 or row >= len(grid) or col < 0 or col >= len(grid[0]):
-            return
-        if grid[row][col] != target_bubble:
-            return
-        
-        visited.add((row, col))
-        connected.append((row, col))
-        
-        dfs(row-1, col)
-        dfs(row+1, col)
-        dfs(row, col-1)
-        dfs(row, col+1)
-    
-    dfs(start_row, start_col)
-    return connected
-
-# 查找所有可消除的连接组合
-def find_all_clearable_groups(grid):
-    """查找所有可消除的连接组合"""
-    visited_global = set()
-    clearable_groups = []
-    
-    for i in range(len(grid)):
-        for j in range(len(grid[0])):
-            if (i, j) not in visited_global:
-                connected = find_connected_bubbles(grid, i, j)
-                if len(connected) >= 3:
-                    clearable_groups.append(connected)
-                visited_global.update(connected)
-                
-    return clearable_groups
-
-# 移除泡泡（保持不变）
-def remove_bubbles(grid, positions):
-    """移除指定位置的泡泡并让上方泡泡下落"""
-    for row, col in positions:
-        if 0 <= row < len(grid) and 0 <= col < len(grid[0]):
-            grid[row][col] = None
-    
-    rows, cols = len(grid), len(grid[0])
-    for col in range(cols):
-        bubbles = []
-        for row in range(rows):
-            if grid[row][col] is not None:
-                bubbles.append(grid[row][col])
-        
-        for row in range(rows):
-            grid[row][col] = None
-        
-        for i, bubble in enumerate(reversed(bubbles)):
-            grid[rows - 1 - i][col] = bubble
-    
-    normal_bubbles = ['🔴', '🟠', '🟡', '🟢', '🔵', '🟣']
-    special_bubbles = ['💖', '⭐', '🌈', '💎', '🌸']
-    
-    for col in range(cols):
-        for row in range(rows):
-            if grid[row][col] is None:
-                if random.random() < 0.1:
-                    grid[row][col] = random.choice(special_bubbles)
-                else:
-                    grid[row][col] = random.choice(normal_bubbles)
-
-# 自动消除所有可消除的组合
-def auto_clear_bubbles():
-    """自动消除所有可消除的泡泡组合"""
-    total_cleared = 0
-    combo_count = 0
-    
-    while True:
-        clearable_groups = find_all_clearable_groups(st.session_state.game_grid)
-        
-        if not clearable_groups:
-            break
-            
-        # 消除所有可消除组合
-        all_positions = []
-        for group in clearable_groups:
-            all_positions.extend(group)
-        
-        # 计算分数
-        cleared_count = len(all_positions)
-        base_score = cleared_count * 20
-        combo_bonus = combo_count * 15
-        level_bonus = st.session_state.level * 10
-        total_score = base_score + combo_bonus + level_bonus
-        
-        st.session_state.score += total_score
-        total_cleared += cleared_count
-        combo_count += 1
-        
-        # 统计特殊泡泡
-        for pos in all_positions:
-            row, col = pos
-            bubble_type = st.session_state.game_grid[row][col]
-            if bubble_type in st.session_state.special_bubbles_collected:
-                st.session_state.special_bubbles_collected[bubble_type] += 1
-        
-        # 移除泡泡
-        remove_bubbles(st.session_state.game_grid, all_positions)
-    
-    # 更新连击
-    st.session_state.combo += combo_count
-    if st.session_state.combo > st.session_state.max_combo:
-        st.session_state.max_combo = st.session_state.combo
-    
-    return total_cleared, combo_count
-
-# 检查交换后是否能产生消除
-def can_create_match(grid, pos1, pos2):
-    """检查交换后是否能产生可消除的组合"""
-    # 临时交换
-    swap_bubbles(grid, pos1, pos2)
-    
-    # 检查两个位置是否能产生消除
-    connected1 = find_connected_bubbles(grid, pos1[0], pos1[1])
-    connected2 = find_connected_bubbles(grid, pos2[0], pos2[1])
-    
-    can_clear = len(connected1) >= 3 or len(connected2) >= 3
-    
-    # 交换回来
-    swap_bubbles(grid, pos1, pos2)
-    
-    return can_clear
+# 当前局的游戏状态
+def game_state():
+    return current_engine().state
 
 # 彩蛋系统（保持不变）
 ENHANCED_EASTER_EGGS = {
@@ -568,6 +301,7 @@ def show_combo_effect(combo_count):
         ''', unsafe_allow_html=True)
 
 def enhanced_easter_egg_check(cleared_count, combo):
+    state = game_state()
     triggers = []
     
     # 检查是否是第一次消除
@@ -579,10 +313,10 @@ def enhanced_easter_egg_check(cleared_count, combo):
     elif combo >= 3:
         triggers.append('mega_combo')
     
-    if st.session_state.score in ENHANCED_EASTER_EGGS['achievements']:
+    if state.score in ENHANCED_EASTER_EGGS['achievements']:
         triggers.append('achievement')
     
-    if st.session_state.moves == 77:
+    if state.moves == 77:
         triggers.append('lucky_number')
     
     return triggers
@@ -609,7 +343,7 @@ def display_enhanced_easter_egg(egg_types):
             """, unsafe_allow_html=True)
             st.session_state.floating_hearts = True
         elif egg_type == 'love_quote':
-            quote = random.choice(ENHANCED_EASTER_EGGS['love_quotes'])
+            quote = game_rng("love_quote").choice(ENHANCED_EASTER_EGGS['love_quotes'])
             st.markdown(f"""
             <div class="easter-egg">
                 <h2>💕 爱的悄悄话 💕</h2>
@@ -621,24 +355,100 @@ def display_enhanced_easter_egg(egg_types):
             st.session_state.floating_hearts = True
 
 def show_live_stats():
+    state = game_state()
     st.markdown("### 📊 实时统计")
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("🔄 交换次数", st.session_state.moves)
+        st.metric("🔄 交换次数", state.moves)
     with col2:
-        st.metric("🔥 最高连击", st.session_state.max_combo)
+        st.metric("🔥 最高连击", state.max_combo)
     with col3:
-        total_special = sum(st.session_state.special_bubbles_collected.values())
+        total_special = sum(state.special_bubbles_collected.values())
         st.metric("✨ 特殊泡泡", total_special)
     with col4:
-        if st.session_state.moves > 0:
-            efficiency = round(st.session_state.score / st.session_state.moves, 1)
+        if state.moves > 0:
+            efficiency = round(state.score / state.moves, 1)
             st.metric("📈 效率", f"{efficiency}")
 
+# 会话内存报告
+def session_memory_report():
+    """每个会话键的深度内存占用和 pickle 大小（字节），按内存从大到小排列"""
+    report = []
+    for key in list(st.session_state.keys()):
+        if key == 'memory_report':
+            # 上一次的统计结果本身不算
+            continue
+        value = st.session_state[key]
+        try:
+            pickled = len(pickle.dumps(value))
+        except Exception:
+            pickled = None
+        report.append({'key': key, 'memory': deep_sizeof(value), 'pickle': pickled})
+    # 引擎放在进程级的对局缓存里，但同样算作这个会话的占用（共享的盘面池除外）
+    engine = current_engine()
+    report.append({'key': 'engine', 'memory': deep_sizeof(engine, {id(engine.boards)}),
+                   'pickle': len(pickle.dumps(engine))})
+    report.sort(key=lambda entry: entry['memory'], reverse=True)
+    return report
+
+# 片段：可独立重跑的页面区域
+FRAGMENT_SCORE = "score"
+FRAGMENT_BOARD = "board"
+FRAGMENT_EFFECTS = "effects"
+FRAGMENT_STATS = "stats"
+# 交换成功后需要刷新的片段
+SWAP_FRAGMENTS = [FRAGMENT_SCORE, FRAGMENT_BOARD, FRAGMENT_EFFECTS, FRAGMENT_STATS]
+
+# 是否支持按 key 重跑指定片段（st.rerun(["board", ...])）
+FRAGMENT_KEYS = "key" in inspect.signature(st.fragment).parameters
+
+# 记录耗时
+def record_timing(name, seconds):
+    """按名称累计片段 / 回调的耗时（毫秒）"""
+    timings = st.session_state.setdefault('fragment_timings', {})
+    entry = timings.setdefault(name, {'count': 0, 'last_ms': 0.0, 'total_ms': 0.0})
+    entry['count'] += 1
+    entry['last_ms'] = seconds * 1000
+    entry['total_ms'] += seconds * 1000
+    if METRICS_URL:
+        get_metrics().record_phase(name, seconds)
+
+# 给一段代码计时
+@contextlib.contextmanager
+def timed_phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - started)
+
+# 带耗时统计的片段
+def timed_fragment(key):
+    def decorator(func):
+        @functools.wraps(func)
+        def body():
+            started = time.perf_counter()
+            try:
+                func()
+            finally:
+                record_timing(key, time.perf_counter() - started)
+        if FRAGMENT_KEYS:
+            return st.fragment(body, key=key)
+        return st.fragment(body)
+    return decorator
+
+# 只重跑受影响的片段
+def rerun_fragments(keys):
+    """在控件回调中调用；不支持按 key 重跑时退回整页刷新"""
+    if FRAGMENT_KEYS:
+        st.rerun(keys)
+    else:
+        st.session_state.need_refresh = True
+
 # 优化的泡泡点击处理逻辑 - 减少刷新
 def handle_bubble_click(current_pos):
-    """处理泡泡点击逻辑，避免不必要的页面刷新"""
+    """处理泡泡点击逻辑，规则结算交给引擎"""
     if st.session_state.selected_bubble is None:
         # 第一次选择
         st.session_state.selected_bubble = current_pos
@@ -649,55 +459,192 @@ def handle_bubble_click(current_pos):
         st.session_state.selected_bubble = None
         return "deselected"
         
+    # 尝试交换
+    selected_pos = st.session_state.selected_bubble
+    st.session_state.selected_bubble = None
+    return handle_swap(selected_pos, current_pos)
+
+# 交换两个泡泡并处理结果
+def handle_swap(selected_pos, current_pos):
+    """执行一次交换，返回与 handle_bubble_click 相同的结果字符串"""
+    engine = current_engine()
+    # 盘面组件在浏览器端逐轮播放连锁，需要交换前的盘面和每轮的消除 / 补充
+    animate = BOARD_RENDERER != "buttons"
+    start = [row[:] for row in engine.emoji_grid()] if animate else None
+    with timed_phase("swap"):
+        result = engine.swap(selected_pos, current_pos, timeline=animate)
+    if METRICS_URL and result.ok:
+        get_metrics().record_cascade(result)
+    
+    if not result.ok:
+        return result.status
+    save_game(engine)
+    if result.cleared == 0:
+        return "no_match"
+    if animate:
+        st.session_state.board_timeline = cascade_timeline(start, selected_pos, current_pos, result, uuid.uuid4().hex)
+    
+    # 检查彩蛋
+    easter_eggs = enhanced_easter_egg_check(result.cleared, result.combo_rounds)
+    if easter_eggs:
+        st.session_state.show_easter_egg = easter_eggs
+    
+    # 升级（动画和气球在特效片段中显示）
+    if result.level_up:
+        st.session_state.level_up_animation = True
+    
+    # 连击效果
+    if result.combo_rounds >= 2:
+        st.session_state.show_combo_effect = result.combo_rounds
+    
+    # 设置成功消息
+    st.session_state.last_success_message = f"🎉 成功交换！消除了 {result.cleared} 个泡泡，{result.combo_rounds} 轮连击！"
+    if result.powers:
+        st.session_state.last_success_message += f" 触发了 {''.join(result.powers)} 的效果 ✨"
+    if result.reshuffled:
+        st.session_state.last_success_message += " 没有可交换的泡泡了，已自动重新排列 🎲"
+    st.session_state.should_scroll_to_game = True
+    
+    return f"success:{result.cleared}:{result.combo_rounds}"
+
+# 根据点击结果生成提示消息
+def click_message(result, pos):
+    """返回 (消息类型, 文本)，消息类型对应 st.info / st.success / ..."""
+    if result == "selected":
+        return "info", f"🎯 已选择位置 ({pos[0]},{pos[1]})"
+    elif result == "deselected":
+        return "info", "❌ 取消选择"
+    elif result.startswith("success"):
+        parts = result.split(":")
+        cleared_count = parts[1]
+        combo_rounds = parts[2]
+        return "success", f"🎉 成功交换！消除了 {cleared_count} 个泡泡，{combo_rounds} 轮连击！"
+    elif result == "no_match":
+        return "warning", "⚠️ 交换失败：没有产生可消除的组合"
+    elif result == "invalid_match":
+        return "error", "❌ 无法交换：交换后不会产生3个以上的连接！"
+    elif result == "not_adjacent":
+        return "error", "❌ 只能与相邻的泡泡交换（上下左右）！"
+    return None
+
+# 点击结果 -> 消息 + 只重跑受影响的片段
+def finish_click(result, pos, started):
+    st.session_state.board_message = click_message(result, pos)
+    record_timing("click", time.perf_counter() - started)
+    if result.startswith("success"):
+        rerun_fragments(SWAP_FRAGMENTS)
     else:
-        # 尝试交换
-        selected_pos = st.session_state.selected_bubble
-        
-        if are_adjacent(selected_pos, current_pos):
-            # 检查交换后是否能产生消除
-            if can_create_match(st.session_state.game_grid, selected_pos, current_pos):
-                # 执行交换
-                swap_bubbles(st.session_state.game_grid, selected_pos, current_pos)
-                st.session_state.moves += 1
-                st.session_state.selected_bubble = None
-                
-                # 自动消除
-                cleared_count, combo_rounds = auto_clear_bubbles()
-                
-                if cleared_count > 0:
-                    # 检查彩蛋
-                    easter_eggs = enhanced_easter_egg_check(cleared_count, combo_rounds)
-                    if easter_eggs:
-                        st.session_state.show_easter_egg = easter_eggs
-                    
-                    # 升级检查
-                    new_level = st.session_state.score // 500 + 1
-                    if new_level > st.session_state.level:
-                        st.session_state.level = new_level
-                        st.session_state.level_up_animation = True
-                        st.balloons()
-                    
-                    # 显示连击效果
-                    if combo_rounds >= 2:
-                        show_combo_effect(combo_rounds)
-                    
-                    # 设置成功消息，但先不刷新
-                    st.session_state.last_success_message = f"🎉 成功交换！消除了 {cleared_count} 个泡泡，{combo_rounds} 轮连击！"
-                    st.session_state.should_scroll_to_game = True
-                    
-                    return f"success:{cleared_count}:{combo_rounds}"
-                else:
-                    return "no_match"
-            else:
-                st.session_state.selected_bubble = None
-                return "invalid_match"
+        rerun_fragments([FRAGMENT_SCORE, FRAGMENT_BOARD])
+
+# 按钮盘面的点击回调
+def on_bubble_click(i, j):
+    started = time.perf_counter()
+    result = handle_bubble_click((i, j))
+    finish_click(result, (i, j), started)
+
+# 盘面组件的交换回调
+def on_board_swap():
+    started = time.perf_counter()
+    swap = st.session_state.get("bubble_board")
+    if not swap or swap.get("seq") == st.session_state.last_swap_seq:
+        return
+    st.session_state.last_swap_seq = swap["seq"]
+    st.session_state.selected_bubble = None
+    pos = tuple(swap["b"])
+    result = handle_swap(tuple(swap["a"]), pos)
+    finish_click(result, pos, started)
+
+# 逐格按钮渲染盘面
+def render_button_grid():
+    for i, row in enumerate(current_engine().emoji_grid()):
+        cols = st.columns(len(row))
+        for j, bubble in enumerate(row):
+            with cols[j]:
+                st.button(bubble, key=f"bubble_{i}_{j}", on_click=on_bubble_click, args=(i, j))
+
+# 单个组件渲染整块盘面，只回传交换的两个坐标；上一次交换的连锁时间线随这次渲染发出一次
+def render_component_grid():
+    timeline = st.session_state.pop("board_timeline", None)
+    bubble_board(current_engine().emoji_grid(), key="bubble_board", on_change=on_board_swap, timeline=timeline)
+
+# 分数板
+@timed_fragment(FRAGMENT_SCORE)
+def score_panel():
+    state = game_state()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown(f"""
+        <div class="score-board">
+            <h3>💯 分数</h3>
+            <h1>{state.score}</h1>
+            <p>下一级还需: {500 - (state.score % 500)}</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    with col2:
+        st.markdown(f"""
+        <div class="score-board">
+            <h3>⚡ 等级</h3>
+            <h1>{state.level}</h1>
+            <p>连击: {state.combo}</p>
+        </div>
+        """, unsafe_allow_html=True)
+    
+    with col3:
+        selected_text = "已选择" if st.session_state.selected_bubble else "未选择"
+        st.markdown(f"""
+        <div class="score-board">
+            <h3>🎯 选择状态</h3>
+            <h1>{selected_text}</h1>
+            <p>交换: {state.moves}</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+# 游戏盘面
+@timed_fragment(FRAGMENT_BOARD)
+def board_panel():
+    # 显示当前选中状态
+    if BOARD_RENDERER == "buttons":
+        if st.session_state.selected_bubble:
+            row, col = st.session_state.selected_bubble
+            bubble = current_engine().bubble_at(row, col)
+            st.info(f"🎯 已选择: 位置({row},{col}) {bubble} - 请选择相邻的泡泡进行交换")
         else:
-            st.session_state.selected_bubble = None
-            return "not_adjacent"
+            st.info("👆 请选择第一个泡泡开始交换")
+    else:
+        st.info("👆 先点一个泡泡，再点相邻的泡泡进行交换")
+    
+    # 上一次点击的结果消息
+    message = st.session_state.board_message
+    if message:
+        kind, text = message
+        getattr(st, kind)(text)
+        st.session_state.board_message = None
+    
+    analysis = board_analysis(current_engine())
+    if analysis is None:
+        st.caption("🔍 正在分析局面…")
+    elif analysis['deadlocked']:
+        st.caption("🔍 当前盘面没有可行交换")
+    elif analysis['best_move'] is not None:
+        (r1, c1), (r2, c2) = analysis['best_move']
+        st.caption(f"🔍 {analysis['legal_moves']} 种可行交换 · 推荐 ({r1},{c1})↔({r2},{c2}) · "
+                   f"向后看 {analysis['depth']} 步")
+    
+    if BOARD_RENDERER == "buttons":
+        render_button_grid()
+    else:
+        render_component_grid()
+    
+    # 不支持按 key 重跑片段时，交换成功后退回整页刷新
+    if st.session_state.need_refresh:
+        st.session_state.need_refresh = False
+        st.rerun()
 
-# 主游戏函数增强版 - 减少不必要刷新
-def enhanced_main():
-    init_enhanced_game()
+# 升级、连击、彩蛋等特效
+@timed_fragment(FRAGMENT_EFFECTS)
+def effects_panel():
+    state = game_state()
     
     # 如果需要滚动到游戏区域，添加JavaScript
     if st.session_state.should_scroll_to_game:
@@ -723,6 +670,136 @@ def enhanced_main():
         """, unsafe_allow_html=True)
         st.session_state.last_success_message = None
     
+    # 显示连击效果
+    if st.session_state.show_combo_effect:
+        show_combo_effect(st.session_state.show_combo_effect)
+        st.session_state.show_combo_effect = False
+    
+    # 升级动画
+    if st.session_state.level_up_animation:
+        st.balloons()
+        st.markdown(f"""
+        <div class="level-up">
+            <h2>🎊 恭喜升级到 Level {state.level}! 🎊</h2>
+            <p>你的交换技巧越来越厉害了！</p>
+        </div>
+        """, unsafe_allow_html=True)
+        st.session_state.level_up_animation = False
+    
+    # 显示彩蛋
+    if st.session_state.show_easter_egg:
+        display_enhanced_easter_egg(st.session_state.show_easter_egg)
+        st.button("继续游戏 💕", key="continue_game", on_click=lambda: st.session_state.update(show_easter_egg=None))
+    
+    # 创建飘浮爱心
+    create_floating_hearts()
+
+# 实时统计
+@timed_fragment(FRAGMENT_STATS)
+def stats_panel():
+    show_live_stats()
+    
+    timings = st.session_state.get('fragment_timings')
+    if timings:
+        with st.expander("⏱️ 片段耗时"):
+            for name, entry in timings.items():
+                mean = entry['total_ms'] / entry['count']
+                st.caption(f"{name}: 最近 {entry['last_ms']:.1f} ms · 平均 {mean:.1f} ms · {entry['count']} 次")
+            if METRICS_URL:
+                st.caption(f"进程指标导出到 {', '.join(get_metrics().targets())}")
+    
+    with st.expander("🧠 会话内存"):
+        # 统计要 pickle 每个会话键并递归计算大小，只在点击时做，不放在每次交换都会重跑的路径上
+        if st.button("📏 统计会话内存", key="measure_memory"):
+            st.session_state.memory_report = (current_engine().state.moves, session_memory_report())
+        measured = st.session_state.get('memory_report')
+        if measured is None:
+            st.caption("点击按钮统计各会话键的内存和 pickle 大小")
+        else:
+            moves, report = measured
+            total_memory = sum(entry['memory'] for entry in report)
+            total_pickle = sum(entry['pickle'] or 0 for entry in report)
+            st.caption(f"第 {moves} 步时：共 {len(report)} 个键 · 内存 {total_memory / 1024:.1f} KB · "
+                       f"pickle {total_pickle / 1024:.1f} KB")
+            for entry in report[:5]:
+                pickled = "-" if entry['pickle'] is None else f"{entry['pickle']} B"
+                st.caption(f"{entry['key']}: 内存 {entry['memory']} B · pickle {pickled}")
+    
+    engine = current_engine()
+    with st.expander("🧾 对局记录"):
+        log = engine.log
+        if log is None:
+            st.caption("这局游戏开始于对局记录上线之前，无法重放")
+        else:
+            st.caption(f"种子 {log.seed} · 共 {log.total} 步 · 可从第 {log.base} 步起重放 · {len(log.snapshots)} 个快照")
+            st.download_button("📥 下载对局记录", log.to_bytes(), file_name=f"love_bubble_{log.seed}.lbr",
+                               mime="application/octet-stream", key="download_log")
+    
+    with st.expander("🔍 后台分析"):
+        stats = get_analysis_pool().stats()
+        st.caption(f"计算中 {stats['pending']} · 已缓存 {stats['cached_results']} 个盘面 · 提交 {stats['submitted']} · "
+                   f"合并 {stats['coalesced']} · 命中缓存 {stats['cached']} · 出错 {stats['errors']} · "
+                   f"平均 {stats['compute_ms']:.0f} ms")
+    
+    asset_bytes = st.session_state.get('asset_bytes')
+    if asset_bytes:
+        with st.expander("🎨 页面资源"):
+            inline = len(get_inline_assets().encode())
+            if asset_bytes['mode'] == "static":
+                st.caption(f"静态文件 · 首次注入 {asset_bytes['first']} B · 之后每次重跑 0 B（内联时每次 {inline} B）")
+            else:
+                st.caption(f"内联 · 每次重跑 {asset_bytes['rerun']} B（开启 server.enableStaticServing 后只在首次注入）")
+            manifest = get_asset_manifest()
+            if not (manifest and any(name.startswith(FONT_DIR + '/') for name in manifest)):
+                st.caption("⚠️ 没有打包 Quicksand 字体，未安装该字体的设备会显示后备字体（添加方法见 .streamlit/config.toml）")
+    
+    if BOARD_MIN_MOVES:
+        with st.expander("🎲 盘面池"):
+            stats = get_board_pool().stats()
+            st.caption(f"预生成 {stats['boards']} 个盘面 · 排队 {stats['queued']} · 备用开局 {stats['fresh_seeds']} · "
+                       f"命中 {stats['hits']} · 当场生成 {stats['misses']}（命中率 {stats['hit_rate']:.0%}）")
+    
+    with st.expander("💤 会话休眠"):
+        stats = get_session_cache().stats()
+        st.caption(f"活跃 {stats['live']} · 休眠中 {stats['hibernated']} · 累计休眠 {stats['hibernations']} · "
+                   f"累计恢复 {stats['rehydrated']}（平均 {stats['rehydrate_ms']:.2f} ms）")
+
+# 控制按钮的回调
+def on_shuffle():
+    engine = current_engine()
+    engine.shuffle()
+    st.session_state.selected_bubble = None
+    save_game(engine)
+    rerun_fragments([FRAGMENT_SCORE, FRAGMENT_BOARD])
+
+def on_cancel_selection():
+    st.session_state.selected_bubble = None
+    st.session_state.board_message = ("info", "❌ 已取消选择")
+    rerun_fragments([FRAGMENT_SCORE, FRAGMENT_BOARD])
+
+def on_hint():
+    # 后台分析已经算完时用求解器的建议，否则用合法交换索引里的第一个，都不需要等待
+    engine = current_engine()
+    analysis = board_analysis(engine)
+    hint = (analysis and analysis['best_move']) or engine.hint()
+    if hint:
+        (r1, c1), (r2, c2) = hint
+        preview = engine.preview(*hint)
+        st.session_state.board_message = (
+            "info", f"💡 试试交换 ({r1},{c1}) 和 ({r2},{c2})，预计 +{preview.score_gained} 分")
+    rerun_fragments([FRAGMENT_BOARD])
+
+# 主游戏函数增强版 - 点击只重跑受影响的片段
+def enhanced_main():
+    started = time.perf_counter()
+    if METRICS_URL:
+        get_metrics().inc('reruns_total')
+    with timed_phase("assets"):
+        inject_assets()
+    with timed_phase("init"):
+        init_enhanced_game()
+    state = game_state()
+    
     # 标题动画
     st.markdown("""
     <div class="main-header">
@@ -738,145 +815,53 @@ def enhanced_main():
         <h3>🎮 游戏玩法</h3>
         <p><strong>1️⃣ 选择泡泡</strong> → <strong>2️⃣ 选择相邻泡泡交换</strong> → <strong>3️⃣ 自动消除连接组合</strong></p>
         <p>💡 <strong>策略提示</strong>：交换后必须能产生3个或以上连接才能成功交换！</p>
+        <p>✨ <strong>特殊泡泡</strong>：🌈 清除最多的一种颜色，💎 清除一整行或一整列，⭐ 清除周围 3×3</p>
     </div>
     """, unsafe_allow_html=True)
     
     # 分数板
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.markdown(f"""
-        <div class="score-board">
-            <h3>💯 分数</h3>
-            <h1>{st.session_state.score}</h1>
-            <p>下一级还需: {500 - (st.session_state.score % 500)}</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown(f"""
-        <div class="score-board">
-            <h3>⚡ 等级</h3>
-            <h1>{st.session_state.level}</h1>
-            <p>连击: {st.session_state.combo}</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        selected_text = "已选择" if st.session_state.selected_bubble else "未选择"
-        st.markdown(f"""
-        <div class="score-board">
-            <h3>🎯 选择状态</h3>
-            <h1>{selected_text}</h1>
-            <p>交换: {st.session_state.moves}</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    # 创建飘浮爱心
-    create_floating_hearts()
+    score_panel()
     
     # 游戏区域 - 添加锚点ID
     st.markdown('<div id="game-area" class="game-area">', unsafe_allow_html=True)
     st.markdown('<div class="bubble-grid">', unsafe_allow_html=True)
-    
-    # 显示当前选中状态
-    if st.session_state.selected_bubble:
-        row, col = st.session_state.selected_bubble
-        bubble = st.session_state.game_grid[row][col]
-        st.info(f"🎯 已选择: 位置({row},{col}) {bubble} - 请选择相邻的泡泡进行交换")
-    else:
-        st.info("👆 请选择第一个泡泡开始交换")
-    
-    # 创建消息容器
-    message_container = st.empty()
-    
-    # 使用会话状态来跟踪需要刷新的情况
-    need_full_refresh = False
-    
-    # 显示游戏网格
-    for i, row in enumerate(st.session_state.game_grid):
-        cols = st.columns(len(row))
-        for j, bubble in enumerate(row):
-            with cols[j]:
-                # 检查是否为选中状态
-                is_selected = st.session_state.selected_bubble == (i, j)
-                
-                # 显示按钮
-                if st.button(bubble, key=f"bubble_{i}_{j}"):
-                    current_pos = (i, j)
-                    result = handle_bubble_click(current_pos)
-                    
-                    # 根据结果显示相应消息
-                    if result == "selected":
-                        message_container.info(f"🎯 已选择位置 ({i},{j})")
-                    elif result == "deselected":
-                        message_container.info("❌ 取消选择")
-                    elif result.startswith("success"):
-                        parts = result.split(":")
-                        cleared_count = parts[1]
-                        combo_rounds = parts[2]
-                        message_container.success(f"🎉 成功交换！消除了 {cleared_count} 个泡泡，{combo_rounds} 轮连击！")
-                        # 只有在交换成功时才标记需要刷新
-                        need_full_refresh = True
-                    elif result == "no_match":
-                        message_container.warning("⚠️ 交换失败：没有产生可消除的组合")
-                    elif result == "invalid_match":
-                        message_container.error("❌ 无法交换：交换后不会产生3个以上的连接！")
-                    elif result == "not_adjacent":
-                        message_container.error("❌ 只能与相邻的泡泡交换（上下左右）！")
-    
+    board_panel()
     st.markdown('</div>', unsafe_allow_html=True)  # 关闭bubble-grid
     st.markdown('</div>', unsafe_allow_html=True)  # 关闭game-area
     
-    # 只在必要时才刷新页面
-    if need_full_refresh:
-        time.sleep(0.5)  # 短暂延迟让用户看到消息
-        st.rerun()
-    
-    # 升级动画
-    if st.session_state.level_up_animation:
-        st.markdown(f"""
-        <div class="level-up">
-            <h2>🎊 恭喜升级到 Level {st.session_state.level}! 🎊</h2>
-            <p>你的交换技巧越来越厉害了！</p>
-        </div>
-        """, unsafe_allow_html=True)
-        st.session_state.level_up_animation = False
-    
-    # 显示彩蛋
-    if st.session_state.show_easter_egg:
-        display_enhanced_easter_egg(st.session_state.show_easter_egg)
-        if st.button("继续游戏 💕", key="continue_game"):
-            st.session_state.show_easter_egg = None
-            st.rerun()
+    # 升级动画、彩蛋
+    effects_panel()
     
     # 实时统计
-    show_live_stats()
+    stats_panel()
     
     # 游戏控制
     st.markdown("### 🎮 游戏控制")
-    col1, col2, col3, col4 = st.columns(4)
+    col1, col2, col3, col4, col5 = st.columns(5)
     
     with col1:
         if st.button("🔄 重新开始", key="restart"):
             for key in list(st.session_state.keys()):
-                if key not in ['start_time']:
+                if key not in ['start_time', 'player_token', 'store_version', 'assets_injected', 'asset_bytes']:
                     del st.session_state[key]
+            # 新的一局沿用同一个玩家令牌，覆盖存储中的旧对局
+            save_game(new_engine())
             st.rerun()
     
     with col2:
-        if st.button("🎲 重新排列", key="shuffle"):
-            st.session_state.game_grid = generate_enhanced_grid(7, 6)
-            st.session_state.selected_bubble = None
-            st.rerun()
+        st.button("🎲 重新排列", key="shuffle", on_click=on_shuffle)
     
     with col3:
-        if st.button("❌ 取消选择", key="cancel_selection"):
-            st.session_state.selected_bubble = None
-            message_container.info("❌ 已取消选择")
+        st.button("❌ 取消选择", key="cancel_selection", on_click=on_cancel_selection)
     
     with col4:
         if st.button("📱 分享成绩", key="share"):
-            st.success(f"🎉 我在Love Bubble交换版中得了{st.session_state.score}分！进行了{st.session_state.moves}次交换！")
+            st.success(f"🎉 我在Love Bubble交换版中得了{state.score}分！进行了{state.moves}次交换！")
+    
+    with col5:
+        st.button("💡 提示", key="hint", on_click=on_hint)
+    
+    record_timing("app", time.perf_counter() - started)
 
 if __name__ == "__main__":
-    enhanced_main()
\ No newline at end of file
+    enhanced_main()
@@ -0,0 +1,38 @@
+// 自动滚动到游戏区域的JavaScript函数
+function scrollToGameArea() {
+    setTimeout(function() {
+        const gameArea = document.getElementById('game-area');
+        if (gameArea) {
+            gameArea.scrollIntoView({ behavior: 'smooth', block: 'center' });
+        }
+    }, 100);
+}
+
+// 页面加载完成后检查是否需要滚动；脚本在加载完成之后才注入时立即检查
+function checkScrollToGame() {
+    // 检查URL参数，如果有scroll=game，则滚动到游戏区域
+    const urlParams = new URLSearchParams(window.location.search);
+    if (urlParams.get('scroll') === 'game' || sessionStorage.getItem('scrollToGame') === 'true') {
+        scrollToGameArea();
+        sessionStorage.removeItem('scrollToGame');
+    }
+}
+if (document.readyState === 'complete') {
+    checkScrollToGame();
+} else {
+    window.addEventListener('load', checkScrollToGame);
+}
+
+// 成功反馈函数
+function showSuccessFeedback(message) {
+    const feedback = document.createElement('div');
+    feedback.className = 'success-feedback';
+    feedback.innerHTML = message;
+    document.body.appendChild(feedback);
+
+    setTimeout(function() {
+        if (feedback.parentNode) {
+            feedback.parentNode.removeChild(feedback);
+        }
+    }, 2000);
+}
@@ -0,0 +1,32 @@
+"""批量引擎与单盘面引擎的一致性"""
+import random
+
+import numpy as np
+
+from bubble_batch import BatchEngine
+from bubble_engine import BoardEngine
+from bubble_grid_np import encode_grid
+
+
+def test_large_boards_refill_more_than_one_block():
+    # 200x200 的开局盘面有大量现成组合，第一轮就要补充远超 4096 个泡泡
+    rows = cols = 200
+    batch = BatchEngine(2, rows, cols, seed=11)
+    engines = [BoardEngine(rows, cols, rng=random.Random(11 + i), backend='numpy', track_moves=False)
+               for i in range(2)]
+
+    for _ in range(3):
+        horizontal, _ = batch.legal_moves()
+        swaps = []
+        for i in range(2):
+            row, col = np.argwhere(horizontal[i])[0]
+            swaps.append([row, col, row, col + 1])
+        result = batch.step(swaps)
+        for i, engine in enumerate(engines):
+            row, col = swaps[i][:2]
+            single = engine.swap((int(row), int(col)), (int(row), int(col) + 1))
+            assert single.ok
+            assert result.cleared[i] == single.cleared
+            assert batch.score[i] == engine.state.score
+            assert np.array_equal(batch.codes[i], encode_grid(engine.emoji_grid()))
+    assert batch._block > 4096
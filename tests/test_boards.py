@@ -0,0 +1,44 @@
+"""子进程预生成的盘面池"""
+import time
+
+from bubble_boards import BoardPool
+from bubble_engine import SPECIAL_CHANCE_INITIAL, solvable_board
+from bubble_replay import seeded_engine
+
+KEY = (7, 6, SPECIAL_CHANCE_INITIAL, 3)
+
+
+def wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_prefetched_boards_are_stored_as_bytes_and_match_local_generation():
+    pool = BoardPool(fresh_per_key=0)
+    try:
+        pool.prefetch(KEY, 12345)
+        wait_for(lambda: pool.stats()['boards'] == 1)
+        assert all(isinstance(cells, bytes) for cells in pool._boards.values())
+        assert pool.take(KEY, 12345) == solvable_board(KEY, 12345)
+        assert pool.take(KEY, 12345) == solvable_board(KEY, 12345)
+        assert pool.stats()['hits'] == 1 and pool.stats()['misses'] == 1
+    finally:
+        pool.close()
+
+
+def test_games_with_and_without_the_pool_are_identical():
+    pool = BoardPool(fresh_per_key=4)
+    try:
+        seed = pool.fresh_seed(KEY)
+        pooled = seeded_engine(seed, min_moves=3, boards=pool, powers=True)
+        plain = seeded_engine(seed, min_moves=3, powers=True)
+        for _ in range(5):
+            wait_for(lambda: pool.stats()['queued'] == 0)
+            pooled.shuffle()
+            plain.shuffle()
+            assert pooled.emoji_grid() == plain.emoji_grid()
+        assert pool.stats()['hits'] >= 5
+    finally:
+        pool.close()
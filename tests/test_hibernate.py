@@ -0,0 +1,46 @@
+"""多个进程共用休眠目录"""
+import os
+import socket
+import subprocess
+import sys
+
+import bubble_hibernate
+from bubble_hibernate import SessionCache
+from bubble_replay import seeded_engine
+
+
+def cache_for(base, monkeypatch, name):
+    monkeypatch.setattr(bubble_hibernate, 'process_directory_name', lambda: name)
+    return SessionCache(str(base), max_live=0)
+
+
+def test_processes_only_rehydrate_their_own_snapshots(tmp_path, monkeypatch):
+    first = cache_for(tmp_path, monkeypatch, 'a')
+    second = cache_for(tmp_path, monkeypatch, 'b')
+    engine = seeded_engine(1)
+    first.put('player', engine)
+    assert first.stats()['hibernated'] == 1
+
+    assert second.get('player') is None
+    assert first.get('player').emoji_grid() == engine.emoji_grid()
+    assert first.stats()['rehydrated'] == 1
+
+
+def test_missing_snapshot_counts_as_not_hibernated(tmp_path, monkeypatch):
+    cache = cache_for(tmp_path, monkeypatch, 'a')
+    cache.put('player', seeded_engine(1))
+    os.remove(cache._path('player'))
+    assert cache.get('player') is None
+    assert cache.stats()['hibernated'] == 0
+
+
+def test_directories_of_exited_processes_are_pruned(tmp_path):
+    child = subprocess.Popen([sys.executable, '-c', 'pass'])
+    child.wait()
+    dead = tmp_path / f"{socket.gethostname()}-{child.pid}"
+    dead.mkdir()
+    (dead / 'player.lbs').write_bytes(b'')
+    cache = SessionCache(str(tmp_path))
+    assert not dead.exists()
+    cache.close()
+    assert not os.path.exists(cache.directory)
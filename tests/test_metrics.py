@@ -0,0 +1,40 @@
+"""同一台机器上多个进程打开 Prometheus 导出"""
+import os
+import socket
+
+from bubble_metrics import PrometheusExporter, RollingFileExporter, open_metrics
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_second_process_moves_to_the_next_port():
+    port = free_port()
+    first = open_metrics(f"prometheus://127.0.0.1:{port}")
+    second = open_metrics(f"prometheus://127.0.0.1:{port}")
+    try:
+        assert first.targets() == [f"prometheus://127.0.0.1:{port}"]
+        assert isinstance(second.exporters[0], PrometheusExporter)
+        assert second.exporters[0].port != port
+    finally:
+        first.close()
+        second.close()
+
+
+def test_falls_back_to_a_per_process_file_when_ports_are_taken():
+    port = free_port()
+    first = open_metrics(f"prometheus://127.0.0.1:{port}")
+    second = open_metrics(f"prometheus://127.0.0.1:{port}?ports=1")
+    try:
+        exporter = second.exporters[0]
+        assert isinstance(exporter, RollingFileExporter)
+        assert str(os.getpid()) in exporter.path
+        second.inc('reruns_total')
+    finally:
+        first.close()
+        second.close()
+    assert os.path.exists(exporter.path)
+    os.remove(exporter.path)
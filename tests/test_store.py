@@ -0,0 +1,42 @@
+"""延迟批量写入的出错处理"""
+import time
+
+import pytest
+
+from bubble_store import MemoryStateStore, VersionConflict, WriteBehindStore
+
+
+# 某个令牌的快照写不进去（例如无法序列化）
+class FlakyStore(MemoryStateStore):
+    def save_many(self, items):
+        if any(token == 'bad' for token, *_ in items):
+            raise TypeError("无法序列化")
+        return super().save_many(items)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_writer_survives_unexpected_errors_and_drops_only_the_bad_entry():
+    store = FlakyStore()
+    writer = WriteBehindStore(store, interval=0.01)
+    try:
+        writer.save('good', b'1', 0)
+        writer.save('bad', b'2', 0)
+        wait_for(lambda: writer.dropped == 1 and writer.pending_count() == 0)
+        assert store.load('good') == (1, b'1')
+
+        # 丢弃的写入以版本冲突告知调用方
+        with pytest.raises(VersionConflict):
+            writer.save('bad', b'3', 1)
+
+        # 写入线程仍在运行
+        writer.save('good', b'4', 1)
+        wait_for(lambda: store.load('good') == (2, b'4'))
+        assert writer._thread.is_alive()
+    finally:
+        writer.close()